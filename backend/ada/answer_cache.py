@@ -0,0 +1,246 @@
+import bisect
+import json
+import logging
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from ada.config import (
+    ANSWER_CACHE_BACKEND,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ANSWER_CACHE_NGRAM_RANGE,
+    ANSWER_CACHE_N_FEATURES,
+    ANSWER_CACHE_AGE_BUCKETS,
+)
+from ada.datasources.cache import Cache, CacheBackend, build_cache_backend
+from ada.metrics import CACHE_REQUESTS
+from ada.models import AnswerConfig, QuestionRequest, QuestionResponse
+
+logger = logging.getLogger(__name__)
+
+
+PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(PUNCTUATION.sub(" ", question.lower()).split())
+
+
+def age_bucket(age: int) -> int:
+    return bisect.bisect_right(ANSWER_CACHE_AGE_BUCKETS, age)
+
+
+def _config_key(config: AnswerConfig) -> list:
+    datasources = sorted([ds.engine, ds.max_results] for ds in config.datasources)
+    return [config.max_tokens, config.max_results, config.article_len.value, datasources]
+
+
+class QuestionIndex:
+    """
+    Near-duplicate search over the questions of cached answers.
+
+    Each question is stored as its sparse, hashed character n-gram counts. A lookup weights every
+    question by the current inverse document frequencies and takes their cosine similarity in
+    one vectorized pass over all the stored n-grams. Questions are only compared within the same
+    context (age bucket, experience and config), and the oldest is dropped once 'max_entries' is
+    reached.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        ngram_range: Tuple[int, int] = ANSWER_CACHE_NGRAM_RANGE,
+        n_features: int = ANSWER_CACHE_N_FEATURES,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.ngram_range = ngram_range
+        self.n_features = n_features
+
+        # key -> (context id, added at, n-gram features, n-gram weights), oldest first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._doc_freq = np.zeros(n_features, dtype=np.float32)
+        self._context_ids: Dict[str, int] = {}
+        # Every entry concatenated, rebuilt on the first search after a change
+        self._flat = None
+
+    def _vectorize(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        text = f" {text} "
+        low, high = self.ngram_range
+        hashes = [
+            zlib.crc32(text[i : i + n].encode()) % self.n_features
+            for n in range(low, high + 1)
+            for i in range(len(text) - n + 1)
+        ]
+        features, counts = np.unique(np.array(hashes, dtype=np.int64), return_counts=True)
+        # Sublinear term frequency, so repeated n-grams do not dominate
+        return features, np.log1p(counts).astype(np.float32)
+
+    def add(self, key: str, context: str, question: str, added_at: float = None):
+        self.remove(key)
+        while len(self._entries) >= self.max_entries:
+            self.remove(next(iter(self._entries)))
+
+        features, weights = self._vectorize(question)
+        context_id = self._context_ids.setdefault(context, len(self._context_ids))
+        self._entries[key] = (context_id, added_at or time.time(), features, weights)
+        self._doc_freq[features] += 1
+        self._flat = None
+
+    def remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._doc_freq[entry[2]] -= 1
+        self._flat = None
+
+    def _flatten(self) -> tuple:
+        if self._flat is None:
+            entries = list(self._entries.values())
+            self._flat = (
+                list(self._entries.keys()),
+                np.array([entry[0] for entry in entries], dtype=np.int64),
+                np.array([entry[1] for entry in entries], dtype=np.float64),
+                np.repeat(np.arange(len(entries)), [len(entry[2]) for entry in entries]),
+                np.concatenate([entry[2] for entry in entries]),
+                np.concatenate([entry[3] for entry in entries]),
+            )
+        return self._flat
+
+    def search(self, context: str, question: str) -> Tuple[Optional[str], float]:
+        """
+        Returns the key of the most similar question asked in the same context, with its score
+        """
+        context_id = self._context_ids.get(context)
+        if context_id is None or not self._entries:
+            return None, 0.0
+
+        keys, contexts, added_at, rows, features, weights = self._flatten()
+        candidates = (contexts == context_id) & (added_at > time.time() - self.ttl)
+        if not candidates.any():
+            return None, 0.0
+
+        idf = np.log((1 + len(keys)) / (1 + self._doc_freq)) + 1
+        query_features, query_weights = self._vectorize(question)
+        query = np.zeros(self.n_features, dtype=np.float32)
+        query[query_features] = query_weights * idf[query_features]
+
+        weighted = weights * idf[features]
+        dots = np.bincount(rows, weights=weighted * query[features], minlength=len(keys))
+        norms = np.sqrt(np.bincount(rows, weights=weighted**2, minlength=len(keys)))
+        scores = dots / np.maximum(norms * np.linalg.norm(query), 1e-12)
+        scores[~candidates] = -1
+
+        best = int(np.argmax(scores))
+        return keys[best], float(scores[best])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class AnswerCache(Cache):
+    """
+    Caches the response to a question, keyed on the normalized question, the asker's age bucket
+    and experience, and the AnswerConfig.
+
+    A question that misses the exact key falls back to the most similar question asked in the
+    same context, if it is at least 'similarity_threshold' similar. The index of questions is
+    rebuilt from the keys already in the backend, so a persistent backend keeps finding them after
+    a restart.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        backend: CacheBackend,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ):
+        super().__init__(name=name, backend=backend)
+        self.similarity_threshold = similarity_threshold
+        self.index = QuestionIndex(max_entries=backend.max_entries, ttl=backend.ttl)
+        self.near_hits = 0
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        # Once, when the cache is created, so reading the backend can block
+        for key, stored_at in self.backend.stored():
+            # Keys are written by 'key', so they hold the context and normalized question
+            context, question = json.loads(key)
+            self.index.add(key=key, context=context, question=question, added_at=stored_at)
+        if len(self.index):
+            logger.info(f"Indexed {len(self.index)} questions from the {self.name} cache")
+
+    @staticmethod
+    def context(request: QuestionRequest) -> str:
+        return json.dumps(
+            [
+                age_bucket(request.age),
+                normalize_question(request.experience or ""),
+                _config_key(request.config),
+            ]
+        )
+
+    @classmethod
+    def key(cls, request: QuestionRequest) -> str:
+        return json.dumps([cls.context(request), normalize_question(request.question)])
+
+    def lookup(self, request: QuestionRequest) -> Optional[QuestionResponse]:
+        key = self.key(request)
+        value = self.backend.get(key)
+        result = "hit"
+
+        if value is None and self.similarity_threshold < 1:
+            similar_key, score = self.index.search(
+                context=self.context(request), question=normalize_question(request.question)
+            )
+            if similar_key is not None and score >= self.similarity_threshold:
+                value = self.backend.get(similar_key)
+                if value is None:
+                    # Expired or evicted from the backend
+                    self.index.remove(similar_key)
+                else:
+                    logger.info(
+                        f"Answering '{request.question}' with a similar question ({score:.2f})"
+                    )
+                    result = "near_hit"
+
+        if value is None:
+            self.misses += 1
+            CACHE_REQUESTS.inc(cache=self.name, result="miss")
+            return None
+
+        if result == "hit":
+            self.hits += 1
+        else:
+            self.near_hits += 1
+        CACHE_REQUESTS.inc(cache=self.name, result=result)
+        return QuestionResponse(**value)
+
+    def store(self, request: QuestionRequest, response: QuestionResponse):
+        key = self.key(request)
+        self.set(key, response.model_dump(mode="json"))
+        self.index.add(
+            key=key, context=self.context(request), question=normalize_question(request.question)
+        )
+
+    def stats(self) -> dict:
+        return {**super().stats(), "near_hits": self.near_hits, "indexed": len(self.index)}
+
+
+ANSWER_CACHE = AnswerCache(
+    name="answer",
+    backend=build_cache_backend(
+        backend=ANSWER_CACHE_BACKEND,
+        path=ANSWER_CACHE_PATH,
+        ttl=ANSWER_CACHE_TTL,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ),
+)
@@ -1,21 +1,52 @@
 import logging
 import json
 import logging.config
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
+from ada.answer_cache import ANSWER_CACHE
 from ada.communicator import AsyncCommunicator as Communicator
-from ada.datasources.ds_engines import DatasourceEngines
-from ada.models import QuestionRequest, QuestionResponse, Reference, GPTArticleResponse
-
-from uuid import uuid4
+from ada.config import PRELOAD_DATASOURCES
+from ada.datasources.ds_engines import DATASOURCES
+from ada.datasources.http_client import HTTP_CLIENT
+from ada.openai_client import OPENAI_CLIENT
+from ada.rate_limit import OPENAI_LIMITER, CSE_LIMITER
+from ada.datasources.cache import SEARCH_CACHE, ARTICLE_CACHE, PAPER_CACHE
+from ada.executor import shutdown_executors
+from ada.jobs import JOB_QUEUE, JobQueueFull
+from ada.metrics import REGISTRY, STAGE_DURATION, REQUESTS_IN_FLIGHT, PREFETCHES
+from ada.single_flight import SingleFlight
+from ada.models import (
+    BatchQuestionRequest,
+    JobResponse,
+    QuestionRequest,
+    QuestionResponse,
+)
+from ada.streaming import format_sse
 
 # Setup logger
 logging.config.fileConfig("./ada/logging.conf", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for name in PRELOAD_DATASOURCES:
+        DATASOURCES.resolve(name)
+    await HTTP_CLIENT.start()
+    await OPENAI_CLIENT.start()
+    JOB_QUEUE.start(handler=get_answer)
+    yield
+    await JOB_QUEUE.stop()
+    await OPENAI_CLIENT.close()
+    await HTTP_CLIENT.close()
+    shutdown_executors()
+
+
 # Create an instance of the FastAPI class
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,25 +57,132 @@ app.add_middleware(
 )
 
 
+ASK_FLIGHTS = SingleFlight(name="ask")
+
+
+async def answer(request: QuestionRequest) -> QuestionResponse:
+    communicator = Communicator.from_request(request)
+
+    with REQUESTS_IN_FLIGHT.track(endpoint="ask"), STAGE_DURATION.time(stage="total"):
+        article = await communicator.ask(question=request.question)
+
+    response = QuestionResponse(article=article, references=communicator.get_references())
+    logger.info(response.model_dump_json())
+    ANSWER_CACHE.store(request, response)
+    return response
+
+
+async def get_answer(request: QuestionRequest) -> QuestionResponse:
+    if (response := ANSWER_CACHE.lookup(request)) is not None:
+        return response
+
+    # Identical questions asked while one is being answered wait on that same answer
+    return await ASK_FLIGHTS.do(ANSWER_CACHE.key(request), lambda: answer(request))
+
+
 # Define the 'ask' route
 @app.post("/ask", response_model=QuestionResponse)
 async def ask(request: QuestionRequest) -> QuestionResponse:
-    communicator = Communicator(
-        age=request.age,
-        experience=request.experience,
-        datasources=[ds.engine for ds in request.config.datasources],
-    )
+    return await get_answer(request)
 
-    article = await communicator.ask(question=request.question)
 
-    refs = []
+# Both stay on the event loop (async), since the job queue is not thread safe. Its store runs
+#   on the executor
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(request: QuestionRequest) -> JobResponse:
+    try:
+        return await JOB_QUEUE.submit(request)
+    except JobQueueFull as err:
+        raise HTTPException(status_code=429, detail=err.message, headers={"Retry-After": "30"})
 
-    for ref in communicator.refs_used:
-        refs.append(Reference(name=ref["title"], link=ref["link"], type=ref["type"]))
 
-    response = QuestionResponse(article=article, references=refs)
-    logger.info(response.model_dump_json())
-    return response
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str) -> JobResponse:
+    job = await JOB_QUEUE.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found or expired")
+    return job
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: QuestionRequest) -> StreamingResponse:
+    communicator = Communicator.from_request(request)
+
+    async def events():
+        with REQUESTS_IN_FLIGHT.track(endpoint="ask_stream"), STAGE_DURATION.time(stage="total"):
+            async for event, data in communicator.ask_stream(question=request.question):
+                yield format_sse(event=event, data=data)
+        yield format_sse(event="done", data={})
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+@app.post("/ask/batch")
+async def ask_batch(batch: BatchQuestionRequest) -> StreamingResponse:
+    """
+    Streams one JSON line per question as soon as it is answered, in the order they finish
+    """
+
+    def line(index: int, result) -> str:
+        request = batch.questions[index]
+        entry = {"index": index, "id": str(request.id), "question": request.question}
+        if isinstance(result, Exception):
+            entry["error"] = str(result)
+        else:
+            entry["response"] = result.model_dump(mode="json")
+        return json.dumps(entry) + "\n"
+
+    async def results():
+        with REQUESTS_IN_FLIGHT.track(endpoint="ask_batch"):
+            uncached = {}
+            for index, request in enumerate(batch.questions):
+                if (response := ANSWER_CACHE.lookup(request)) is not None:
+                    yield line(index, response)
+                else:
+                    uncached[len(uncached)] = index
+
+            requests = [batch.questions[index] for index in uncached.values()]
+            async for i, result in Communicator.ask_batch(
+                requests, max_concurrency=batch.max_concurrency
+            ):
+                if not isinstance(result, Exception):
+                    ANSWER_CACHE.store(requests[i], result)
+                yield line(uncached[i], result)
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> str:
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def prefetch_stats() -> dict:
+    stats = {
+        result: PREFETCHES.total(result=result) for result in ("hit", "wait", "miss", "unused")
+    }
+    tool_calls = stats["hit"] + stats["wait"] + stats["miss"]
+    # Tool calls that found their content prefetched, if only by waiting for it to finish
+    stats["hit_rate"] = round((stats["hit"] + stats["wait"]) / tool_calls, 4) if tool_calls else 0.0
+    return stats
+
+
+@app.get("/stats")
+def stats() -> dict:
+    return {
+        "http": HTTP_CLIENT.stats(),
+        "rate_limits": {limiter.name: limiter.stats() for limiter in (OPENAI_LIMITER, CSE_LIMITER)},
+        "search_cache": SEARCH_CACHE.stats(),
+        "article_cache": ARTICLE_CACHE.stats(),
+        "paper_cache": PAPER_CACHE.stats(),
+        "answer_cache": ANSWER_CACHE.stats(),
+        "prefetch": prefetch_stats(),
+        "datasources": {"available": DATASOURCES.names(), "loaded": DATASOURCES.loaded()},
+        "ask_in_flight": len(ASK_FLIGHTS),
+        "job_queue_depth": JOB_QUEUE.depth,
+    }
 
 
 @app.post("/test", response_model=QuestionResponse)
@@ -1,18 +1,50 @@
-from openai import AsyncOpenAI
-from typing import List, Union
+from openai import AsyncOpenAI, RateLimitError
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
 import json
 import pathlib
 import logging
 import pathlib
 import asyncio
-import tiktoken
+import inspect
 import traceback
 
 from ada import DEFAULT_MODEL
+from ada.config import (
+    MAX_CONCURRENT_TOOLS,
+    RETRIEVAL_TOP_K,
+    BATCH_MAX_CONCURRENCY,
+    SEARCH_TIMEOUT,
+    TOOL_CALL_TIMEOUT,
+    PREFETCH_RESOURCES,
+    PREFETCH_CONCURRENCY,
+)
+from ada.context import ContextBudget, TOKENS_PER_MESSAGE
+from ada.executor import run_blocking
+from ada.openai_client import OPENAI_CLIENT
+from ada.prompts import PROMPTS
+from ada.rate_limit import OPENAI_LIMITER, RateLimited, parse_retry_after
+from ada.retrieval import retrieve
+from ada.metrics import (
+    STAGE_DURATION,
+    COMPLETION_DURATION,
+    OPENAI_TOKENS,
+    TOOL_FAILURES,
+    DATASOURCE_SEARCH_FAILURES,
+    PREFETCHES,
+)
+from ada.streaming import SectionStreamParser, TermStreamParser
 from ada.system_messages import BASE_MESSAGE, SEARCH_TERMS, FIX_JSON
-from ada.datasources.ds_engines import DatasourceEngines
+from ada.datasources.ds_engines import DATASOURCES
 from ada.datasources.base import AsyncDatasource, Datasource
-from ada.models import ArticleLength, GPTArticleResponse
+from ada.datasources.shared import SHARED_FETCHES, cancel_fetches
+from ada.models import (
+    ArticleLength,
+    GPTArticleSection,
+    QuestionRequest,
+    QuestionResponse,
+    Reference,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -36,138 +68,559 @@ class AsyncCommunicator:
         experience: str,
         system_template: str = BASE_MESSAGE,
         max_tokens=4_096,
-        datasources: List[DatasourceEngines] = [],
+        datasources: List[Union[str, type]] = [],
         min_resources: int = 3,
         max_resources: int = 5,
         n_search_terms: int = 3,
         article_length: ArticleLength = ArticleLength.LONG,
+        max_concurrent_tools: int = MAX_CONCURRENT_TOOLS,
+        top_k_passages: int = RETRIEVAL_TOP_K,
+        search_timeout: float = SEARCH_TIMEOUT,
+        tool_call_timeout: float = TOOL_CALL_TIMEOUT,
+        prefetch: int = PREFETCH_RESOURCES,
+        max_concurrent_prefetches: int = PREFETCH_CONCURRENCY,
     ):
-        self.client = AsyncOpenAI()
         self.max_tokens = max_tokens
 
         self.system_template = system_template
         self.age = age
         self.experience = experience
-        self.datasources = datasources
+        # Engines are given as classes, or by name, see DATASOURCES
+        self.datasources = [
+            DATASOURCES.resolve(datasource) if isinstance(datasource, str) else datasource
+            for datasource in datasources
+        ]
         self.n_search_terms = n_search_terms
         self.n_datasources = len(datasources)
 
         self.refs_used = []
 
-        # Create system message
-        self.system_message = system_template.format(
-            json_schema=json.dumps(GPTArticleResponse.model_json_schema(), indent=2),
+        # Create system message, rendered (and counted) once per audience, see 'ada.prompts'
+        self.system_message, self.system_message_n_tokens = PROMPTS.render(
+            system_template,
             age=self.age,
             experience=self.experience,
             min_resources=min_resources,
             max_resources=max_resources,
             article_length=article_length.value,
         )
-        self.system_message_n_tokens = self._get_num_tokens(self.system_message)
 
         if self.system_message_n_tokens >= 50_000:
             raise Exception(f"Too many tokens, try reducing pages: {self.system_message_n_tokens}")
 
-        self.messages = [
+        self.context = ContextBudget(max_tokens=self.max_tokens)
+        self.prompt_tokens = None
+
+        self.messages = []
+        self._add_message(
             {"role": "system", "content": self.system_message},
-        ]
+            n_content_tokens=self.system_message_n_tokens,
+        )
 
         self.tools = []
         self.function_mapping = {}
+        self.tool_semaphore = asyncio.Semaphore(max_concurrent_tools)
+
+        # See SEARCH_TIMEOUT, 'search_started' is set when the search phase starts
+        self.search_timeout = search_timeout
+        self.tool_call_timeout = tool_call_timeout
+        self.search_started = None
+
+        # The content of the 'prefetch' likeliest resources, by (tool, resource), see
+        #   '_start_prefetches'
+        self.prefetch = prefetch
+        self.prefetch_semaphore = asyncio.Semaphore(max_concurrent_prefetches)
+        self.prefetches: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.datasource_mapping = {}
+
+        # Tool payloads are cut down to the passages most relevant to these, see 'ada.retrieval'.
+        #   None sends whole documents
+        self.top_k_passages = top_k_passages
+        self.retrieval_queries = []
+
+        # Set while streaming, see 'ask_stream'
+        self.on_event: Callable[[str, dict], None] = None
+        self.n_sections_streamed = 0
+
+    @classmethod
+    def from_request(cls, request: QuestionRequest) -> "AsyncCommunicator":
+        return cls(
+            age=request.age,
+            experience=request.experience,
+            max_tokens=request.config.max_tokens,
+            datasources=[ds.engine for ds in request.config.datasources],
+            prefetch=request.config.prefetch,
+        )
+
+    @classmethod
+    async def ask_batch(
+        cls, requests: List[QuestionRequest], max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> AsyncIterator[Tuple[int, Union[QuestionResponse, Exception]]]:
+        """
+        Answers 'max_concurrency' of the questions at a time, yielding (index, response) as each
+        one finishes, or (index, exception) if it failed.
+
+        Every search, wiki page, article and paper is fetched once for the whole batch, so
+        questions sharing search terms or resources share that work.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        fetches = {}
+
+        async def answer(index: int, request: QuestionRequest):
+            # Each task has its own copy of the context, so this only applies to the batch
+            SHARED_FETCHES.set(fetches)
+            async with semaphore:
+                try:
+                    communicator = cls.from_request(request)
+                    article = await communicator.ask(question=request.question)
+                    references = communicator.get_references()
+                    return index, QuestionResponse(article=article, references=references)
+                except Exception as err:
+                    logger.error(f"Batch question {index} failed: {traceback.format_exc()}")
+                    return index, err
+
+        tasks = [asyncio.create_task(answer(i, request)) for i, request in enumerate(requests)]
+        try:
+            for next_answer in asyncio.as_completed(tasks):
+                yield await next_answer
+        finally:
+            for task in tasks:
+                task.cancel()
+            cancel_fetches(fetches)
+
+    def _emit(self, event: str, data):
+        if self.on_event is not None:
+            self.on_event(event, data)
+
+    def get_references(self) -> List[Reference]:
+        return [
+            Reference(name=ref["title"], link=ref["link"], type=ref["type"])
+            for ref in self.refs_used
+        ]
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        return OPENAI_CLIENT.client
+
+    def _add_message(self, message, n_content_tokens: int = None):
+        self.messages.append(message)
+        self.context.add(message, n_content_tokens=n_content_tokens)
 
     def _add_question(self, question: str):
-        self.messages.append({"role": "user", "content": question})
+        self._add_message({"role": "user", "content": question})
 
-    async def _get_search_terms(self, question: str):
-        response = await self.client.chat.completions.create(
+    async def _request_completion(self, purpose: str, **kwargs):
+        try:
+            # For streamed completions this only times the wait for the first chunk
+            with COMPLETION_DURATION.time(purpose=purpose, model=kwargs["model"]):
+                return await self.client.chat.completions.create(**kwargs)
+        except RateLimitError as err:
+            # Out of credit, rather than over the rate, so retrying would not help
+            if err.code == "insufficient_quota":
+                raise
+            retry_after = parse_retry_after(err.response.headers.get("retry-after"))
+            raise RateLimited(limiter="openai", retry_after=retry_after) from err
+
+    async def _create_completion(self, purpose: str, prompt_tokens: int = None, **kwargs):
+        # Like OpenAI's own limit, a request counts its prompt and its 'max_tokens' up front
+        if prompt_tokens is None:
+            prompt_tokens = sum(
+                self.context._message_cost(message) for message in kwargs["messages"]
+            )
+        tokens = prompt_tokens + (kwargs.get("max_tokens") or 0)
+        response = await OPENAI_LIMITER.run(
+            lambda: self._request_completion(purpose=purpose, **kwargs), tokens=tokens
+        )
+        if getattr(response, "usage", None) is not None:
+            OPENAI_TOKENS.inc(response.usage.prompt_tokens, direction="in", purpose=purpose)
+            OPENAI_TOKENS.inc(response.usage.completion_tokens, direction="out", purpose=purpose)
+        return response
+
+    async def _stream_search_terms(self, question: str) -> AsyncIterator[str]:
+        """
+        Yields each search term as soon as the model has finished writing it, so searching can
+        start before the whole list has been generated
+        """
+        system_message, n_tokens = PROMPTS.render(
+            SEARCH_TERMS, age=self.age, experience=self.experience
+        )
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": question},
+        ]
+        prompt_tokens = n_tokens + self.context.count(question) + 2 * TOKENS_PER_MESSAGE
+        stream = await self._create_completion(
+            purpose="search_terms",
+            prompt_tokens=prompt_tokens,
+            stream=True,
             model=DEFAULT_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": SEARCH_TERMS.format(age=self.age, experience=self.experience),
-                },
-                {"role": "user", "content": question},
-            ],
+            messages=messages,
             response_format={"type": "json_object"},
             max_tokens=50,
         )
-        message = response.choices[0].message.content
-        try:
-            return json.loads(message)["terms"][: self.n_search_terms]
-        except json.JSONDecodeError:
-            return json.loads(await self._fix_json(message))["terms"][: self.n_search_terms]
-
-    async def _set_tools(self, datasources: List[AsyncDatasource]):
-        async_operations = [
-            datasource.search()
-            for datasource in datasources
-            if isinstance(datasource, AsyncDatasource)
-        ]
-
-        await asyncio.gather(*async_operations)
+        parser = TermStreamParser()
+        n_terms = 0
+        # The stream is read to the end (it is at most 50 tokens) so the connection is released
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            for term in parser.feed(chunk.choices[0].delta.content):
+                if n_terms < self.n_search_terms:
+                    n_terms += 1
+                    yield term
+
+        if n_terms == 0 and parser.buffer.strip():
+            try:
+                json.loads(parser.buffer)
+            except json.JSONDecodeError:
+                logger.warning("Search terms JSON Decode Failed; Recalling OpenAI to fix...")
+                response = await self._fix_json(parser.buffer)
+                terms = json.loads(response.choices[0].message.content).get("terms", [])
+                for term in terms[: self.n_search_terms]:
+                    yield term
+
+        # Streamed responses carry no usage, so estimate it
+        OPENAI_TOKENS.inc(prompt_tokens, direction="in", purpose="search_terms")
+        OPENAI_TOKENS.inc(
+            self.context.count(parser.buffer), direction="out", purpose="search_terms"
+        )
 
+    def _time_left(self, datasource=None) -> float:
+        """
+        Seconds left of the search phase, or of 'datasource's own search deadline if that is sooner
+        """
+        loop = asyncio.get_running_loop()
+        if self.search_started is None:
+            self.search_started = loop.time()
+        timeout = self.search_timeout
+        if datasource is not None:
+            timeout = min(timeout, datasource.search_timeout)
+        return max(self.search_started + timeout - loop.time(), 0)
+
+    async def _search_datasource(self, datasource: AsyncDatasource, search_terms: List[str] = None):
+        """
+        Runs one datasource's search until its deadline. Whatever it found by then is kept, the
+        rest is cancelled, and a failure only costs this datasource its results
+        """
+        if search_terms is None:
+            search = datasource.search()
+        else:
+            search = datasource.add_search_terms(search_terms)
+        try:
+            await asyncio.wait_for(search, timeout=self._time_left(datasource))
+        except asyncio.TimeoutError:
+            DATASOURCE_SEARCH_FAILURES.inc(datasource=datasource.name, reason="timeout")
+            logger.warning(
+                f"{datasource.name} search timed out, keeping the {len(datasource.results)} "
+                "results found in time"
+            )
+        except Exception as err:
+            DATASOURCE_SEARCH_FAILURES.inc(datasource=datasource.name, reason="error")
+            logger.error(f"{datasource.name} search failed: \n {traceback.format_exc()}")
+
+    async def _search(self, datasources: list, search_terms: List[str] = None):
+        """
+        Runs the async datasources' searches, either on the terms they were created with, or
+        adding 'search_terms' to what has already been searched
+        """
+        operations = []
+        for datasource in datasources:
+            if not isinstance(datasource, AsyncDatasource):
+                if search_terms is not None:
+                    datasource.search_terms.extend(search_terms)
+            else:
+                operations.append(self._search_datasource(datasource, search_terms=search_terms))
+        await asyncio.gather(*operations)
+
+    async def _set_tools(self, datasources: list):
         for datasource in filter(lambda d: isinstance(d, AsyncDatasource), datasources):
             try:
                 self.tools.append(datasource.tool_spec)
                 self.function_mapping[datasource.name] = datasource.get_content
+                self.datasource_mapping[datasource.name] = datasource
             except Exception as err:
                 logger.error(f"Tool {datasource.name} not added: \n {traceback.format_exc()}")
 
         for datasource in filter(lambda d: isinstance(d, Datasource), datasources):
             try:
-                datasource.search()
+                # The thread can not be cancelled, but the tools no longer wait on it
+                await asyncio.wait_for(
+                    run_blocking(datasource.search), timeout=self._time_left(datasource)
+                )
                 self.tools.append(datasource.tool_spec)
                 self.function_mapping[datasource.name] = datasource.get_content
+                self.datasource_mapping[datasource.name] = datasource
+            except asyncio.TimeoutError:
+                DATASOURCE_SEARCH_FAILURES.inc(datasource=datasource.name, reason="timeout")
+                logger.warning(f"Tool {datasource.name} not added, its search timed out")
             except Exception as err:
                 logger.error(f"Tool {datasource.name} not added: \n {traceback.format_exc()}")
 
-    def _get_num_tokens(self, text):
-        encoder = tiktoken.encoding_for_model("gpt-4")
-        return len(encoder.encode(text))
+    async def _search_speculatively(self, question: str, datasources: list):
+        """
+        Starts searching with the question straight away, then searches each generated term as
+        soon as it arrives, instead of waiting for the full list of terms
+        """
+        self.search_started = asyncio.get_running_loop().time()
+        searches = [asyncio.create_task(self._search(datasources=datasources))]
+        terms = []
+
+        async def search_terms():
+            async for term in self._stream_search_terms(question=question):
+                terms.append(term)
+                searches.append(
+                    asyncio.create_task(self._search(datasources=datasources, search_terms=[term]))
+                )
 
-    def _call_tool(self, tool_name, **kwargs):
         try:
-            content = self.function_mapping[tool_name](**kwargs)
-            content["ref_type"] = tool_name
-            self.refs_used.append(content)
-            return json.dumps(content)
-        except Exception as err:
-            logger.error(f"Tool {tool_name} failed: {traceback.format_exc()}")
-            return json.dumps(
-                {
-                    "tool_name": tool_name,
+            with STAGE_DURATION.time(stage="search_terms"):
+                try:
+                    await asyncio.wait_for(search_terms(), timeout=self._time_left())
+                except asyncio.TimeoutError:
+                    logger.warning(f"Search terms timed out, searching the {len(terms)} found")
+                except Exception:
+                    # The searches for the question (and any terms found) go on without the rest
+                    logger.error(
+                        f"Search terms failed, searching the {len(terms)} found: "
+                        f"{traceback.format_exc()}"
+                    )
+            logger.info(f"Search terms: {terms}")
+            self.retrieval_queries = [question] + terms
+            self._emit("search_terms", {"terms": list(terms)})
+            await asyncio.gather(*searches)
+        except BaseException:
+            for search in searches:
+                search.cancel()
+            raise
+
+    def _get_num_tokens(self, text):
+        return PROMPTS.count(text)
+
+    async def _get_content(self, tool_name: str, **kwargs) -> dict:
+        func = self.function_mapping[tool_name]
+        if inspect.iscoroutinefunction(func):
+            return await func(**kwargs)
+        return await run_blocking(func, **kwargs)
+
+    async def _prefetch(self, tool_name: str, resource: str) -> dict:
+        async with self.prefetch_semaphore:
+            return await self._get_content(tool_name, resource=resource)
+
+    def _start_prefetches(self):
+        """
+        Starts fetching the content of the 'prefetch' resources most likely to be asked for, so
+        the first tool calls find it ready. Each datasource's resources are ranked by
+        'rank_resources', and weighted by its 'prefetch_weight' against the other datasources'
+        """
+        candidates = []
+        for name, datasource in self.datasource_mapping.items():
+            if datasource.prefetch_weight <= 0:
+                continue
+            for position, resource in enumerate(datasource.rank_resources()[: self.prefetch]):
+                candidates.append((datasource.prefetch_weight / (position + 1), name, resource))
+
+        for _, name, resource in sorted(candidates, key=lambda c: -c[0])[: self.prefetch]:
+            self.prefetches[(name, resource)] = asyncio.create_task(
+                self._prefetch(tool_name=name, resource=resource)
+            )
+        if self.prefetches:
+            logger.info(f"Prefetching {list(self.prefetches)}")
+
+    def _take_prefetch(self, tool_name: str, resource: str) -> Optional[asyncio.Task]:
+        """
+        Returns the prefetch of 'resource' if there is a usable one, counting hits and misses
+        """
+        datasource = self.datasource_mapping.get(tool_name)
+        if not self.prefetch or datasource is None or datasource.prefetch_weight <= 0:
+            return None
+        try:
+            name, _ = datasource.index.get(resource)
+        except Exception:
+            # Not a resource it offers, which getting the content reports
+            return None
+
+        task = self.prefetches.pop((tool_name, name), None)
+        # A failed prefetch is fetched again, it may have been a transient error
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            PREFETCHES.inc(datasource=tool_name, result="miss")
+            return None
+        PREFETCHES.inc(datasource=tool_name, result="hit" if task.done() else "wait")
+        return task
+
+    def _cancel_prefetches(self):
+        for (tool_name, _), task in self.prefetches.items():
+            PREFETCHES.inc(datasource=tool_name, result="unused")
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # Retrieve the exception, since nothing else will
+                task.exception()
+        self.prefetches = {}
+
+    async def _call_tool(self, tool_name, **kwargs):
+        async with self.tool_semaphore:
+            try:
+                content = self._take_prefetch(tool_name, kwargs.get("resource"))
+                if content is None:
+                    content = self._get_content(tool_name, **kwargs)
+                content = await asyncio.wait_for(content, timeout=self.tool_call_timeout)
+                content["ref_type"] = tool_name
+                if self.top_k_passages is not None:
+                    content = await run_blocking(
+                        retrieve, content, queries=self.retrieval_queries, top_k=self.top_k_passages
+                    )
+                return content
+            except asyncio.TimeoutError:
+                TOOL_FAILURES.inc(tool=tool_name)
+                logger.warning(f"Tool {tool_name} timed out after {self.tool_call_timeout}s")
+                return None
+            except Exception as err:
+                TOOL_FAILURES.inc(tool=tool_name)
+                logger.error(f"Tool {tool_name} failed: {traceback.format_exc()}")
+                return None
+
+    async def _call_tools(self, tool_calls):
+        calls = []
+        for tool_call in tool_calls:
+            func_args = json.loads(tool_call.function.arguments)
+            tool_name = tool_call.function.name
+            logger.info(f"Calling {tool_name} with {func_args}")
+            self._emit("tool_call", {"tool": tool_name, "arguments": func_args})
+            calls.append(self._call_tool(tool_name=tool_name, **func_args))
+
+        # Tools run concurrently, but results are recorded in the order the model asked for them
+        #   so reference indices and tool messages stay deterministic
+        contents = await asyncio.gather(*calls)
+
+        for i, (tool_call, content) in enumerate(zip(tool_calls, contents)):
+            fingerprint = None if content is None else self.context.fingerprint(content)
+            if content is None:
+                content = {
+                    "tool_name": tool_call.function.name,
                     "content": "Failed to execute. Please use a different tool or resource",
                 }
-            )
+            elif (ref_index := self.context.find_duplicate(fingerprint)) is not None:
+                content = {
+                    "tool_name": tool_call.function.name,
+                    "content": f"Already provided as reference {ref_index}. Please use that reference",
+                }
+            else:
+                content = self.context.fit(content, n_tools_left=len(tool_calls) - i)
+                self.context.remember(fingerprint, ref_index=len(self.refs_used))
+                self.refs_used.append(content)
+            tool_message = {
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "name": tool_call.function.name,
+                "content": json.dumps(content),
+            }
+            self._add_message(tool_message)
+
+    def _refs_index(self) -> str:
+        # The content of each reference is already in its tool message, so only the index is resent
+        return json.dumps(
+            [
+                {
+                    "index": i,
+                    "title": ref.get("title"),
+                    "type": ref.get("type"),
+                    "link": ref.get("link"),
+                }
+                for i, ref in enumerate(self.refs_used)
+            ],
+            indent=2,
+        )
+
+    def _emit_section(self, section: dict):
+        try:
+            section = GPTArticleSection(**section)
+        except Exception as err:
+            logger.warning(f"Streamed section is not valid: {section}")
+            return
+        self.n_sections_streamed += 1
+        self._emit("section", section.model_dump())
+
+    async def _stream_completion(self, **kwargs) -> ChatCompletionMessage:
+        """
+        Streams an article completion, emitting each section as soon as it is complete, and
+        returns the same message a non-streamed completion would have
+        """
+        stream = await self._create_completion(
+            purpose="article_stream", prompt_tokens=self.context.used, stream=True, **kwargs
+        )
+        parser = SectionStreamParser()
+        content = []
+        tool_calls = {}
+
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+
+            for tool_call_delta in delta.tool_calls or []:
+                tool_call = tool_calls.setdefault(
+                    tool_call_delta.index, {"id": None, "name": "", "arguments": ""}
+                )
+                if tool_call_delta.id:
+                    tool_call["id"] = tool_call_delta.id
+                if tool_call_delta.function is not None:
+                    tool_call["name"] += tool_call_delta.function.name or ""
+                    tool_call["arguments"] += tool_call_delta.function.arguments or ""
+
+            if delta.content:
+                content.append(delta.content)
+                # A turn that calls tools is not the final article
+                if not tool_calls:
+                    for section in parser.feed(delta.content):
+                        self._emit_section(section)
+
+        message = ChatCompletionMessage(
+            role="assistant",
+            content="".join(content) or None,
+            tool_calls=[
+                ChatCompletionMessageToolCall(
+                    id=tool_call["id"],
+                    type="function",
+                    function={"name": tool_call["name"], "arguments": tool_call["arguments"]},
+                )
+                for _, tool_call in sorted(tool_calls.items())
+            ]
+            or None,
+        )
+
+        # Streamed responses carry no usage, so estimate it
+        OPENAI_TOKENS.inc(self.context.used, direction="in", purpose="article_stream")
+        OPENAI_TOKENS.inc(
+            self.context._message_cost(message), direction="out", purpose="article_stream"
+        )
+        return message
 
     async def _call_openai(self):
-        self.messages.append({"role": "user", "content": json.dumps(self.refs_used, indent=2)})
-        response = await self.client.chat.completions.create(
+        self._add_message({"role": "user", "content": self._refs_index()})
+        kwargs = dict(
             model=DEFAULT_MODEL,
             messages=self.messages,
             max_tokens=self.max_tokens,
             tools=self.tools,
-            tool_choice="auto",
+            # Once the budget is spent, the model has to answer with what it already has
+            tool_choice="auto" if self.context.can_call_tools() else "none",
             response_format={"type": "json_object"},
         )
-        response_message = response.choices[0].message
+        if self.on_event is not None:
+            response_message = await self._stream_completion(**kwargs)
+            self.prompt_tokens = self.context.used
+        else:
+            response = await self._create_completion(
+                purpose="article", prompt_tokens=self.context.used, **kwargs
+            )
+            self.prompt_tokens = response.usage.prompt_tokens
+            response_message = response.choices[0].message
         tool_calls = response_message.tool_calls
 
-        self.messages.append(response_message)
+        self._add_message(response_message)
 
         if tool_calls:
-            for tool_call in tool_calls:
-                func_args = json.loads(tool_call.function.arguments)
-                tool_name = tool_call.function.name
-                logger.info(f"Calling {tool_name} with {func_args}")
-                content = self._call_tool(tool_name=tool_name, **func_args)
-                tool_message = {
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "name": tool_call.function.name,
-                    "content": content,
-                }
-                self.messages.append(tool_message)
+            await self._call_tools(tool_calls)
             await self._call_openai()
 
     def _export_results(self, question, export_path: Union[pathlib.Path, str]):
@@ -183,15 +636,11 @@ class AsyncCommunicator:
         (export_path / question.lower().replace(" ", "-")).write_text(md)
 
     async def _fix_json(self, json_string: str):
-        return await self.client.chat.completions.create(
+        return await self._create_completion(
+            purpose="fix_json",
             model="gpt-3.5-turbo-1106",
             messages=[
-                {
-                    "role": "system",
-                    "content": FIX_JSON.format(
-                        json_schema=json.dumps(GPTArticleResponse.model_json_schema(), indent=2)
-                    ),
-                },
+                {"role": "system", "content": PROMPTS.render(FIX_JSON)[0]},
                 {"role": "user", "content": json_string},
             ],
             max_tokens=self.max_tokens,
@@ -212,22 +661,73 @@ class AsyncCommunicator:
             logger.warning("JSON Decode Failed; Recalling OpenAI to fix...")
             response = await self._fix_json(content)
             self.messages[-1].content = response.choices[0].message.content
-            return self._verify_results()
+            return await self._verify_results()
 
     async def ask(self, question: str, export_path: Union[pathlib.Path, str] = None):
         logger.info(f"Question asked: {question}")
         self._add_question(question=question)
-        terms = await self._get_search_terms(question=question)
-        logger.info(f"Search terms: {terms}")
-        # Search with the question as well
-        terms.append(question)
         logger.info("Setting up tools")
-        datasources = [datasource(search_terms=terms) for datasource in self.datasources]
-        await self._set_tools(datasources=datasources)
+        datasources = [datasource(search_terms=[question]) for datasource in self.datasources]
+        with STAGE_DURATION.time(stage="search"):
+            await self._search_speculatively(question=question, datasources=datasources)
+            await self._set_tools(datasources=datasources)
+        self.context.set_tools(self.tools)
         logger.info("Tools:" + json.dumps(self.tools, indent=4))
-        await self._call_openai()
+        for tool in self.tools:
+            self._emit(
+                "sources",
+                {
+                    "datasource": tool["function"]["name"],
+                    "resources": tool["function"]["parameters"]["properties"]["resource"]["enum"],
+                },
+            )
+        if self.prefetch:
+            self._start_prefetches()
+        try:
+            with STAGE_DURATION.time(stage="article"):
+                await self._call_openai()
+        finally:
+            self._cancel_prefetches()
+        logger.info(
+            f"Final prompt size: {self.prompt_tokens} tokens "
+            f"(estimated {self.context.used} of {self.context.budget} budget)"
+        )
 
         if export_path:
             self._export_results(question=question, export_path=export_path)
 
-        return await self._verify_results()
+        with STAGE_DURATION.time(stage="verify"):
+            return await self._verify_results()
+
+    async def ask_stream(self, question: str) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Answers the question like 'ask', but yields (event, data) pairs as it goes:
+        'search_terms', 'sources', 'tool_call', each 'section' of the article as soon as it is
+        generated, and finally the 'references'
+        """
+        queue = asyncio.Queue()
+        self.on_event = lambda event, data: queue.put_nowait((event, data))
+
+        async def run():
+            try:
+                article = await self.ask(question=question)
+                # Anything the stream could not parse (i.e. the JSON had to be repaired) is sent now
+                for section in article["sections"][self.n_sections_streamed :]:
+                    self._emit_section(section)
+                self._emit(
+                    "references", [ref.model_dump(mode="json") for ref in self.get_references()]
+                )
+            except Exception as err:
+                logger.error(f"Streamed answer failed: {traceback.format_exc()}")
+                self._emit("error", {"message": str(err)})
+            finally:
+                queue.put_nowait(None)
+
+        task = asyncio.create_task(run())
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        finally:
+            # i.e. the client disconnected
+            if not task.done():
+                task.cancel()
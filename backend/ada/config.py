@@ -1 +1,154 @@
+import os
+
 MAX_TOKENS = 2_048
+
+# External APIs and the local caches can be pointed elsewhere, i.e. at the load test's stand-ins
+#   (see 'loadtest'). OpenAI's client reads OPENAI_BASE_URL itself
+CACHE_DIR = os.environ.get("ADA_CACHE_DIR", "./.cache")
+
+# Datasource engines are imported when first used. These (comma separated, i.e. "General,Wiki")
+#   are imported at startup instead, so the first request using them does not wait on it
+PRELOAD_DATASOURCES = [
+    name.strip()
+    for name in os.environ.get("ADA_PRELOAD_DATASOURCES", "").split(",")
+    if name.strip()
+]
+
+# Tool calls
+MAX_TOOL_WORKERS = 16
+MAX_PROCESS_WORKERS = 2
+MAX_CONCURRENT_TOOLS = 4
+
+# Deadlines, in seconds. Tools are built from whatever the datasources found before the search
+#   deadline (the whole search phase, search terms included) or their own one, whichever comes
+#   first. A tool call past its deadline is answered as failed, so the model picks another resource
+SEARCH_TIMEOUT = 20
+DATASOURCE_SEARCH_TIMEOUT = 12
+TOOL_CALL_TIMEOUT = 15
+
+# Prefetching (opt in, see AnswerConfig.prefetch): once the tools are set, the content of the
+#   PREFETCH_RESOURCES most likely resources is fetched in the background, PREFETCH_CONCURRENCY at
+#   a time, while the model decides which ones it wants
+PREFETCH_RESOURCES = 0
+PREFETCH_CONCURRENCY = 3
+
+# Resource names from tool calls that match no name exactly (even ignoring case and punctuation)
+#   are matched to the most similar one, if their character trigrams are at least this similar
+RESOURCE_MATCH_CUTOFF = 0.6
+
+# Wikipedia, through its API ("online") or from a local index built from an extract ("offline",
+#   see 'ada.datasources.wiki_offline')
+WIKI_BACKEND = os.environ.get("ADA_WIKI_BACKEND", "online")
+WIKI_OFFLINE_PATH = os.environ.get("ADA_WIKI_OFFLINE_PATH", f"{CACHE_DIR}/wiki")
+WIKI_API_URL = os.environ.get("ADA_WIKI_API_URL", "https://en.wikipedia.org/w/api.php")
+WIKI_PAGE_URL = "https://en.wikipedia.org/wiki/"
+WIKI_USER_AGENT = "ada (https://github.com/rmikulec/ada)"
+
+# Outbound HTTP (shared by every datasource)
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 10
+HTTP_DNS_CACHE_TTL = 300
+HTTP_KEEPALIVE_TIMEOUT = 30
+HTTP_TOTAL_TIMEOUT = 30
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36"
+
+# OpenAI, one pooled client shared by every request (HTTP/2 if 'h2' is installed)
+OPENAI_MAX_CONNECTIONS = 100
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 20
+OPENAI_KEEPALIVE_TIMEOUT = 30
+# Retries of timeouts, connection and server errors by the client itself. Rate limited responses
+#   are retried by the rate limiter instead (see RATE_LIMIT_MAX_RETRIES)
+OPENAI_MAX_RETRIES = 2
+
+# Rendered system messages kept, by template and (age, experience, length, ...)
+PROMPT_CACHE_MAX_ENTRIES = 1_024
+
+# Google Custom Search
+GOOGLE_SEARCH_URL = os.environ.get(
+    "ADA_GOOGLE_SEARCH_URL", "https://www.googleapis.com/customsearch/v1"
+)
+
+# arXiv
+ARXIV_PDF_URL = os.environ.get("ADA_ARXIV_PDF_URL", "https://arxiv.org/pdf/{paper_id}")
+ARXIV_MAX_PAGES = 30
+ARXIV_MAX_PDF_BYTES = 50 * 1024 * 1024
+
+# Client side rate limits, shared by every request in the worker. Rate limited responses (429)
+#   are retried with jittered exponential backoff, at most RATE_LIMIT_MAX_RETRIES times
+OPENAI_REQUESTS_PER_SECOND = float(os.environ.get("ADA_OPENAI_REQUESTS_PER_SECOND", 8))
+OPENAI_TOKENS_PER_MINUTE = float(os.environ.get("ADA_OPENAI_TOKENS_PER_MINUTE", 800_000))
+CSE_QUERIES_PER_SECOND = float(os.environ.get("ADA_CSE_QUERIES_PER_SECOND", 10))
+RATE_LIMIT_MAX_RETRIES = 5
+RATE_LIMIT_BACKOFF_BASE = 0.5
+RATE_LIMIT_BACKOFF_MAX = 30
+
+# Once a SQLite cache is over its entries or bytes, this fraction of it is evicted at once, so
+#   eviction runs once in a while instead of on every write
+CACHE_EVICT_FRACTION = 0.1
+# A SQLite cache writes down when its hits were accessed in batches, once this many are pending
+#   or this many seconds passed, so a hit does not take the write lock
+CACHE_TOUCH_BATCH = 100
+CACHE_TOUCH_INTERVAL = 30
+
+# Google Custom Search result cache ("memory" or "sqlite")
+SEARCH_CACHE_BACKEND = "memory"
+SEARCH_CACHE_TTL = 60 * 60 * 24
+SEARCH_CACHE_MAX_ENTRIES = 10_000
+SEARCH_CACHE_PATH = f"{CACHE_DIR}/search.sqlite"
+
+# Parsed article cache for GeneralSearch ("memory" or "sqlite")
+ARTICLE_CACHE_BACKEND = "sqlite"
+ARTICLE_CACHE_TTL = 60 * 60 * 24 * 7
+ARTICLE_CACHE_MAX_ENTRIES = 50_000
+ARTICLE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+ARTICLE_CACHE_PATH = f"{CACHE_DIR}/articles.sqlite"
+
+# Extracted arXiv paper text, keyed by arXiv id/version ("memory" or "sqlite")
+PAPER_CACHE_BACKEND = "sqlite"
+PAPER_CACHE_TTL = 60 * 60 * 24 * 30
+PAPER_CACHE_MAX_ENTRIES = 10_000
+PAPER_CACHE_MAX_BYTES = 512 * 1024 * 1024
+PAPER_CACHE_PATH = f"{CACHE_DIR}/papers.sqlite"
+
+# Prompt budget
+MODEL_CONTEXT_WINDOW = 128_000
+MAX_PROMPT_TOKENS = 32_000
+MAX_TOOL_MESSAGE_TOKENS = 6_000
+MIN_TOOL_MESSAGE_TOKENS = 500
+
+# Answers to /ask, reused for the same or a near-duplicate question ("memory" or "sqlite")
+ANSWER_CACHE_BACKEND = "memory"
+# A TTL of 0 turns the answer cache off
+ANSWER_CACHE_TTL = float(os.environ.get("ADA_ANSWER_CACHE_TTL", 60 * 60 * 24))
+ANSWER_CACHE_MAX_ENTRIES = 2_000
+ANSWER_CACHE_PATH = f"{CACHE_DIR}/answers.sqlite"
+# Cosine similarity of the questions' character n-gram TF-IDF vectors needed to reuse an answer
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.75
+ANSWER_CACHE_NGRAM_RANGE = (3, 5)
+ANSWER_CACHE_N_FEATURES = 2**12
+# Lower bounds of the age groups that share answers
+ANSWER_CACHE_AGE_BUCKETS = (6, 10, 13, 18, 26, 65)
+
+# Passage retrieval: long tool payloads are cut into overlapping passages of PASSAGE_WORDS words,
+#   and only the RETRIEVAL_TOP_K most relevant (BM25) are sent to the model
+PASSAGE_WORDS = 120
+PASSAGE_OVERLAP = 30
+RETRIEVAL_TOP_K = 6
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# /ask/batch: questions answered at once, and the most one batch can ask
+BATCH_MAX_CONCURRENCY = 4
+BATCH_MAX_QUESTIONS = 500
+
+# Job mode (POST /jobs): answered in the background by JOB_WORKERS workers, refusing new jobs
+#   once JOB_MAX_QUEUE are waiting. Finished jobs are kept for JOB_RESULT_TTL
+JOB_WORKERS = 4
+JOB_MAX_QUEUE = 100
+JOB_RESULT_TTL = 60 * 60 * 24
+JOB_CLEANUP_INTERVAL = 60 * 10
+JOB_STORE_PATH = f"{CACHE_DIR}/jobs.sqlite"
+# Workers sharing the store each lease the jobs they run, renewing the lease every third of
+#   JOB_LEASE_TTL. A running job whose lease expired (i.e. its worker died) is taken over
+JOB_LEASE_TTL = 60
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+from typing import List, Optional
+
+import tiktoken
+
+from ada import DEFAULT_MODEL
+from ada.config import (
+    MODEL_CONTEXT_WINDOW,
+    MAX_PROMPT_TOKENS,
+    MAX_TOOL_MESSAGE_TOKENS,
+    MIN_TOOL_MESSAGE_TOKENS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Every message costs a few tokens on top of its content for the role and separators
+TOKENS_PER_MESSAGE = 4
+TRUNCATED = "... [truncated]"
+
+
+class ContextBudget:
+    """
+    Keeps track of how many prompt tokens a conversation costs, so tool payloads can be
+    deduplicated and trimmed to fit the budget instead of growing the prompt every tool round.
+
+    The budget is whatever is left of the model's context window after reserving the completion's
+    'max_tokens', capped at MAX_PROMPT_TOKENS.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        model: str = DEFAULT_MODEL,
+        context_window: int = MODEL_CONTEXT_WINDOW,
+        max_prompt_tokens: int = MAX_PROMPT_TOKENS,
+        max_tool_message_tokens: int = MAX_TOOL_MESSAGE_TOKENS,
+    ):
+        self.encoder = tiktoken.encoding_for_model(model)
+        self.budget = min(context_window - max_tokens, max_prompt_tokens)
+        self.max_tool_message_tokens = max_tool_message_tokens
+
+        self.message_tokens = []
+        self.tools_tokens = 0
+        self._seen = {}
+
+    def count(self, text: str) -> int:
+        return len(self.encoder.encode(text))
+
+    def _message_cost(self, message) -> int:
+        if isinstance(message, dict):
+            content = message.get("content")
+            tool_calls = message.get("tool_calls")
+        else:
+            content = message.content
+            tool_calls = message.tool_calls
+
+        n_tokens = TOKENS_PER_MESSAGE + self.count(content or "")
+        for tool_call in tool_calls or []:
+            n_tokens += self.count(tool_call.function.name + tool_call.function.arguments)
+        return n_tokens
+
+    def add(self, message, n_content_tokens: int = None) -> int:
+        """
+        'n_content_tokens' skips counting the content again, if it is already known
+        """
+        if n_content_tokens is None:
+            n_tokens = self._message_cost(message)
+        else:
+            n_tokens = TOKENS_PER_MESSAGE + n_content_tokens
+        self.message_tokens.append(n_tokens)
+        return n_tokens
+
+    def set_tools(self, tools: List[dict]):
+        self.tools_tokens = self.count(json.dumps(tools))
+
+    @property
+    def used(self) -> int:
+        return sum(self.message_tokens) + self.tools_tokens
+
+    def remaining(self) -> int:
+        return max(self.budget - self.used, 0)
+
+    def can_call_tools(self) -> bool:
+        return self.remaining() >= MIN_TOOL_MESSAGE_TOKENS
+
+    @staticmethod
+    def fingerprint(content: dict) -> str:
+        """
+        Identifies a tool payload as fetched, so take it before 'fit' trims it: the same
+        resource fetched again must match
+        """
+        # Images have no text, so fall back on the link
+        key = content.get("text") or content.get("link") or content
+        return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def find_duplicate(self, fingerprint: str) -> Optional[int]:
+        return self._seen.get(fingerprint)
+
+    def remember(self, fingerprint: str, ref_index: int):
+        self._seen[fingerprint] = ref_index
+
+    def _truncate(self, text: str, n_tokens: int) -> str:
+        tokens = self.encoder.encode(text)
+        if len(tokens) <= n_tokens:
+            return text
+        return self.encoder.decode(tokens[: max(n_tokens, 0)]) + TRUNCATED
+
+    def fit(self, content: dict, n_tools_left: int = 1) -> dict:
+        """
+        Trims the 'text' of a tool payload so it fits its share of the remaining budget
+        """
+        max_tokens = min(self.max_tool_message_tokens, self.remaining() // max(n_tools_left, 1))
+        if self.count(json.dumps(content)) <= max_tokens or "text" not in content:
+            return content
+
+        text = content["text"]
+        overhead = self.count(json.dumps({**content, "text": ""}))
+        text_budget = max_tokens - overhead
+
+        if isinstance(text, dict):
+            # i.e. PDF pages: keep whole pages in order, truncating the page that crosses the budget
+            fitted = {}
+            for page, page_text in text.items():
+                if text_budget <= 0:
+                    break
+                page_tokens = self.count(page_text)
+                fitted[page] = self._truncate(page_text, text_budget)
+                text_budget -= page_tokens
+        elif isinstance(text, list):
+            # i.e. retrieved passages: keep whole passages, truncating the one that crosses the budget
+            fitted = []
+            for passage in text:
+                if text_budget <= 0:
+                    break
+                passage_tokens = self.count(passage["text"])
+                fitted.append({**passage, "text": self._truncate(passage["text"], text_budget)})
+                text_budget -= passage_tokens
+        else:
+            fitted = self._truncate(text, text_budget)
+
+        logger.info(f"Trimmed tool payload '{content.get('title')}' to ~{max_tokens} tokens")
+        return {**content, "text": fitted}
@@ -1,17 +1,34 @@
 import arxiv
-import pathlib
+import io
+import itertools
 import logging
 from PyPDF2 import PdfReader
 
-from tempfile import TemporaryDirectory
-from typing import List
+from typing import Dict, List
 
+from ada.config import ARXIV_PDF_URL, ARXIV_MAX_PAGES, ARXIV_MAX_PDF_BYTES
 from ada.datasources.base import AsyncWebSource
+from ada.datasources.cache import PAPER_CACHE
+from ada.datasources.http_client import HTTP_CLIENT
 from ada.datasources.search_engines import SearchEngines
 from ada.datasources.references import ReferenceType
+from ada.executor import run_in_process
+from ada.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# One download (and extraction) per paper at a time across every request. Its task outlives the
+#   tool call that started it, so a paper that takes longer than the tool's deadline is still
+#   cached for the next one
+PAPER_DOWNLOADS = SingleFlight(name="paper")
+
+
+# Module level so it can be pickled and sent to the process pool
+def extract_pdf_text(pdf: bytes, max_pages: int) -> Dict[int, str]:
+    reader = PdfReader(io.BytesIO(pdf))
+    pages = itertools.islice(reader.pages, max_pages)
+    return {i: page.extract_text() for i, page in enumerate(pages)}
+
 
 class ArxivSearch(AsyncWebSource):
     def __init__(
@@ -29,41 +46,50 @@ class ArxivSearch(AsyncWebSource):
             engine=SearchEngines.ARXIVE,
         )
         self.sort_criterion = criterion
-        self.papers = {}
 
-    def _read_pdf(self, paper: arxiv.Result):
-        with TemporaryDirectory() as temp_dir:
-            temp_path = pathlib.Path(temp_dir, "paper.pdf")
-            paper.download_pdf(dirpath=temp_dir, filename="paper.pdf")
+    async def _read_pdf(self, paper_id: str, link: str) -> Dict[int, str]:
+        text = await PAPER_CACHE.get_async(paper_id)
+        if text is None:
+            return await PAPER_DOWNLOADS.do(
+                paper_id, lambda: self._download_pdf(paper_id=paper_id, link=link)
+            )
+        # Cached as JSON, whose keys are strings
+        return {int(page): page_text for page, page_text in text.items()}
 
-            reader = PdfReader(temp_path)
+    async def _download_pdf(self, paper_id: str, link: str) -> Dict[int, str]:
+        pdf = await HTTP_CLIENT.get_bytes(link, max_bytes=ARXIV_MAX_PDF_BYTES)
+        text = await run_in_process(extract_pdf_text, pdf, ARXIV_MAX_PAGES)
+        await PAPER_CACHE.set_async(paper_id, text)
+        return text
 
-            return {i: page.extract_text() for i, page in enumerate(reader.pages)}
+    def _index_result(self, result: dict):
+        try:
+            title = self._resource_name(result)
+            id = result["pagemap"]["metatags"][0]["citation_arxiv_id"]
+            if title is not None:
+                self.index.add(title, id)
+        except KeyError:
+            pass
 
-    def _get_resource_values(self):
-        return list(self.papers.keys())
-
-    async def search(self):
+    async def search(self, search_terms: List[str] = None):
         logger.info("Searching the arXiv...")
-        await self._search()
-        self.papers = {}
-        for result in self.results:
-            try:
-                title = result["pagemap"]["metatags"][0]["citation_title"]
-                id = result["pagemap"]["metatags"][0]["citation_arxiv_id"]
-                self.papers[title] = id
-            except KeyError:
-                pass
+        await self._search(search_terms=search_terms)
+
+    def _resource_name(self, result: dict) -> str:
+        try:
+            return result["pagemap"]["metatags"][0]["citation_title"]
+        except KeyError:
+            return None
 
-    def get_content(self, resource: str) -> dict:
-        client = arxiv.Client()
-        paper_id = self.papers[resource]
-        search = arxiv.Search(id_list=[paper_id])
-        paper = [paper for paper in client.results(search=search)][0]
+    async def get_content(self, resource: str) -> dict:
+        # The search result already has the arXiv id, so go straight to the PDF instead of
+        #   looking the paper up again through the arxiv client
+        title, paper_id = self.index.get(resource)
+        link = ARXIV_PDF_URL.format(paper_id=paper_id)
 
         return {
-            "text": self._read_pdf(paper),
-            "title": resource,
-            "link": paper.pdf_url,
+            "text": await self._read_pdf(paper_id=paper_id, link=link),
+            "title": title,
+            "link": link,
             "type": ReferenceType.PAPER.value,
         }
@@ -1,26 +1,165 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List
-
-import requests
+from collections import Counter
+from typing import Any, Dict, List, Tuple
 
+from ada.config import GOOGLE_SEARCH_URL, DATASOURCE_SEARCH_TIMEOUT, RESOURCE_MATCH_CUTOFF
 from ada.datasources.search_engines import SearchEngines
+from ada.datasources.http_client import HTTP_CLIENT
+from ada.datasources.cache import SEARCH_CACHE
+from ada.datasources.shared import shared_fetch
+from ada.metrics import DATASOURCE_SEARCH_DURATION, TOOL_CALL_DURATION
+from ada.rate_limit import CSE_LIMITER, RateLimited, parse_retry_after
 
 import logging
-import aiohttp
 import json
 import os
 import asyncio
+import functools
+import inspect
+import re
 
 logger = logging.getLogger(__name__)
 
 
+def _timed(func, histogram):
+    if getattr(func, "__timed__", False):
+        return func
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            with histogram.time(datasource=self.name):
+                return await func(self, *args, **kwargs)
+
+    else:
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with histogram.time(datasource=self.name):
+                return func(self, *args, **kwargs)
+
+    wrapper.__timed__ = True
+    return wrapper
+
+
+def _instrument(cls):
+    # Every datasource gets its 'search' and 'get_content' timed, without having to opt in
+    if "search" in cls.__dict__:
+        cls.search = _timed(cls.__dict__["search"], DATASOURCE_SEARCH_DURATION)
+    if "get_content" in cls.__dict__:
+        cls.get_content = _timed(cls.__dict__["get_content"], TOOL_CALL_DURATION)
+
+
 class SearchNotRun(Exception):
     def __init__(self):
         self.message = "In order to export a WebSource as an OpenAI Tool, the 'search' method must be called with 'await'."
         super().__init__(self.message)
 
 
+class ResourceNotFound(Exception):
+    def __init__(self, resource: str):
+        self.message = f"Resource '{resource}' was not found in the search results"
+        super().__init__(self.message)
+
+
+def _normalize(name: str) -> str:
+    return " ".join(re.sub(r"[\W_]+", " ", name.lower()).split())
+
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class ResourceIndex:
+    """
+    The resources a datasource offers as its tool's enum, mapped to whatever it needs to get
+    their content.
+
+    A resource asked for is looked up by its exact name, then by its name ignoring case,
+    whitespace and punctuation, and only then matched to the most similar name through an
+    index of character trigrams kept as resources are added. So looking up a resource costs
+    about the same however many results there are
+    """
+
+    def __init__(self, cutoff: float = RESOURCE_MATCH_CUTOFF):
+        self.cutoff = cutoff
+        self._items: Dict[str, Any] = {}
+        self._normalized: Dict[str, str] = {}
+        self._trigrams: Dict[str, List[str]] = {}
+        self._n_trigrams: Dict[str, int] = {}
+        self._order: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._items
+
+    def add(self, name: str, item: Any) -> bool:
+        """
+        Returns False (keeping the first item) if 'name' is already in the index
+        """
+        if name in self._items:
+            return False
+        self._items[name] = item
+
+        key = _normalize(name)
+        if key not in self._normalized:
+            self._normalized[key] = name
+            self._order[key] = len(self._order)
+            trigrams = _trigrams(key)
+            self._n_trigrams[key] = len(trigrams)
+            for trigram in trigrams:
+                self._trigrams.setdefault(trigram, []).append(key)
+        return True
+
+    def names(self) -> List[str]:
+        return list(self._items)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return list(self._items.items())
+
+    def _closest(self, key: str) -> str:
+        trigrams = _trigrams(key)
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self._trigrams.get(trigram, ()))
+        if not shared:
+            return None
+
+        # Dice coefficient of the trigram sets, the first added winning ties
+        scores = {
+            match: 2 * count / (len(trigrams) + self._n_trigrams[match])
+            for match, count in shared.items()
+        }
+        best = max(scores, key=lambda match: (scores[match], -self._order[match]))
+        return best if scores[best] >= self.cutoff else None
+
+    def get(self, resource: str) -> Tuple[str, Any]:
+        """
+        Returns the name and item best matching 'resource'
+        """
+        if resource in self._items:
+            return resource, self._items[resource]
+
+        key = _normalize(resource)
+        name = self._normalized.get(key)
+        if name is None:
+            match = self._closest(key)
+            if match is None:
+                raise ResourceNotFound(resource=resource)
+            name = self._normalized[match]
+        return name, self._items[name]
+
+
 class Datasource:
+    # Seconds a search gets before tools are built without whatever it has not found yet
+    search_timeout = DATASOURCE_SEARCH_TIMEOUT
+    # How worthwhile prefetching this datasource's content is, 0 never prefetches it
+    prefetch_weight = 1.0
+
     def __init__(
         self,
         name: str,
@@ -36,16 +175,29 @@ class Datasource:
         self.max_results = max_results
 
         self.results = []
+        # What the tool offers, filled in as 'search' finds it, see ResourceIndex
+        self.index = ResourceIndex()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _instrument(cls)
 
     def _search(self):
         pass
 
     def _get_resource_values(self):
-        pass
+        return self.index.names()
+
+    def rank_resources(self) -> List[str]:
+        """
+        The resources, most likely to be asked for first
+        """
+        return self.index.names()
 
     @property
     def tool_spec(self):
-        if len(self.results) == 0:
+        # The enum is the index, results that are not indexed yet can not be asked for
+        if len(self.index) == 0:
             raise SearchNotRun()
         else:
             return {
@@ -74,6 +226,11 @@ class Datasource:
 
 
 class AsyncDatasource:
+    # Seconds a search gets before tools are built without whatever it has not found yet
+    search_timeout = DATASOURCE_SEARCH_TIMEOUT
+    # How worthwhile prefetching this datasource's content is, 0 never prefetches it
+    prefetch_weight = 1.0
+
     def __init__(
         self,
         name: str,
@@ -89,18 +246,30 @@ class AsyncDatasource:
         self.max_results = max_results
 
         self.results = []
+        # What the tool offers, filled in as 'search' finds it, see ResourceIndex
+        self.index = ResourceIndex()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _instrument(cls)
 
     @abstractmethod
-    async def _search(self):
+    async def _search(self, search_terms: List[str] = None):
         pass
 
-    @abstractmethod
     def _get_resource_values(self):
-        pass
+        return self.index.names()
+
+    def rank_resources(self) -> List[str]:
+        """
+        The resources, most likely to be asked for first
+        """
+        return self.index.names()
 
     @property
     def tool_spec(self):
-        if len(self.results) == 0:
+        # The enum is the index, results that are not indexed yet can not be asked for
+        if len(self.index) == 0:
             raise SearchNotRun()
         else:
             return {
@@ -122,9 +291,18 @@ class AsyncDatasource:
             }
 
     @abstractmethod
-    async def search(self):
+    async def search(self, search_terms: List[str] = None):
+        """
+        Searches 'search_terms' (all of 'self.search_terms' by default), merging what is found
+        into the results of any earlier searches
+        """
         pass
 
+    async def add_search_terms(self, search_terms: List[str]):
+        search_terms = [term for term in search_terms if term not in self.search_terms]
+        self.search_terms.extend(search_terms)
+        await self.search(search_terms=search_terms)
+
     @abstractmethod
     async def get_content(self, resource: str) -> dict:
         pass
@@ -152,7 +330,21 @@ class AsyncWebSource(AsyncDatasource, ABC):
         self.engine = engine
         self.is_image = is_image
 
-    async def _search_per_term(self, term: str, session: aiohttp.ClientSession):
+    async def _request_results(self, params: dict) -> dict:
+        async with HTTP_CLIENT.session.get(url=GOOGLE_SEARCH_URL, params=params) as res:
+            if res.status == 429:
+                retry_after = parse_retry_after(res.headers.get("Retry-After"))
+                raise RateLimited(limiter="cse", retry_after=retry_after)
+            return json.loads(await res.text())
+
+    async def _fetch_results(self, params: dict) -> dict:
+        try:
+            return await CSE_LIMITER.run(lambda: self._request_results(params=params))
+        except RateLimited as err:
+            # Out of retries, the term is searched without results rather than failing the search
+            return {"error": {"code": 429, "message": err.message}}
+
+    async def _search_per_term(self, term: str):
         params = {
             "key": os.environ["GOOGLE_KEY"],
             "cx": self.engine.value,
@@ -161,19 +353,58 @@ class AsyncWebSource(AsyncDatasource, ABC):
         }
         if self.is_image:
             params["searchType"] = "image"
-        async with session.get(
-            url="https://www.googleapis.com/customsearch/v1", params=params
-        ) as res:
-            results = json.loads(await res.text())
-            if "items" in results:
-                for res in results["items"]:
-                    self.results.append(res)
-
-    async def _search(self):
-        async with aiohttp.ClientSession() as session:
-            await asyncio.gather(
-                *[self._search_per_term(term=term, session=session) for term in self.search_terms]
-            )
+
+        cache_key = SEARCH_CACHE.key(
+            cx=params["cx"], query=term, count=params["count"], search_type=params.get("searchType")
+        )
+        items = await SEARCH_CACHE.get_async(cache_key)
+
+        if items is None:
+            results = await shared_fetch(cache_key, lambda: self._fetch_results(params=params))
+            items = results.get("items", [])
+            # Errors (quota, bad request, etc.) are never cached
+            if "error" not in results:
+                await SEARCH_CACHE.set_async(cache_key, items)
+            else:
+                logger.warning(f"Search for '{term}' on {self.name} failed: {results['error']}")
+
+        # Where each result ranked for its term, see 'rank_resources'
+        results = [{**item, "rank": rank} for rank, item in enumerate(items)]
+        self.results.extend(results)
+        # Indexed as soon as the term is done, so its results are offered even if a later term
+        #   is still being searched when the search's deadline passes
+        for result in results:
+            self._index_result(result)
+
+    @abstractmethod
+    def _index_result(self, result: dict):
+        """
+        Adds the resource a search result offers (if any) to the index
+        """
+        pass
+
+    def _resource_name(self, result: dict) -> str:
+        """
+        The resource a search result is offered as
+        """
+        return result.get("title")
+
+    def rank_resources(self) -> List[str]:
+        """
+        The resources found by the most search terms first, then by how high they ranked
+        """
+        hits, best_rank = Counter(), {}
+        for result in self.results:
+            name = self._resource_name(result)
+            if name is None or name not in self.index:
+                continue
+            hits[name] += 1
+            best_rank[name] = min(best_rank.get(name, result["rank"]), result["rank"])
+        return sorted(hits, key=lambda name: (-hits[name], best_rank[name]))
+
+    async def _search(self, search_terms: List[str] = None):
+        search_terms = self.search_terms if search_terms is None else search_terms
+        await asyncio.gather(*[self._search_per_term(term=term) for term in search_terms])
 
 
 class DatasourceReturn:
@@ -0,0 +1,399 @@
+import json
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from ada.executor import run_blocking
+from ada.metrics import CACHE_REQUESTS
+
+from ada.config import (
+    CACHE_EVICT_FRACTION,
+    CACHE_TOUCH_BATCH,
+    CACHE_TOUCH_INTERVAL,
+    SEARCH_CACHE_BACKEND,
+    SEARCH_CACHE_TTL,
+    SEARCH_CACHE_MAX_ENTRIES,
+    SEARCH_CACHE_PATH,
+    ARTICLE_CACHE_BACKEND,
+    ARTICLE_CACHE_TTL,
+    ARTICLE_CACHE_MAX_ENTRIES,
+    ARTICLE_CACHE_MAX_BYTES,
+    ARTICLE_CACHE_PATH,
+    PAPER_CACHE_BACKEND,
+    PAPER_CACHE_TTL,
+    PAPER_CACHE_MAX_ENTRIES,
+    PAPER_CACHE_MAX_BYTES,
+    PAPER_CACHE_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidCacheBackend(Exception):
+    def __init__(self, backend):
+        self.message = f"Cache backend '{backend}' is not valid. Use either 'memory' or 'sqlite'"
+        super().__init__(self.message)
+
+
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalizes a url so the same page found through different links shares a cache entry
+    """
+    parts = urlsplit(url.strip())
+    scheme = "https" if parts.scheme in ("http", "https") else parts.scheme
+    netloc = parts.netloc.lower().removeprefix("www.")
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(
+        sorted(
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not key.lower().startswith(TRACKING_PARAMS)
+        )
+    )
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+class CacheBackend(ABC):
+    # Whether 'get' and 'set' wait on disk, so async callers should run them off the event loop
+    blocking = False
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Any):
+        pass
+
+    @abstractmethod
+    def stored(self) -> List[Tuple[str, float]]:
+        """
+        The keys of the entries that have not expired, with when they were stored, oldest first
+        """
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int = None):
+        super().__init__(ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        # Also used from executor threads
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.time():
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def _remove(self, key: str):
+        del self._entries[key]
+        self._total_bytes -= self._sizes.pop(key, 0)
+
+    def set(self, key: str, value: Any):
+        size = len(json.dumps(value)) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, value)
+            if self.max_bytes is not None:
+                self._sizes[key] = size
+                self._total_bytes += size
+
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._total_bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def stored(self) -> List[Tuple[str, float]]:
+        now = time.time()
+        with self._lock:
+            entries = [
+                (key, expires_at - self.ttl)
+                for key, (expires_at, _) in self._entries.items()
+                if expires_at >= now
+            ]
+        return sorted(entries, key=lambda entry: entry[1])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Stores entries as compressed JSON in a local SQLite file, so they survive restarts.
+    Once 'max_entries' or 'max_bytes' is exceeded, the least recently used entries are evicted
+    until it is CACHE_EVICT_FRACTION under both.
+
+    The number of entries and bytes are kept in the file by triggers, so every process sharing
+    it sees the same totals without counting them on every write. When a hit was accessed is
+    written down in batches (see CACHE_TOUCH_BATCH), so hits do not take the write lock.
+    """
+
+    blocking = True
+
+    def __init__(
+        self, path: str, ttl: float, max_entries: int, max_bytes: int = None, table: str = "cache"
+    ):
+        super().__init__(ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        # At once, so a process opening the file meanwhile does not count the entries twice
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value BLOB, expires_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)"
+        )
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table}_totals ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER, bytes INTEGER)"
+        )
+        # Files created before the totals were kept are counted once
+        self._conn.execute(
+            f"INSERT OR IGNORE INTO {self.table}_totals "
+            f"SELECT 0, COUNT(*), COALESCE(SUM(length(value)), 0) FROM {self.table}"
+        )
+        for event, change in (
+            ("INSERT", "entries = entries + 1, bytes = bytes + length(new.value)"),
+            ("UPDATE OF value", "bytes = bytes - length(old.value) + length(new.value)"),
+            ("DELETE", "entries = entries - 1, bytes = bytes - length(old.value)"),
+        ):
+            name = f"{self.table}_count_{event.split()[0].lower()}"
+            self._conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {self.table} "
+                f"BEGIN UPDATE {self.table}_totals SET {change}; END"
+            )
+        self._conn.execute("COMMIT")
+
+        # The connection is shared by the executor threads
+        self._lock = threading.Lock()
+        # key -> when it was last accessed, not written down yet
+        self._touched = {}
+        self._touched_at = time.time()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, expires_at = row
+            if expires_at < time.time():
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._touched.pop(key, None)
+                return None
+
+            self._touched[key] = time.time()
+            if (
+                len(self._touched) >= CACHE_TOUCH_BATCH
+                or time.time() - self._touched_at >= CACHE_TOUCH_INTERVAL
+            ):
+                self._write_touched()
+        return json.loads(zlib.decompress(value))
+
+    def _write_touched(self):
+        # Entries deleted meanwhile are not updated
+        self._conn.execute("BEGIN")
+        self._conn.executemany(
+            f"UPDATE {self.table} SET accessed_at = max(accessed_at, ?) WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in self._touched.items()],
+        )
+        self._conn.execute("COMMIT")
+        self._touched = {}
+        self._touched_at = time.time()
+
+    def _totals(self) -> Tuple[int, int]:
+        return self._conn.execute(f"SELECT entries, bytes FROM {self.table}_totals").fetchone()
+
+    def set(self, key: str, value: Any):
+        data = zlib.compress(json.dumps(value).encode())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO {self.table} VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "value = excluded.value, expires_at = excluded.expires_at, "
+                "accessed_at = excluded.accessed_at",
+                (key, data, now + self.ttl, now),
+            )
+            self._touched.pop(key, None)
+
+            # Written by every process sharing the file
+            count, size = self._totals()
+            if count > self.max_entries or (self.max_bytes is not None and size > self.max_bytes):
+                self._evict()
+
+    def _evict(self):
+        max_entries = int(self.max_entries * (1 - CACHE_EVICT_FRACTION))
+        max_bytes = None if self.max_bytes is None else self.max_bytes * (1 - CACHE_EVICT_FRACTION)
+        if self._touched:
+            # So the entries this process used recently are not evicted
+            self._write_touched()
+
+        # Another process may be evicting too, so count again once holding the write lock
+        self._conn.execute("BEGIN IMMEDIATE")
+        evicted = []
+        count, size = self._totals()
+        cursor = self._conn.execute(
+            f"SELECT key, length(value) FROM {self.table} ORDER BY accessed_at ASC"
+        )
+        for key, length in cursor:
+            if count <= max_entries and (max_bytes is None or size <= max_bytes):
+                break
+            evicted.append((key,))
+            count -= 1
+            size -= length
+        cursor.close()
+
+        self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", evicted)
+        self._conn.execute("COMMIT")
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} entries from the {self.table} cache")
+
+    def stored(self) -> List[Tuple[str, float]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, expires_at FROM {self.table} WHERE expires_at >= ? "
+                "ORDER BY expires_at",
+                (time.time(),),
+            ).fetchall()
+        return [(key, expires_at - self.ttl) for key, expires_at in rows]
+
+    def size(self) -> int:
+        with self._lock:
+            return self._totals()[1]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._totals()[0]
+
+
+class Cache:
+    def __init__(self, name: str, backend: CacheBackend):
+        self.name = name
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            CACHE_REQUESTS.inc(cache=self.name, result="miss")
+        else:
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache=self.name, result="hit")
+        return value
+
+    def set(self, key: str, value: Any):
+        self.backend.set(key, value)
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        """
+        'get', off the event loop if the backend waits on disk
+        """
+        if not self.backend.blocking:
+            return self.get(key)
+        return await run_blocking(self.get, key)
+
+    async def set_async(self, key: str, value: Any):
+        if not self.backend.blocking:
+            return self.set(key, value)
+        await run_blocking(self.set, key, value)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.backend)}
+
+
+class SearchCache(Cache):
+    @staticmethod
+    def key(cx: str, query: str, count: int, search_type: str = None) -> str:
+        normalized_query = " ".join(query.lower().split())
+        return json.dumps([cx, normalized_query, count, search_type])
+
+
+class ArticleCache(Cache):
+    @staticmethod
+    def key(url: str) -> str:
+        return canonical_url(url)
+
+
+def build_cache_backend(
+    backend: str, path: str, ttl: float, max_entries: int, max_bytes: int = None
+) -> CacheBackend:
+    if backend == "memory":
+        return MemoryCacheBackend(ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+    elif backend == "sqlite":
+        return SQLiteCacheBackend(path=path, ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+    raise InvalidCacheBackend(backend=backend)
+
+
+SEARCH_CACHE = SearchCache(
+    name="search",
+    backend=build_cache_backend(
+        backend=SEARCH_CACHE_BACKEND,
+        path=SEARCH_CACHE_PATH,
+        ttl=SEARCH_CACHE_TTL,
+        max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    ),
+)
+
+ARTICLE_CACHE = ArticleCache(
+    name="article",
+    backend=build_cache_backend(
+        backend=ARTICLE_CACHE_BACKEND,
+        path=ARTICLE_CACHE_PATH,
+        ttl=ARTICLE_CACHE_TTL,
+        max_entries=ARTICLE_CACHE_MAX_ENTRIES,
+        max_bytes=ARTICLE_CACHE_MAX_BYTES,
+    ),
+)
+
+PAPER_CACHE = Cache(
+    name="paper",
+    backend=build_cache_backend(
+        backend=PAPER_CACHE_BACKEND,
+        path=PAPER_CACHE_PATH,
+        ttl=PAPER_CACHE_TTL,
+        max_entries=PAPER_CACHE_MAX_ENTRIES,
+        max_bytes=PAPER_CACHE_MAX_BYTES,
+    ),
+)
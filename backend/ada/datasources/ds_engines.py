@@ -1,13 +1,20 @@
 from enum import Enum
+from importlib import import_module
+from importlib.metadata import EntryPoint, entry_points
+from typing import Dict, List, Union
 import logging
 
-from ada.datasources.wiki import WikiSearch
-from ada.datasources.general import GeneralSearch
-from ada.datasources.arxiv import ArxivSearch
-from ada.datasources.images import ImageWebSearch
+from ada.config import WIKI_BACKEND
 
 logger = logging.getLogger(__name__)
 
+# Third party datasources register themselves under this entry point group, i.e. in their
+#   pyproject.toml:
+#
+#   [project.entry-points."ada.datasources"]
+#   MySource = "my_package.datasource:MySearch"
+ENTRY_POINT_GROUP = "ada.datasources"
+
 
 class DatasourceEngines(Enum):
     GENERAL = "General"
@@ -16,9 +23,97 @@ class DatasourceEngines(Enum):
     IMAGE = "Image"
 
 
-DATASOURCE_RESOLVER = {
-    "General": GeneralSearch,
-    "Arxiv": ArxivSearch,
-    "Wiki": WikiSearch,
-    "Image": ImageWebSearch,
+# See WIKI_BACKEND, both offer the same tool
+WIKI_BACKENDS = {
+    "online": "ada.datasources.wiki:WikiSearch",
+    "offline": "ada.datasources.wiki_offline:OfflineWikiSearch",
+}
+
+# Imported by name, so i.e. newspaper or PyPDF2 are only loaded by the workers that use them
+BUILTIN_DATASOURCES = {
+    DatasourceEngines.GENERAL.value: "ada.datasources.general:GeneralSearch",
+    DatasourceEngines.ARXIV.value: "ada.datasources.arxiv:ArxivSearch",
+    DatasourceEngines.WIKI.value: WIKI_BACKENDS[WIKI_BACKEND],
+    DatasourceEngines.IMAGE.value: "ada.datasources.images:ImageWebSearch",
 }
+
+
+class DatasourceNotFound(Exception):
+    def __init__(self, name: str, available: List[str]):
+        self.message = f"No datasource named {name}, expected one of: {', '.join(available)}"
+        super().__init__(self.message)
+
+
+class DatasourceRegistry:
+    """
+    Resolves datasource engines by name, importing each one (and the libraries it needs) the
+    first time it is used.
+
+    Besides the built in engines, any installed package can add engines under the
+    'ada.datasources' entry point group. Entry points are only listed when a name is first
+    looked up, and only loaded once resolved.
+    """
+
+    def __init__(
+        self, builtins: Dict[str, str] = BUILTIN_DATASOURCES, group: str = ENTRY_POINT_GROUP
+    ):
+        self.group = group
+        # Each a "module:attribute" path, an entry point or an already imported class
+        self._targets: Dict[str, Union[str, EntryPoint, type]] = dict(builtins)
+        self._resolved: Dict[str, type] = {}
+        self._discovered = False
+
+    def _discover(self):
+        if self._discovered:
+            return
+        self._discovered = True
+        for entry_point in entry_points(group=self.group):
+            if entry_point.name in self._targets:
+                logger.warning(
+                    f"Ignoring datasource {entry_point.name} ({entry_point.value}), "
+                    "the name is already taken"
+                )
+                continue
+            self._targets[entry_point.name] = entry_point
+
+    def register(self, name: str, target: Union[str, type]):
+        """
+        Adds (or replaces) an engine, either its class or its "module:attribute" path
+        """
+        self._targets[name] = target
+        self._resolved.pop(name, None)
+
+    def names(self) -> List[str]:
+        self._discover()
+        return list(self._targets)
+
+    def loaded(self) -> List[str]:
+        return list(self._resolved)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._resolved or name in self.names()
+
+    def resolve(self, name: str) -> type:
+        engine = self._resolved.get(name)
+        if engine is not None:
+            return engine
+
+        self._discover()
+        target = self._targets.get(name)
+        if target is None:
+            raise DatasourceNotFound(name=name, available=self.names())
+
+        if isinstance(target, EntryPoint):
+            engine = target.load()
+        elif isinstance(target, str):
+            module, attribute = target.split(":")
+            engine = getattr(import_module(module), attribute)
+        else:
+            engine = target
+
+        logger.info(f"Loaded datasource {name} from {engine.__module__}")
+        self._resolved[name] = engine
+        return engine
+
+
+DATASOURCES = DatasourceRegistry()
@@ -1,12 +1,15 @@
+from ada.config import HTTP_USER_AGENT
 from ada.datasources.base import AsyncWebSource
+from ada.datasources.cache import ARTICLE_CACHE
+from ada.datasources.http_client import HTTP_CLIENT
 from ada.datasources.search_engines import SearchEngines
+from ada.datasources.shared import shared_fetch
 from ada.datasources.references import ReferenceType
+from ada.executor import run_blocking
 
 import logging
 from dataclasses import dataclass
 from typing import List
-import difflib
-import requests
 
 import newspaper
 
@@ -24,18 +27,12 @@ class WebSearchArticle:
     keywords: List[str] = None
     summary: str = None
 
-    def _parse(self):
+    async def _download(self) -> str:
+        return await HTTP_CLIENT.get_text(self.url, headers={"User-Agent": HTTP_USER_AGENT})
+
+    def _parse(self, html: str):
         article = newspaper.Article(url=self.url, language="en")
-        try:
-            article.download()
-        except newspaper.ArticleException:
-            html = requests.get(
-                url=self.url,
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36"
-                },
-            )
-            article.download(input_html=html)
+        article.download(input_html=html)
         article.parse()
 
         self.text = str(article.text)
@@ -44,6 +41,22 @@ class WebSearchArticle:
         self.keywords = article.keywords
         self.summary = str(article.summary)
 
+    def to_cache(self) -> dict:
+        return {
+            "text": self.text,
+            "authors": self.authors,
+            "published_date": self.published_date,
+            "keywords": self.keywords,
+            "summary": self.summary,
+        }
+
+    def from_cache(self, data: dict):
+        self.text = data["text"]
+        self.authors = data["authors"]
+        self.published_date = data["published_date"]
+        self.keywords = data["keywords"]
+        self.summary = data["summary"]
+
     def export(self):
         return {
             "text": self.text,
@@ -63,7 +76,6 @@ class GeneralSearch(AsyncWebSource):
             max_results=max_results,
             engine=SearchEngines.GENERAL,
         )
-        self.articles = []
 
     def _fix_http(self, url: str):
         if url[0:6] == "http:":
@@ -72,18 +84,30 @@ class GeneralSearch(AsyncWebSource):
         else:
             return url
 
-    def _get_resource_values(self):
-        return [article.title for article in self.articles]
+    def _index_result(self, result: dict):
+        if result["title"] not in self.index:
+            article = WebSearchArticle(url=self._fix_http(result["link"]), title=result["title"])
+            self.index.add(article.title, article)
 
-    async def search(self):
-        await self._search()
+    async def search(self, search_terms: List[str] = None):
         logger.info("Searching the web...")
-        for result in self.results:
-            url = self._fix_http(result["link"])
-            self.articles.append(WebSearchArticle(url=url, title=result["title"]))
-
-    def get_content(self, resource: str):
-        closest_title = difflib.get_close_matches(resource, [a.title for a in self.articles])[0]
-        article = list(filter(lambda a: a.title == closest_title, self.articles))[0]
-        article._parse()
+        await self._search(search_terms=search_terms)
+
+    async def get_content(self, resource: str):
+        _, article = self.index.get(resource)
+
+        cache_key = ARTICLE_CACHE.key(article.url)
+        cached = await ARTICLE_CACHE.get_async(cache_key)
+        if cached is None:
+            cached = await shared_fetch(cache_key, lambda: self._fetch_article(article))
+        article.from_cache(cached)
+
         return article.export()
+
+    async def _fetch_article(self, article: WebSearchArticle) -> dict:
+        html = await article._download()
+        await run_blocking(article._parse, html)
+        # Empty text is usually a blocked or paywalled page, which is worth retrying later
+        if article.text:
+            await ARTICLE_CACHE.set_async(ARTICLE_CACHE.key(article.url), article.to_cache())
+        return article.to_cache()
@@ -0,0 +1,173 @@
+import aiohttp
+import asyncio
+import logging
+import time
+
+from ada.config import (
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_TOTAL_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseTooLarge(Exception):
+    def __init__(self, url, max_bytes):
+        self.message = f"Response from {url} is larger than {max_bytes} bytes"
+        super().__init__(self.message)
+
+
+class HTTPClient:
+    """
+    A single pooled aiohttp session shared by every datasource for the lifetime of the app.
+
+    Connections are kept alive and reused across requests, DNS lookups are cached, and the
+    number of open connections (overall and per host) is capped.
+    """
+
+    def __init__(
+        self,
+        limit: int = HTTP_POOL_LIMIT,
+        limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+        dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+        keepalive_timeout: int = HTTP_KEEPALIVE_TIMEOUT,
+        total_timeout: int = HTTP_TOTAL_TIMEOUT,
+        connect_timeout: int = HTTP_CONNECT_TIMEOUT,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+
+        self._session = None
+        self._loop = None
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.requests += 1
+
+        async def on_queued_start(session, ctx, params):
+            self.waits += 1
+            ctx.queued_at = time.perf_counter()
+
+        async def on_queued_end(session, ctx, params):
+            self.wait_time += time.perf_counter() - ctx.queued_at
+
+        async def on_create_end(session, ctx, params):
+            self.connections_created += 1
+
+        async def on_reuse(session, ctx, params):
+            self.connections_reused += 1
+
+        async def on_dns_hit(session, ctx, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_miss(session, ctx, params):
+            self.dns_cache_misses += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_queued_start.append(on_queued_start)
+        trace_config.on_connection_queued_end.append(on_queued_end)
+        trace_config.on_connection_create_end.append(on_create_end)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        trace_config.on_dns_cache_hit.append(on_dns_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_miss)
+        return trace_config
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            trace_configs=[self._trace_config()],
+        )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created lazily as well, so datasources still work outside of the app (i.e. notebooks)
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = self._create_session()
+            self._loop = loop
+        return self._session
+
+    async def start(self):
+        logger.info("Starting shared HTTP client")
+        # Binds the pooled session to the app's event loop
+        self.session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            logger.info(f"Closing shared HTTP client: {self.stats()}")
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    async def get_text(self, url: str, **kwargs) -> str:
+        async with self.session.get(url, **kwargs) as res:
+            res.raise_for_status()
+            return await res.text(errors="replace")
+
+    async def get_json(self, url: str, **kwargs) -> dict:
+        async with self.session.get(url, **kwargs) as res:
+            return await res.json(content_type=None)
+
+    async def get_bytes(self, url: str, max_bytes: int = None, **kwargs) -> bytes:
+        async with self.session.get(url, **kwargs) as res:
+            res.raise_for_status()
+            if max_bytes is None:
+                return await res.read()
+
+            # Streamed straight into memory, stopping early on anything larger than expected
+            buffer = bytearray()
+            async for chunk in res.content.iter_chunked(64 * 1024):
+                buffer.extend(chunk)
+                if len(buffer) > max_bytes:
+                    raise ResponseTooLarge(url=url, max_bytes=max_bytes)
+            return bytes(buffer)
+
+    def stats(self) -> dict:
+        in_use = idle = 0
+        if self._session is not None and not self._session.closed:
+            connector = self._session.connector
+            in_use = len(getattr(connector, "_acquired", ()))
+            idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+
+        return {
+            "open_connections": in_use + idle,
+            "connections_in_use": in_use,
+            "connections_idle": idle,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "requests": self.requests,
+            "waits": self.waits,
+            "wait_time": round(self.wait_time, 4),
+            "dns_cache_hits": self.dns_cache_hits,
+            "dns_cache_misses": self.dns_cache_misses,
+        }
+
+
+HTTP_CLIENT = HTTPClient()
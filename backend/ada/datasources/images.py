@@ -4,12 +4,14 @@ from ada.datasources.references import ReferenceType
 
 from typing import List
 import logging
-import difflib
 
 logger = logging.getLogger(__name__)
 
 
 class ImageWebSearch(AsyncWebSource):
+    # The search result already is the content, there is nothing to fetch
+    prefetch_weight = 0
+
     def __init__(self, search_terms: List[str], max_results: int = 3):
         super().__init__(
             name="image_search",
@@ -20,17 +22,14 @@ class ImageWebSearch(AsyncWebSource):
             engine=SearchEngines.IMAGE,
             is_image=True,
         )
-        self.images = []
 
-    async def search(self):
-        logger.info("Searching for Images...")
-        await self._search()
-        self.images = {res["title"]: res["link"] for res in self.results}
+    def _index_result(self, result: dict):
+        self.index.add(result["title"], result["link"])
 
-    def _get_resource_values(self):
-        return list(self.images.keys())
+    async def search(self, search_terms: List[str] = None):
+        logger.info("Searching for Images...")
+        await self._search(search_terms=search_terms)
 
     def get_content(self, resource: str):
-        closest_title = difflib.get_close_matches(resource, list(self.images.keys()))[0]
-        image = self.images[closest_title]
-        return {"title": closest_title, "link": image, "type": ReferenceType.IMAGE.value}
+        title, image = self.index.get(resource)
+        return {"title": title, "link": image, "type": ReferenceType.IMAGE.value}
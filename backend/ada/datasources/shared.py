@@ -0,0 +1,45 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from ada.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Set for the questions of a batch (see 'AsyncCommunicator.ask_batch'), so every search, page,
+#   article and paper the batch needs is only fetched and parsed once
+SHARED_FETCHES: ContextVar[Optional[Dict[Hashable, asyncio.Task]]] = ContextVar(
+    "shared_fetches", default=None
+)
+
+
+async def shared_fetch(key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+    """
+    Awaits 'func()', unless the same key has already been fetched (or is being fetched) for
+    another question in the same batch, in which case that result (or exception) is reused
+    """
+    fetches = SHARED_FETCHES.get()
+    if fetches is None:
+        return await func()
+
+    task = fetches.get(key)
+    if task is None:
+        task = asyncio.ensure_future(func())
+        fetches[key] = task
+        CACHE_REQUESTS.inc(cache="batch", result="miss")
+    else:
+        CACHE_REQUESTS.inc(cache="batch", result="hit")
+    # Another question being cancelled must not cancel what the rest are waiting on
+    return await asyncio.shield(task)
+
+
+def cancel_fetches(fetches: Dict[Hashable, asyncio.Task]):
+    for task in fetches.values():
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            # Retrieve the exception, in case no question was left waiting on it
+            task.exception()
@@ -1,91 +1,84 @@
-import wikipedia
+import asyncio
 import logging
-import re
-from bs4 import BeautifulSoup
+import traceback
+from urllib.parse import quote
 
-from typing import Dict, List
+from typing import List, Optional
 
-from ada.datasources.base import Datasource
+from ada.config import WIKI_API_URL, WIKI_PAGE_URL, WIKI_USER_AGENT
+from ada.datasources.base import AsyncDatasource
+from ada.datasources.http_client import HTTP_CLIENT
 from ada.datasources.references import ReferenceType
+from ada.datasources.shared import shared_fetch
+from ada.datasources.wiki_parser import SECTION_SEPARATOR, parse_wiki_html
+from ada.executor import run_blocking
 
 logger = logging.getLogger(__name__)
 
+WIKI_HEADERS = {"User-Agent": WIKI_USER_AGENT}
 
-class WikiPage(wikipedia.WikipediaPage):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.html = BeautifulSoup(self.html(), features="html.parser")
-        self.image_captions = self._get_all_image_captions()
-        self.indexed_content = self._build_sections()
-        self.indexed_refs = {i + 1: ref for i, ref in enumerate(self.references)}
 
-    # TODO: Update function to handle thumbnail images
-    def _get_all_image_captions(self) -> Dict[str, str]:
-        figures = self.html.findAll(name="figure")
+def page_url(title: str) -> str:
+    return WIKI_PAGE_URL + quote(title.replace(" ", "_"))
 
-        data = {}
 
-        for fig in figures:
-            try:
-                img_src = fig.findAll(name="a")[0].findAll(name="img")[0].attrs["src"]
-                if img_src.startswith("//"):
-                    img_src = "https:" + img_src
-                img_caption = fig.findAll(name="figcaption")[0].text
-                data[img_src] = img_caption
-            except IndexError:
-                pass
+def section_content(
+    title: str, url: str, section_name: str, text: str, anchor: Optional[str] = None
+) -> dict:
+    return {
+        "text": text,
+        "link": url + "#" + (anchor or section_name),
+        "title": title + "/" + section_name,
+        "type": ReferenceType.WEB.value,
+    }
 
-        return data
 
-    # TODO: Pages can have nested sections (h3, h4, etc.)
-    #   May need to update this function to recursively create an object that can tolerate these
-    #   nested sections. For now, and for testing gpt, will keep this to just handle h2 sections
-    def _build_sections(self) -> Dict[str, List[str]]:
-        sections = {}
-
-        current_section = "Summary"
-        sections[current_section] = []
-
-        for paragraph in list(list(self.html.children)[0].children):
-            if paragraph.name == "h2":
-                current_section = paragraph.find(name="span").text
-                sections[current_section] = []
-            elif paragraph.name == "p":
-                citations = paragraph.findAll(name="sup", attrs={"class": "reference"})
-                if not citations:
-                    citations = []
-
-                def __get_num_from_string(s):
-                    try:
-                        return [int(num) for num in re.findall(r"\d+", s)][0]
-                    except IndexError:
-                        return None
-
-                sub_data = {
-                    "text": paragraph.text,
-                    "citations": [
-                        __get_num_from_string(citation.text) for citation in list(citations)
-                    ],
-                }
-                sections[current_section].append(sub_data)
-        return sections
+class WikiPage:
+    def __init__(self, title: str, url: str, html: str, references: List[str]):
+        self.title = title
+        self.url = url
+        self.references = references
+        self.indexed_content, self.nested_content, self.image_captions = parse_wiki_html(html)
+        self.indexed_refs = {i + 1: ref for i, ref in enumerate(self.references)}
+
+    def _get_section(self, section_name):
+        if section_name in self.indexed_content:
+            return self.indexed_content[section_name]
+        return self.nested_content[section_name]
 
-    def get_section_content(self, section_name):
-        section = self.indexed_content[section_name]
-        section_text = "\n".join([paragraph["text"] for paragraph in section])
+    def section_names(self) -> List[str]:
+        """
+        The h2 sections, then the nested ones by their path, i.e. "History/Early life"
+        """
+        return [*self.indexed_content, *self.nested_content]
+
+    def section_anchor(self, section_name) -> str:
+        if section_name in self.indexed_content:
+            return section_name
+        # A nested section's path is not on the page, its own heading is
+        return section_name.rsplit(SECTION_SEPARATOR, 1)[-1]
+
+    def get_section_citations(self, section_name) -> List[int]:
         section_citations = []
-        for paragraph in section:
+        for paragraph in self._get_section(section_name):
             section_citations.extend(paragraph["citations"])
         section_citations = list(set(section_citations))
         section_citations = list(
             filter(lambda c: c in self.indexed_refs.keys(), section_citations)
         )
-        return {
-            "text": section_text,
-            "link": self.url + "#" + section_name,
-            "title": self.title + "/" + section_name,
-            "type": ReferenceType.WEB.value,
-        }
+        return section_citations
+
+    def get_section_text(self, section_name) -> str:
+        return "\n".join([paragraph["text"] for paragraph in self._get_section(section_name)])
+
+    def get_section_content(self, section_name):
+        return section_content(
+            title=self.title,
+            url=self.url,
+            section_name=section_name,
+            text=self.get_section_text(section_name),
+            anchor=self.section_anchor(section_name),
+        )
 
     def _to_json(self):
         data = {
@@ -97,44 +90,105 @@ class WikiPage(wikipedia.WikipediaPage):
 
         return data
 
+    @classmethod
+    def from_parse(cls, data: dict) -> "WikiPage":
+        """
+        Parses a page as returned by the API's 'parse' action (i.e. a line of an offline extract)
+        """
+        references = [
+            "http:" + link if link.startswith("//") else link for link in data["externallinks"]
+        ]
+        return cls(
+            title=data["title"],
+            url=page_url(data["title"]),
+            html=data["text"],
+            references=references,
+        )
+
+    @classmethod
+    async def fetch(cls, title: str) -> "WikiPage":
+        params = {
+            "action": "parse",
+            "page": title,
+            "prop": "text|externallinks",
+            "redirects": 1,
+            "format": "json",
+            "formatversion": 2,
+        }
+        response = await HTTP_CLIENT.get_json(WIKI_API_URL, params=params, headers=WIKI_HEADERS)
+        # Parsing is CPU bound, so keep it off the event loop
+        return await run_blocking(cls.from_parse, response["parse"])
+
+
+class WikiSearch(AsyncDatasource):
+    # Pages are fetched and parsed while searching, so their sections are already at hand
+    prefetch_weight = 0
 
-class WikiSearch(Datasource):
     def __init__(self, search_terms: List[str], max_results: int = 10):
         super().__init__(
             name="wikipedia_search",
             description="Retrieve sections of articles from wikipedia.",
-            resource_description="The {page}/{section} wiki section to retrieve content from.",
+            resource_description=(
+                "The {page}/{section} (or {page}/{section}/{subsection}) wiki section to retrieve "
+                "content from."
+            ),
             search_terms=search_terms,
             max_results=max_results,
         )
 
         self.pages = []
 
-    def _search(self):
-        potential_pages = [wikipedia.search(term)[0] for term in self.search_terms]
-
-        potential_pages = list(set(potential_pages))
-        self.results.extend(potential_pages[0 : self.max_results])
-
-    def _get_resource_values(self):
-        section_enums = []
-
-        for page in self.pages:
-            sections = list(page.indexed_content.keys())
-            for section in sections:
-                enum = f"{page.title}/{section}"
-                if enum not in section_enums:
-                    section_enums.append(enum)
-
-        return section_enums
-
-    def search(self):
+    async def _search_term(self, term: str):
+        params = {
+            "action": "query",
+            "list": "search",
+            "srsearch": term,
+            "srlimit": 1,
+            "srprop": "",
+            "format": "json",
+        }
+        response = await HTTP_CLIENT.get_json(WIKI_API_URL, params=params, headers=WIKI_HEADERS)
+        results = response["query"]["search"]
+        return results[0]["title"] if results else None
+
+    async def _search_and_fetch(self, term: str):
+        try:
+            title = await shared_fetch(("wiki_search", term), lambda: self._search_term(term=term))
+        except Exception as err:
+            logger.error(f"Wiki search for {term} failed: \n {traceback.format_exc()}")
+            return
+
+        if title is None or title in self.results or len(self.results) >= self.max_results:
+            return
+
+        self.results.append(title)
+        try:
+            page = await shared_fetch(("wiki_page", title), lambda: WikiPage.fetch(title=title))
+            self._add_page(page)
+        except asyncio.CancelledError:
+            # i.e. the search's deadline passed, so the title has no page to offer
+            self.results.remove(title)
+            raise
+        except Exception as err:
+            self.results.remove(title)
+            logger.error(f"Wiki page {title} not fetched: \n {traceback.format_exc()}")
+
+    async def _search(self, search_terms: List[str] = None):
+        search_terms = self.search_terms if search_terms is None else search_terms
+        # Each page is fetched as soon as its term resolves, rather than waiting on every search
+        await asyncio.gather(*[self._search_and_fetch(term=term) for term in search_terms])
+
+    def _add_page(self, page: WikiPage):
+        self.pages.append(page)
+        for section in page.section_names():
+            self.index.add(f"{page.title}/{section}", (page, section))
+
+    async def search(self, search_terms: List[str] = None):
         logger.info("Searching Wiki....")
-        self._search()
-        self.pages.extend([WikiPage(title=title) for title in self.results])
+        await self._search(search_terms=search_terms)
 
     def get_content(self, resource: str):
-        title, section = resource.split("/")
-        page = list(filter(lambda p: p.title == title, self.pages))[0]
+        # Indexed by page and section, since titles and sections can have a '/' in them too
+        _, (page, section) = self.index.get(resource)
         section_content = page.get_section_content(section)
         return section_content
@@ -0,0 +1,406 @@
+"""
+Wikipedia from a local extract, so answers do not depend on (or wait for) Wikipedia's API.
+
+The extract is a JSON lines file (optionally .gz or .bz2) with one page per line, as returned by
+the API's 'parse' action: {"title": ..., "text": <html>, "externallinks": [...]}. Index it once,
+then set ADA_WIKI_BACKEND=offline:
+
+    cd backend
+    python -m ada.datasources.wiki_offline pages.jsonl.gz --workers 8
+"""
+import argparse
+import bz2
+import gzip
+import itertools
+import json
+import logging
+import mmap
+import os
+import pathlib
+import re
+import sqlite3
+import struct
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from ada.config import WIKI_OFFLINE_PATH
+from ada.datasources.base import AsyncDatasource
+from ada.datasources.wiki import WikiPage, section_content
+from ada.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.sqlite"
+SECTIONS_FILE = "sections.bin"
+
+# Each section in SECTIONS_FILE: its number of citations and bytes of text, the citations (each a
+#   uint32), then the UTF-8 text
+SECTION_HEADER = struct.Struct("<II")
+# Pages of the extract handed to the parsing processes at a time, when building with 'workers'
+BUILD_BATCH_SIZE = 4_096
+
+# bm25 weights of a page's title and its text, so a term naming a page finds that page rather than
+#   one that mentions it a lot
+SEARCH_WEIGHTS = (10.0, 1.0)
+WORD = re.compile(r"\w+")
+# Left out of searches (unless a term is only stopwords). Words in more than COMMON_WORD_FRACTION
+#   of the pages are left out of the ones matching any word, each would rank much of the index
+STOPWORDS = frozenset(
+    "a about an and are as at be by for from has have how in is it its of on or that the this "
+    "to was were what when where which who why will with".split()
+)
+COMMON_WORD_FRACTION = 0.05
+
+
+class OfflineWikiNotFound(Exception):
+    def __init__(self, path: pathlib.Path):
+        self.message = (
+            f"No offline wiki at {path}, index an extract with: "
+            "python -m ada.datasources.wiki_offline <extract>"
+        )
+        super().__init__(self.message)
+
+
+@dataclass
+class WikiSection:
+    title: str
+    url: str
+    name: str
+    anchor: str
+    offset: int
+    length: int
+
+
+class WikiDump:
+    """
+    An indexed Wikipedia extract, see 'build':
+     - INDEX_FILE: the pages, their sections and a full text (FTS5) index of every page's title
+       and text, which stores no text itself
+     - SECTIONS_FILE: every section's citations and text, read through a memory map, so fetching
+       one is a slice of a file shared by (and paged in once for) every worker
+
+    Opened on first use, each thread gets its own read only connection to the index
+    """
+
+    def __init__(self, path: str):
+        self.path = pathlib.Path(path)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sections = None
+        self._n_pages = None
+
+    def exists(self) -> bool:
+        return (self.path / INDEX_FILE).exists() and (self.path / SECTIONS_FILE).exists()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self.exists():
+                raise OfflineWikiNotFound(self.path)
+            uri = (self.path / INDEX_FILE).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            # Each word's number of pages, see _rare_words. In the temp schema, since the index is
+            #   opened read only
+            conn.execute(
+                "CREATE VIRTUAL TABLE temp.pages_vocab USING fts5vocab(main, pages_fts, row)"
+            )
+            self._local.conn = conn
+        return conn
+
+    @property
+    def n_pages(self) -> int:
+        if self._n_pages is None:
+            # Pages are never deleted, so the largest id is their number without counting them
+            self._n_pages = self.conn.execute("SELECT max(id) FROM pages").fetchone()[0] or 0
+        return self._n_pages
+
+    @property
+    def sections(self) -> mmap.mmap:
+        if self._sections is None:
+            with self._lock:
+                if self._sections is None:
+                    if not self.exists():
+                        raise OfflineWikiNotFound(self.path)
+                    with open(self.path / SECTIONS_FILE, "rb") as file:
+                        self._sections = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._sections
+
+    def _match(self, query: str) -> Optional[Tuple[int, str, str]]:
+        return self.conn.execute(
+            "SELECT id, title, url FROM pages WHERE id = ("
+            "SELECT rowid FROM pages_fts WHERE pages_fts MATCH ? "
+            "ORDER BY bm25(pages_fts, ?, ?) LIMIT 1)",
+            (query, *SEARCH_WEIGHTS),
+        ).fetchone()
+
+    def _rare_words(self, words: List[str]) -> List[str]:
+        """
+        The words not in more than COMMON_WORD_FRACTION of the pages. The index only has the stems
+        of some words, those count as rare
+        """
+        common = {
+            term
+            for (term,) in self.conn.execute(
+                f"SELECT term FROM temp.pages_vocab WHERE term IN ({', '.join('?' * len(words))}) "
+                "AND doc > ?",
+                (*words, self.n_pages * COMMON_WORD_FRACTION),
+            )
+        }
+        return [word for word in words if word not in common]
+
+    def search(self, term: str) -> Optional[Tuple[int, str, str]]:
+        """
+        Returns the (id, title, url) of the page best matching 'term': with every word of it in
+        its title, else in its text and some in its title, else anywhere in it, else with the most
+        of its rare words (in its title first). The narrower queries go first, since they rank far
+        fewer pages. Stopwords are left out, unless the term is only stopwords
+        """
+        words = WORD.findall(term.lower())
+        if not words:
+            return None
+        words = [word for word in words if word not in STOPWORDS] or words
+        every_word = " ".join(f'"{word}"' for word in words)
+        any_word = " OR ".join(f'"{word}"' for word in self._rare_words(words))
+
+        queries = [f"title : ({every_word})"]
+        if any_word:
+            queries.append(f"title : ({any_word}) AND ({every_word})")
+        queries.append(every_word)
+        if any_word:
+            queries += [f"title : ({any_word})", any_word]
+        for query in queries:
+            page = self._match(query)
+            if page is not None:
+                return page
+        return None
+
+    def page_sections(self, page_id: int, title: str, url: str) -> List[WikiSection]:
+        rows = self.conn.execute(
+            "SELECT name, anchor, offset, length FROM sections WHERE page_id = ? ORDER BY id",
+            (page_id,),
+        )
+        return [WikiSection(title, url, *row) for row in rows]
+
+    def read(self, section: WikiSection) -> Tuple[str, List[int]]:
+        """
+        Returns the section's text and citations
+        """
+        n_citations, n_bytes = SECTION_HEADER.unpack_from(self.sections, section.offset)
+        start = section.offset + SECTION_HEADER.size
+        citations = list(struct.unpack_from(f"<{n_citations}I", self.sections, start))
+        start += 4 * n_citations
+        return self.sections[start : start + n_bytes].decode("utf-8"), citations
+
+
+WIKI_DUMP = WikiDump(WIKI_OFFLINE_PATH)
+
+
+class OfflineWikiSearch(AsyncDatasource):
+    """
+    The same tool as WikiSearch, served from WIKI_DUMP instead of Wikipedia's API
+    """
+
+    # Every section is a slice of a memory mapped file, so there is nothing to prefetch
+    prefetch_weight = 0
+
+    def __init__(self, search_terms: List[str], max_results: int = 10, dump: WikiDump = WIKI_DUMP):
+        super().__init__(
+            name="wikipedia_search",
+            description="Retrieve sections of articles from wikipedia.",
+            resource_description=(
+                "The {page}/{section} (or {page}/{section}/{subsection}) wiki section to retrieve "
+                "content from."
+            ),
+            search_terms=search_terms,
+            max_results=max_results,
+        )
+        self.dump = dump
+
+    def _find(self, term: str) -> Optional[Tuple[str, List[WikiSection]]]:
+        page = self.dump.search(term)
+        if page is None:
+            return None
+        page_id, title, url = page
+        return title, self.dump.page_sections(page_id, title=title, url=url)
+
+    async def _search(self, search_terms: List[str] = None):
+        search_terms = self.search_terms if search_terms is None else search_terms
+        for term in search_terms:
+            if len(self.results) >= self.max_results:
+                return
+            try:
+                # Up to five FTS5 queries, each on the executor thread's own connection
+                page = await run_blocking(self._find, term)
+            except Exception:
+                logger.error(f"Offline wiki search for {term} failed: \n {traceback.format_exc()}")
+                continue
+            if page is None:
+                continue
+            title, sections = page
+            if title in self.results:
+                continue
+
+            self.results.append(title)
+            for section in sections:
+                self.index.add(f"{section.title}/{section.name}", section)
+
+    async def search(self, search_terms: List[str] = None):
+        logger.info("Searching offline Wiki....")
+        await self._search(search_terms=search_terms)
+
+    def get_content(self, resource: str):
+        _, section = self.index.get(resource)
+        text, _ = self.dump.read(section)
+        return section_content(
+            title=section.title,
+            url=section.url,
+            section_name=section.name,
+            text=text,
+            anchor=section.anchor,
+        )
+
+
+def read_extract(path: pathlib.Path) -> Iterator[dict]:
+    opener = {".gz": gzip.open, ".bz2": bz2.open}.get(path.suffix, open)
+    with opener(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                page = json.loads(line)
+                # Whole API responses work too
+                yield page.get("parse", page)
+
+
+def _parse_page(
+    data: dict,
+) -> Tuple[str, str, List[str], str, List[Tuple[str, str, str, List[int]]]]:
+    page = WikiPage.from_parse(data)
+    sections = [
+        (
+            name,
+            page.section_anchor(name),
+            page.get_section_text(name),
+            page.get_section_citations(name),
+        )
+        for name in page.section_names()
+    ]
+    # The h2 sections already hold the nested ones' text
+    text = "\n".join(f"{name}\n{page.get_section_text(name)}" for name in page.indexed_content)
+    return page.title, page.url, page.references, text, sections
+
+
+def _parse_pages(extract: pathlib.Path, workers: int) -> Iterator[tuple]:
+    if workers <= 1:
+        yield from map(_parse_page, read_extract(extract))
+        return
+
+    # Parsing the html is by far the slowest part. In batches, so the extract is not read into
+    #   memory all at once
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pages = read_extract(extract)
+        while batch := list(itertools.islice(pages, BUILD_BATCH_SIZE)):
+            yield from executor.map(_parse_page, batch, chunksize=64)
+
+
+def _write_pages(conn: sqlite3.Connection, file, pages: Iterable[tuple]) -> int:
+    n_pages = 0
+    offset = 0
+    for title, url, references, text, sections in pages:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO pages (title, url, refs) VALUES (?, ?, ?)",
+            (title, url, "\n".join(references)),
+        )
+        if cursor.rowcount == 0:
+            logger.warning(f"Skipping {title}, it is in the extract more than once")
+            continue
+        page_id = cursor.lastrowid
+        conn.execute(
+            "INSERT INTO pages_fts (rowid, title, text) VALUES (?, ?, ?)",
+            (page_id, title, text),
+        )
+
+        for name, anchor, section_text, citations in sections:
+            data = section_text.encode("utf-8")
+            record = SECTION_HEADER.pack(len(citations), len(data))
+            record += struct.pack(f"<{len(citations)}I", *citations) + data
+            file.write(record)
+
+            conn.execute(
+                "INSERT INTO sections (page_id, name, anchor, offset, length) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (page_id, name, anchor, offset, len(record)),
+            )
+            offset += len(record)
+
+        n_pages += 1
+        if n_pages % 10_000 == 0:
+            logger.info(f"Indexed {n_pages} pages")
+    return n_pages
+
+
+def build(
+    extract: pathlib.Path, path: pathlib.Path = pathlib.Path(WIKI_OFFLINE_PATH), workers: int = 1
+) -> int:
+    """
+    Indexes 'extract' into 'path', replacing whatever offline wiki was there once it is done.
+    Returns the number of pages indexed
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    index_tmp, sections_tmp = path / f"{INDEX_FILE}.tmp", path / f"{SECTIONS_FILE}.tmp"
+    index_tmp.unlink(missing_ok=True)
+
+    conn = sqlite3.connect(index_tmp, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(
+        "CREATE TABLE pages (id INTEGER PRIMARY KEY, title TEXT UNIQUE, url TEXT, refs TEXT)"
+    )
+    conn.execute(
+        "CREATE TABLE sections ("
+        "id INTEGER PRIMARY KEY, page_id INTEGER, name TEXT, anchor TEXT, offset INTEGER, "
+        "length INTEGER)"
+    )
+    # Contentless, the text is only kept in SECTIONS_FILE
+    conn.execute(
+        "CREATE VIRTUAL TABLE pages_fts USING fts5("
+        "title, text, content='', tokenize='porter unicode61')"
+    )
+
+    try:
+        with open(sections_tmp, "wb") as file:
+            conn.execute("BEGIN")
+            n_pages = _write_pages(conn, file, _parse_pages(extract, workers=workers))
+            conn.execute("CREATE INDEX sections_page ON sections (page_id)")
+            conn.execute("INSERT INTO pages_fts (pages_fts) VALUES ('optimize')")
+            conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    if n_pages == 0:
+        index_tmp.unlink()
+        sections_tmp.unlink()
+        raise ValueError(f"No pages found in {extract}")
+    os.replace(sections_tmp, path / SECTIONS_FILE)
+    os.replace(index_tmp, path / INDEX_FILE)
+    return n_pages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m ada.datasources.wiki_offline",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("extract", type=pathlib.Path)
+    parser.add_argument("--path", type=pathlib.Path, default=pathlib.Path(WIKI_OFFLINE_PATH))
+    parser.add_argument("--workers", type=int, default=1, help="Processes parsing pages")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    n_pages = build(args.extract, path=args.path, workers=args.workers)
+    print(f"Indexed {n_pages} pages into {args.path} in {time.perf_counter() - started:.1f}s")
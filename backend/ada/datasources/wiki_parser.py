@@ -0,0 +1,213 @@
+import re
+from typing import Dict, List, Tuple
+
+from lxml import etree
+
+
+CITATION_NUMBER = re.compile(r"\d+")
+HEADINGS = {"h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+# Matches BeautifulSoup's '.text', which does not count these as text
+NON_TEXT_TAGS = {"script", "style", "template"}
+# Between the headings of a nested section's path
+SECTION_SEPARATOR = "/"
+
+
+class WikiHTMLTarget:
+    """
+    lxml parser target that indexes a Wikipedia page in a single streaming pass, without
+    building a tree.
+
+    Collects:
+     - the paragraphs (text and citation numbers) under each h2 section, starting with "Summary"
+     - the paragraphs under nested h3-h6 sections, keyed by their path, i.e. "History/Early life"
+     - image captions for every figure, keyed by the image src
+
+    Both the legacy heading markup (<h2><span class="mw-headline">...) and the current markup
+    (<div class="mw-heading"><h2>...) are understood.
+    """
+
+    def __init__(self):
+        self.sections = {"Summary": []}
+        self.nested_sections = {}
+        self.image_captions = {}
+
+        self._depth = 0
+        self._non_text_depth = 0
+        self._section = "Summary"
+        self._heading_path = []
+
+        # The first element in the body holds the page content (div.mw-parser-output)
+        self._container_depth = None
+
+        self._paragraph = None
+        self._paragraph_depth = None
+        self._citation = None
+        self._citation_depth = None
+
+        self._heading = None
+        self._heading_level = None
+        self._heading_depth = None
+        self._heading_span_depth = None
+        self._heading_span_seen = False
+        self._heading_wrapper_depth = None
+
+        self._figure_depth = None
+        self._figure_src = None
+        self._figure_caption = None
+        self._figure_a_depth = None
+        self._figure_a_seen = False
+        self._figure_caption_depth = None
+        self._figure_caption_seen = False
+
+    def _is_top_level(self) -> bool:
+        return self._container_depth is not None and self._depth == self._container_depth + 1
+
+    def start(self, tag, attrib):
+        self._depth += 1
+
+        if tag in NON_TEXT_TAGS:
+            self._non_text_depth += 1
+
+        if self._container_depth is None and self._depth == 3:
+            self._container_depth = self._depth
+            return
+
+        if self._is_top_level():
+            if tag == "p":
+                self._paragraph = {"text": [], "citations": []}
+                self._paragraph_depth = self._depth
+            elif tag in HEADINGS:
+                self._start_heading(level=HEADINGS[tag], legacy=True)
+            elif tag == "div" and "mw-heading" in attrib.get("class", "").split():
+                self._heading_wrapper_depth = self._depth
+        elif self._heading_wrapper_depth is not None and self._heading is None:
+            if tag in HEADINGS:
+                self._start_heading(level=HEADINGS[tag], legacy=False)
+        elif self._heading is not None and tag == "span" and not self._heading_span_seen:
+            self._heading_span_seen = True
+            self._heading_span_depth = self._depth
+
+        if self._paragraph is not None and self._citation is None and tag == "sup":
+            if "reference" in attrib.get("class", "").split():
+                self._citation = []
+                self._citation_depth = self._depth
+
+        if tag == "figure" and self._figure_depth is None:
+            self._figure_depth = self._depth
+            self._figure_src = None
+            self._figure_caption = None
+            self._figure_a_seen = False
+            self._figure_caption_seen = False
+        elif self._figure_depth is not None:
+            if tag == "a" and not self._figure_a_seen:
+                self._figure_a_seen = True
+                self._figure_a_depth = self._depth
+            elif tag == "img" and self._figure_a_depth is not None and self._figure_src is None:
+                self._figure_src = attrib.get("src")
+            elif tag == "figcaption" and not self._figure_caption_seen:
+                self._figure_caption_seen = True
+                self._figure_caption = []
+                self._figure_caption_depth = self._depth
+
+    def _start_heading(self, level: int, legacy: bool):
+        # Legacy headings hold the title in their first span, the rest is the '[edit]' link
+        self._heading = {"text": [], "span": [], "legacy": legacy}
+        self._heading_level = level
+        self._heading_depth = self._depth
+
+    def data(self, data):
+        if self._non_text_depth:
+            return
+        if self._paragraph is not None:
+            self._paragraph["text"].append(data)
+            if self._citation is not None:
+                self._citation.append(data)
+        if self._heading is not None:
+            self._heading["text"].append(data)
+            if self._heading_span_depth is not None:
+                self._heading["span"].append(data)
+        if self._figure_caption_depth is not None:
+            self._figure_caption.append(data)
+
+    def end(self, tag):
+        depth = self._depth
+        self._depth -= 1
+
+        if tag in NON_TEXT_TAGS:
+            self._non_text_depth -= 1
+
+        if depth == self._citation_depth:
+            number = CITATION_NUMBER.search("".join(self._citation))
+            self._paragraph["citations"].append(int(number.group()) if number else None)
+            self._citation = None
+            self._citation_depth = None
+
+        if depth == self._heading_span_depth:
+            self._heading_span_depth = None
+
+        if depth == self._heading_depth:
+            self._end_heading()
+
+        if depth == self._heading_wrapper_depth:
+            self._heading_wrapper_depth = None
+
+        if depth == self._paragraph_depth:
+            paragraph = {
+                "text": "".join(self._paragraph["text"]),
+                "citations": self._paragraph["citations"],
+            }
+            self.sections[self._section].append(paragraph)
+            if len(self._heading_path) > 1:
+                self.nested_sections[SECTION_SEPARATOR.join(self._heading_path)].append(paragraph)
+            self._paragraph = None
+            self._paragraph_depth = None
+
+        if depth == self._figure_a_depth:
+            self._figure_a_depth = None
+
+        if depth == self._figure_caption_depth:
+            self._figure_caption_depth = None
+
+        if depth == self._figure_depth:
+            if self._figure_src is not None and self._figure_caption is not None:
+                src = self._figure_src
+                if src.startswith("//"):
+                    src = "https:" + src
+                self.image_captions[src] = "".join(self._figure_caption)
+            self._figure_depth = None
+
+    def _end_heading(self):
+        heading = self._heading
+        if heading["legacy"] and heading["span"]:
+            title = "".join(heading["span"])
+        else:
+            title = "".join(heading["text"])
+
+        if self._heading_level == 2:
+            self._section = title
+            self._heading_path = [title]
+            self.sections[title] = []
+        else:
+            # Trim the path back to this heading's parent, i.e. an h3 after an h4
+            parent_path = self._heading_path[: self._heading_level - 2] or [self._section]
+            self._heading_path = parent_path + [title]
+            self.nested_sections[SECTION_SEPARATOR.join(self._heading_path)] = []
+
+        self._heading = None
+        self._heading_level = None
+        self._heading_depth = None
+        self._heading_span_depth = None
+        self._heading_span_seen = False
+
+    def close(self) -> Tuple[Dict[str, List[dict]], Dict[str, List[dict]], Dict[str, str]]:
+        return self.sections, self.nested_sections, self.image_captions
+
+
+def parse_wiki_html(
+    html: str,
+) -> Tuple[Dict[str, List[dict]], Dict[str, List[dict]], Dict[str, str]]:
+    """
+    Returns the h2 sections, nested sections and image captions of a Wikipedia page's html
+    """
+    parser = etree.HTMLParser(target=WikiHTMLTarget())
+    return etree.fromstring(html, parser)
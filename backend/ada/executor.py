@@ -0,0 +1,48 @@
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from ada.config import MAX_TOOL_WORKERS, MAX_PROCESS_WORKERS
+
+
+# Shared by every request in the worker, so blocking datasource work (downloads, parsing)
+# never runs on the event loop and can never spawn more than MAX_TOOL_WORKERS threads
+TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS, thread_name_prefix="ada-tool")
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(TOOL_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+
+# CPU heavy work (i.e. PDF text extraction) runs in separate processes so it does not hold the GIL.
+#   Created on first use, since most requests never need it
+_PROCESS_EXECUTOR = None
+# Forking the worker would copy its event loop, threads and locks (held or not) into the
+#   children, so they are started from a clean process instead
+_PROCESS_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def get_process_executor() -> ProcessPoolExecutor:
+    global _PROCESS_EXECUTOR
+    if _PROCESS_EXECUTOR is None:
+        _PROCESS_EXECUTOR = ProcessPoolExecutor(
+            max_workers=MAX_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context(_PROCESS_START_METHOD),
+        )
+    return _PROCESS_EXECUTOR
+
+
+async def run_in_process(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_executor(), func, *args)
+
+
+def shutdown_executors():
+    global _PROCESS_EXECUTOR
+    if _PROCESS_EXECUTOR is not None:
+        _PROCESS_EXECUTOR.shutdown(cancel_futures=True)
+        _PROCESS_EXECUTOR = None
@@ -0,0 +1,334 @@
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Awaitable, Callable, List, Optional, Set
+from uuid import uuid4
+
+from ada.config import (
+    JOB_WORKERS,
+    JOB_MAX_QUEUE,
+    JOB_RESULT_TTL,
+    JOB_CLEANUP_INTERVAL,
+    JOB_STORE_PATH,
+    JOB_LEASE_TTL,
+)
+from ada.executor import run_blocking
+from ada.metrics import JOB_QUEUE_DEPTH, JOBS
+from ada.models import JobResponse, JobStatus, QuestionRequest, QuestionResponse
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    def __init__(self, depth: int):
+        self.message = f"Job queue is full ({depth} jobs waiting). Please try again later"
+        super().__init__(self.message)
+
+
+class JobStore:
+    """
+    Keeps jobs, their requests and their results in a local SQLite file, so jobs outlive the
+    process that accepted them. Finished jobs expire 'ttl' seconds after they finish.
+
+    Every process sharing the file can run any queued job: a job is claimed by setting its
+    owner and lease in one UPDATE, so only one of them runs it. Its owner renews the lease
+    while running it, once the lease expires any of them may take it over.
+    """
+
+    def __init__(self, path: str, ttl: float, lease_ttl: float = JOB_LEASE_TTL):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.lease_ttl = lease_ttl
+        # Used from the executor's threads, one at a time
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT, request TEXT, response TEXT, error TEXT, "
+            "created_at REAL, updated_at REAL, expires_at REAL, owner TEXT, lease_until REAL)"
+        )
+        # Stores created before jobs had leases
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def create(self, job_id: str, request: QuestionRequest) -> bool:
+        """
+        Returns False if a job with this id already exists
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, status, request, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, JobStatus.QUEUED.value, request.model_dump_json(), now, now),
+            )
+        return cursor.rowcount == 1
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """
+        Marks the job as run by 'owner', returning False if it is not queued and not a running
+        job whose lease expired, i.e. another process got to it first
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, lease_until = ?, updated_at = ? "
+                "WHERE id = ? AND (status = ? OR (status = ? AND ifnull(lease_until, 0) < ?))",
+                (
+                    JobStatus.RUNNING.value,
+                    owner,
+                    now + self.lease_ttl,
+                    now,
+                    job_id,
+                    JobStatus.QUEUED.value,
+                    JobStatus.RUNNING.value,
+                    now,
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def renew(self, owner: str) -> int:
+        """
+        Extends the lease of every job 'owner' is running
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = ?",
+                (time.time() + self.lease_ttl, owner, JobStatus.RUNNING.value),
+            )
+        return cursor.rowcount
+
+    def _update(self, job_id: str, status: JobStatus, **columns):
+        now = time.time()
+        expires_at = now + self.ttl if status in (JobStatus.DONE, JobStatus.FAILED) else None
+        columns = {**columns, "status": status.value, "updated_at": now, "expires_at": expires_at}
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id)
+            )
+
+    def finish(self, job_id: str, response: QuestionResponse):
+        self._update(job_id, JobStatus.DONE, response=response.model_dump_json())
+
+    def fail(self, job_id: str, error: str):
+        self._update(job_id, JobStatus.FAILED, error=error)
+
+    def get(self, job_id: str) -> Optional[JobResponse]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, response, error, created_at, updated_at, expires_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            job_id, status, response, error, created_at, updated_at, expires_at = row
+            if expires_at is not None and expires_at < time.time():
+                return None
+            queue_position = None
+            if status == JobStatus.QUEUED.value:
+                # Across every process sharing the store
+                queue_position = self._conn.execute(
+                    "SELECT count(*) FROM jobs WHERE status = ? AND created_at < ?",
+                    (JobStatus.QUEUED.value, created_at),
+                ).fetchone()[0]
+
+        return JobResponse(
+            id=job_id,
+            status=JobStatus(status),
+            created_at=created_at,
+            updated_at=updated_at,
+            queue_position=queue_position,
+            response=json.loads(response) if response else None,
+            error=error,
+        )
+
+    def request(self, job_id: str) -> QuestionRequest:
+        with self._lock:
+            row = self._conn.execute("SELECT request FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return QuestionRequest.model_validate_json(row[0])
+
+    def unclaimed(self) -> List[str]:
+        """
+        The queued jobs, and the running ones whose lease expired
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? "
+                "OR (status = ? AND ifnull(lease_until, 0) < ?) ORDER BY created_at",
+                (JobStatus.QUEUED.value, JobStatus.RUNNING.value, time.time()),
+            )
+            return [row[0] for row in rows]
+
+    def expire(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM jobs WHERE expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """
+    Runs jobs on a fixed pool of workers, refusing new jobs once 'max_queue' are waiting.
+
+    On 'start', which also opens the store, and every lease renewal after it, the queued jobs
+    and the running ones whose lease expired are picked up, whichever process accepted them.
+    Each is claimed in the store before it runs, so a job is only run by one process at a time.
+    Only use it from the event loop it was started on, so the depth check and the reservation
+    in 'submit' happen together. The store's calls run on the executor.
+    """
+
+    def __init__(
+        self,
+        store_path: str = JOB_STORE_PATH,
+        ttl: float = JOB_RESULT_TTL,
+        n_workers: int = JOB_WORKERS,
+        max_queue: int = JOB_MAX_QUEUE,
+        cleanup_interval: float = JOB_CLEANUP_INTERVAL,
+        lease_ttl: float = JOB_LEASE_TTL,
+    ):
+        self.store_path = store_path
+        self.ttl = ttl
+        self.n_workers = n_workers
+        self.max_queue = max_queue
+        self.cleanup_interval = cleanup_interval
+        self.lease_ttl = lease_ttl
+        # Unique to this process (and start), so leases tell processes apart
+        self.owner: str = None
+
+        self.store: JobStore = None
+        self.handler: Callable[[QuestionRequest], Awaitable[QuestionResponse]] = None
+        self._queue: asyncio.Queue = None
+        self._waiting: List[str] = []
+        self._running: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, handler: Callable[[QuestionRequest], Awaitable[QuestionResponse]]):
+        # Once, before the app serves anything, so opening the store can block
+        self.store = JobStore(path=self.store_path, ttl=self.ttl, lease_ttl=self.lease_ttl)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.handler = handler
+        self._queue = asyncio.Queue()
+        self._waiting = []
+        self._running = set()
+
+        self._pick_up(self.store.unclaimed())
+        if self._waiting:
+            logger.info(f"Picked up {len(self._waiting)} unfinished jobs")
+
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.n_workers)]
+        self._tasks.append(asyncio.create_task(self._clean_up()))
+        self._tasks.append(asyncio.create_task(self._renew_leases()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.close()
+        self.store = None
+
+    def _pick_up(self, job_ids: List[str]):
+        for job_id in job_ids:
+            if job_id not in self._waiting and job_id not in self._running:
+                self._waiting.append(job_id)
+                self._queue.put_nowait(job_id)
+        JOB_QUEUE_DEPTH.set(len(self._waiting))
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiting)
+
+    async def submit(self, request: QuestionRequest) -> JobResponse:
+        job_id = str(request.id)
+        # Submitting the same request again returns the job it already started
+        if (job := await self.get(job_id)) is not None:
+            return job
+
+        if self.depth >= self.max_queue:
+            JOBS.inc(status="refused")
+            raise JobQueueFull(depth=self.depth)
+
+        # Its place is taken before awaiting the store, so concurrent submits can not all pass
+        #   the depth check
+        self._waiting.append(job_id)
+        try:
+            created = await run_blocking(self.store.create, job_id, request)
+        except BaseException:
+            self._waiting.remove(job_id)
+            raise
+        if created:
+            self._queue.put_nowait(job_id)
+        else:
+            # Submitted again meanwhile, the first submit queued it
+            self._waiting.remove(job_id)
+        JOB_QUEUE_DEPTH.set(len(self._waiting))
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Optional[JobResponse]:
+        return await run_blocking(self.store.get, job_id)
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            self._waiting.remove(job_id)
+            JOB_QUEUE_DEPTH.set(len(self._waiting))
+
+            if not await run_blocking(self.store.claim, job_id, self.owner):
+                # Another process is running (or ran) it
+                continue
+            self._running.add(job_id)
+            try:
+                request = await run_blocking(self.store.request, job_id)
+                response = await self.handler(request)
+                await run_blocking(self.store.finish, job_id, response)
+                JOBS.inc(status=JobStatus.DONE.value)
+            except asyncio.CancelledError:
+                # i.e. shutting down, the job is taken over once its lease expires
+                raise
+            except Exception as err:
+                logger.error(f"Job {job_id} failed: {traceback.format_exc()}")
+                await run_blocking(self.store.fail, job_id, error=str(err))
+                JOBS.inc(status=JobStatus.FAILED.value)
+            finally:
+                self._running.discard(job_id)
+
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await run_blocking(self.store.renew, self.owner)
+                # Jobs queued by other processes, or left by one that died
+                self._pick_up(await run_blocking(self.store.unclaimed))
+            except Exception:
+                logger.error(f"Renewing job leases failed: {traceback.format_exc()}")
+
+    async def _clean_up(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            n_expired = await run_blocking(self.store.expire)
+            if n_expired:
+                logger.info(f"Expired {n_expired} finished jobs")
+
+
+# The store is only opened (and created) once the app starts it, see 'start'
+JOB_QUEUE = JobQueue()
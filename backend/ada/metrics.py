@@ -0,0 +1,246 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+        pairs = list(zip(self.label_names, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = [f'{name}="{_escape(value)}"' for name, value in pairs]
+        return "{" + ",".join(escaped) + "}"
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name=name, description=description, label_names=label_names)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def total(self, **labels) -> float:
+        """
+        Sums every series matching 'labels', i.e. across the labels left out
+        """
+        indices = [self.label_names.index(name) for name in labels]
+        wanted = [str(value) for value in labels.values()]
+        with self._lock:
+            return sum(
+                value for key, value in self._values.items() if [key[i] for i in indices] == wanted
+            )
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{self._format_labels(key)} {value}" for key, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name=name, description=description, label_names=label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = {}
+        self._sums = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._counts:
+                self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            self._counts[key][bisect.bisect_left(self.buckets, value)] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(
+                    f"{self.name}_bucket{self._format_labels(key, {'le': le})} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {self._sums[key]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.register(
+    Histogram(
+        "ada_stage_duration_seconds",
+        "Time spent in each stage of answering a question",
+        label_names=("stage",),
+    )
+)
+DATASOURCE_SEARCH_DURATION = REGISTRY.register(
+    Histogram(
+        "ada_datasource_search_duration_seconds",
+        "Time spent in each datasource's search()",
+        label_names=("datasource",),
+    )
+)
+TOOL_CALL_DURATION = REGISTRY.register(
+    Histogram(
+        "ada_tool_call_duration_seconds",
+        "Time spent in each datasource's get_content()",
+        label_names=("datasource",),
+    )
+)
+COMPLETION_DURATION = REGISTRY.register(
+    Histogram(
+        "ada_openai_completion_duration_seconds",
+        "Time spent waiting on each OpenAI chat completion",
+        label_names=("purpose", "model"),
+    )
+)
+OPENAI_TOKENS = REGISTRY.register(
+    Counter(
+        "ada_openai_tokens_total",
+        "Tokens sent to (in) and generated by (out) OpenAI",
+        label_names=("direction", "purpose"),
+    )
+)
+DATASOURCE_SEARCH_FAILURES = REGISTRY.register(
+    Counter(
+        "ada_datasource_search_failures_total",
+        "Datasource searches that failed (error) or missed their deadline (timeout)",
+        label_names=("datasource", "reason"),
+    )
+)
+TOOL_FAILURES = REGISTRY.register(
+    Counter("ada_tool_failures_total", "Tool calls that failed", label_names=("tool",))
+)
+PREFETCHES = REGISTRY.register(
+    Counter(
+        "ada_prefetch_total",
+        "Tool calls by whether their content was prefetched (hit), still being prefetched (wait) "
+        "or not prefetched (miss), and prefetches never used (unused)",
+        label_names=("datasource", "result"),
+    )
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter("ada_cache_requests_total", "Cache lookups by result", label_names=("cache", "result"))
+)
+REQUESTS_IN_FLIGHT = REGISTRY.register(
+    Gauge("ada_requests_in_flight", "Requests currently being answered", label_names=("endpoint",))
+)
+COALESCED_REQUESTS = REGISTRY.register(
+    Counter(
+        "ada_coalesced_requests_total",
+        "Requests that joined an identical request already in flight",
+        label_names=("endpoint",),
+    )
+)
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge("ada_job_queue_depth", "Jobs waiting for a worker"))
+JOBS = REGISTRY.register(
+    Counter("ada_jobs_total", "Jobs by how they ended (or were refused)", label_names=("status",))
+)
+RATE_LIMIT_WAIT = REGISTRY.register(
+    Histogram(
+        "ada_rate_limit_wait_seconds",
+        "Time spent waiting on a client side rate limiter before each request",
+        label_names=("limiter",),
+    )
+)
+RATE_LIMITED = REGISTRY.register(
+    Counter(
+        "ada_rate_limited_total",
+        "Responses rejected by a provider's rate limit (429)",
+        label_names=("limiter",),
+    )
+)
+OPENAI_HTTP_VERSIONS = REGISTRY.register(
+    Counter(
+        "ada_openai_responses_total",
+        "OpenAI responses by the HTTP version their connection negotiated",
+        label_names=("http_version",),
+    )
+)
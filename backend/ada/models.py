@@ -1,11 +1,11 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List, Dict
+from typing import Optional, List, Union
 
 from uuid import UUID, uuid4
 from enum import Enum
 
-from ada.config import MAX_TOKENS
-from ada.datasources.ds_engines import DatasourceEngines, DATASOURCE_RESOLVER
+from ada.config import MAX_TOKENS, BATCH_MAX_CONCURRENCY, BATCH_MAX_QUESTIONS, PREFETCH_RESOURCES
+from ada.datasources.ds_engines import DatasourceEngines, DATASOURCES
 from ada.datasources.references import ReferenceType
 
 
@@ -15,9 +15,17 @@ class ArticleLength(Enum):
     LONG = 3_200
 
 
-class InvalidDatasourceType(Exception):
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class InvalidDatasourceType(ValueError):
     def __init__(self, datasource):
         self.message = f"{datasource} is not a valid datasource engine."
+        super().__init__(self.message)
 
 
 class AgeNotValidError(Exception):
@@ -26,14 +34,17 @@ class AgeNotValidError(Exception):
 
 
 class DatasourceConfig(BaseModel):
-    engine: DatasourceEngines
+    # One of DatasourceEngines, or the name of a datasource installed as a plugin
+    engine: Union[DatasourceEngines, str]
     max_results: Optional[int] = 3
 
     @validator("engine", allow_reuse=True)
     def engine_resolver(cls, value):
-        if isinstance(value, DatasourceEngines):
-            return DATASOURCE_RESOLVER[value.value]
-        raise InvalidDatasourceType(datasource=value.value)
+        # Only the name is checked and kept, the engine is imported once a communicator uses it
+        name = value.value if isinstance(value, DatasourceEngines) else value
+        if name not in DATASOURCES:
+            raise InvalidDatasourceType(datasource=name)
+        return name
 
 
 class AnswerConfig(BaseModel):
@@ -46,6 +57,8 @@ class AnswerConfig(BaseModel):
         DatasourceConfig(engine=DatasourceEngines.WIKI),
         DatasourceConfig(engine=DatasourceEngines.IMAGE),
     ]
+    # How many of the likeliest resources to fetch while the model decides, 0 turns it off
+    prefetch: Optional[int] = Field(default=PREFETCH_RESOURCES, ge=0)
 
 
 class QuestionRequest(BaseModel):
@@ -82,3 +95,20 @@ class GPTArticleResponse(BaseModel):
 class QuestionResponse(BaseModel):
     article: GPTArticleResponse
     references: List[Reference]
+
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[QuestionRequest] = Field(max_length=BATCH_MAX_QUESTIONS)
+    max_concurrency: Optional[int] = Field(
+        default=BATCH_MAX_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY
+    )
+
+
+class JobResponse(BaseModel):
+    id: str
+    status: JobStatus
+    created_at: float
+    updated_at: float
+    queue_position: Optional[int] = None
+    response: Optional[QuestionResponse] = None
+    error: Optional[str] = None
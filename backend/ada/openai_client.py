@@ -0,0 +1,100 @@
+import asyncio
+import importlib.util
+import logging
+
+import httpx
+from openai import AsyncOpenAI, DEFAULT_TIMEOUT
+
+from ada.config import (
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_KEEPALIVE_TIMEOUT,
+    OPENAI_MAX_RETRIES,
+)
+from ada.metrics import OPENAI_HTTP_VERSIONS
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional 'h2' package, installed by httpx[http2] in requirements.in. Without
+#   it the client stays on HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class RateLimitedAsyncOpenAI(AsyncOpenAI):
+    """
+    Retries like AsyncOpenAI (timeouts, connection errors, 408, 409 and 5xx), except for rate
+    limited responses, which are left to OPENAI_LIMITER so every communicator backs off together
+    """
+
+    def _should_retry(self, response: httpx.Response) -> bool:
+        if response.status_code == 429:
+            return False
+        return super()._should_retry(response)
+
+
+class OpenAIClient:
+    """
+    A single AsyncOpenAI client shared by every communicator for the lifetime of the app, so
+    connections to OpenAI are pooled and kept alive across requests (multiplexed over HTTP/2
+    when 'h2' is installed).
+
+    Rate limited calls are retried by OPENAI_LIMITER instead of the client, so every
+    communicator backs off together. Anything else the client retries itself, 'max_retries' times.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections: int = OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_timeout: float = OPENAI_KEEPALIVE_TIMEOUT,
+        http2: bool = HTTP2_AVAILABLE,
+        max_retries: int = OPENAI_MAX_RETRIES,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_timeout,
+        )
+        self.http2 = http2
+        self.max_retries = max_retries
+
+        self._client = None
+        self._loop = None
+
+    @staticmethod
+    async def _count_http_version(response: httpx.Response):
+        # What was actually negotiated, OpenAI may still answer over HTTP/1.1
+        OPENAI_HTTP_VERSIONS.inc(http_version=response.http_version)
+
+    def _create_client(self) -> AsyncOpenAI:
+        http_client = httpx.AsyncClient(
+            limits=self.limits,
+            timeout=DEFAULT_TIMEOUT,
+            http2=self.http2,
+            event_hooks={"response": [self._count_http_version]},
+        )
+        return RateLimitedAsyncOpenAI(max_retries=self.max_retries, http_client=http_client)
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # Created lazily as well, so communicators still work outside of the app (i.e. notebooks)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed() or self._loop is not loop:
+            self._client = self._create_client()
+            self._loop = loop
+        return self._client
+
+    async def start(self):
+        logger.info(f"Starting shared OpenAI client (HTTP/2: {self.http2})")
+        # Binds the pooled client to the app's event loop
+        self.client
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed():
+            logger.info("Closing shared OpenAI client")
+            await self._client.close()
+        self._client = None
+        self._loop = None
+
+
+OPENAI_CLIENT = OpenAIClient()
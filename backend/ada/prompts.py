@@ -0,0 +1,110 @@
+import json
+import string
+from collections import OrderedDict
+from functools import cached_property
+from typing import Callable, Dict, Tuple
+
+import tiktoken
+
+from ada import DEFAULT_MODEL
+from ada.config import PROMPT_CACHE_MAX_ENTRIES
+from ada.models import GPTArticleResponse
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+class PromptTemplate:
+    """
+    A system message template with its static fields (i.e. the JSON schema) filled in.
+
+    Everything before the first per-request field is rendered, and its tokens counted, once. So
+    rendering only formats (and counts) the short rest of the template
+    """
+
+    def __init__(self, template: str, static: Dict[str, str], count: Callable[[str], int]):
+        prefix, rest = [], []
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            if not rest:
+                prefix.append(literal)
+            else:
+                rest.append(_escape(literal))
+
+            if field is None:
+                continue
+            elif field in static:
+                value = format(static[field], spec or "")
+                if not rest:
+                    prefix.append(value)
+                else:
+                    rest.append(_escape(value))
+            else:
+                conversion = f"!{conversion}" if conversion else ""
+                spec = f":{spec}" if spec else ""
+                rest.append(f"{{{field}{conversion}{spec}}}")
+
+        self.prefix = "".join(prefix)
+        self.rest = "".join(rest)
+        self.count = count
+        self.prefix_tokens = count(self.prefix)
+
+    def render(self, **fields) -> Tuple[str, int]:
+        """
+        Returns the prompt and (about) how many tokens it is
+        """
+        rest = self.rest.format(**fields)
+        return self.prefix + rest, self.prefix_tokens + self.count(rest)
+
+
+class PromptRegistry:
+    """
+    Compiles each system message template once, and keeps the last 'max_entries' prompts
+    rendered from them, so setting up a communicator for a request does not render or count
+    the same long prompt again
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL, max_entries: int = PROMPT_CACHE_MAX_ENTRIES):
+        self.model = model
+        self.max_entries = max_entries
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._rendered: OrderedDict = OrderedDict()
+
+    @cached_property
+    def schema_json(self) -> str:
+        return json.dumps(GPTArticleResponse.model_json_schema(), indent=2)
+
+    @cached_property
+    def encoder(self) -> tiktoken.Encoding:
+        return tiktoken.encoding_for_model(self.model)
+
+    def count(self, text: str) -> int:
+        return len(self.encoder.encode(text))
+
+    def template(self, template: str) -> PromptTemplate:
+        compiled = self._templates.get(template)
+        if compiled is None:
+            compiled = PromptTemplate(
+                template, static={"json_schema": self.schema_json}, count=self.count
+            )
+            self._templates[template] = compiled
+        return compiled
+
+    def render(self, template: str, **fields) -> Tuple[str, int]:
+        """
+        Returns the prompt and its number of tokens, i.e. for (age, experience, length)
+        """
+        key = (template, tuple(sorted(fields.items())))
+        rendered = self._rendered.get(key)
+        if rendered is not None:
+            self._rendered.move_to_end(key)
+            return rendered
+
+        rendered = self.template(template).render(**fields)
+        self._rendered[key] = rendered
+        if len(self._rendered) > self.max_entries:
+            self._rendered.popitem(last=False)
+        return rendered
+
+
+PROMPTS = PromptRegistry()
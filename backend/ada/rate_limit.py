@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from ada.config import (
+    OPENAI_REQUESTS_PER_SECOND,
+    OPENAI_TOKENS_PER_MINUTE,
+    CSE_QUERIES_PER_SECOND,
+    RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_BACKOFF_BASE,
+    RATE_LIMIT_BACKOFF_MAX,
+)
+from ada.metrics import RATE_LIMIT_WAIT, RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# After a 429 the request rate is halved, down to at most this fraction of the configured rate,
+#   and every success adds back this fraction of it
+MIN_RATE_FRACTION = 0.1
+RATE_INCREASE = 0.05
+
+
+class RateLimited(Exception):
+    def __init__(self, limiter: str, retry_after: Optional[float] = None):
+        self.retry_after = retry_after
+        self.message = f"{limiter} rate limit was hit"
+        if retry_after is not None:
+            self.message += f", retry after {retry_after}s"
+        super().__init__(self.message)
+
+
+class TokenBucket:
+    """
+    Refills at 'rate' tokens a second, holding at most 'capacity'
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until 'amount' tokens are available (anything over 'capacity' waits for a full
+        bucket)
+        """
+        self._refill()
+        return max(min(amount, self.capacity) - self.tokens, 0) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Keeps every request to one provider, from every concurrent communicator, within its limits:
+    'requests_per_second' and optionally 'tokens_per_minute'.
+
+    'run' waits for capacity, then retries whatever raises RateLimited with jittered exponential
+    backoff. A rate limited response pauses every caller, not just the one that got it, and halves
+    the request rate, which then creeps back up to 'requests_per_second' with every success.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_second: float,
+        burst: float = None,
+        tokens_per_minute: float = None,
+        max_retries: int = RATE_LIMIT_MAX_RETRIES,
+        backoff_base: float = RATE_LIMIT_BACKOFF_BASE,
+        backoff_max: float = RATE_LIMIT_BACKOFF_MAX,
+    ):
+        self.name = name
+        self.requests_per_second = requests_per_second
+        self.burst = burst or requests_per_second
+        self.requests = TokenBucket(rate=requests_per_second, capacity=self.burst)
+        self.tokens = (
+            TokenBucket(rate=tokens_per_minute / 60, capacity=tokens_per_minute)
+            if tokens_per_minute
+            else None
+        )
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._paused_until = 0.0
+        self._slowed_at = 0.0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.rate_limited = 0
+        self.retries = 0
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """
+        Waits until a request costing 'tokens' can be made, returning how long that took.
+
+        Waiters check again after sleeping, so a pause or a lower rate applies to them too
+        """
+        start = time.monotonic()
+        waited = False
+        while True:
+            delay = max(self._paused_until - time.monotonic(), self.requests.wait_time(1))
+            if self.tokens is not None and tokens:
+                delay = max(delay, self.tokens.wait_time(tokens))
+            if delay <= 0:
+                break
+            waited = True
+            await asyncio.sleep(delay)
+
+        self.requests.take(1)
+        if self.tokens is not None and tokens:
+            self.tokens.take(tokens)
+
+        elapsed = time.monotonic() - start
+        if waited:
+            self.waits += 1
+            self.wait_time += elapsed
+        RATE_LIMIT_WAIT.observe(elapsed, limiter=self.name)
+        return elapsed
+
+    def _adapt(self, rate: float):
+        rate = min(
+            max(rate, self.requests_per_second * MIN_RATE_FRACTION), self.requests_per_second
+        )
+        self.requests._refill()
+        self.requests.rate = rate
+        self.requests.capacity = max(self.burst * rate / self.requests_per_second, 1)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Full jitter, so the callers that were limited together do not all retry together
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    async def run(self, func: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        attempt = 0
+        while True:
+            await self.acquire(tokens=tokens)
+            sent = time.monotonic()
+            try:
+                result = await func()
+            except RateLimited as err:
+                self.rate_limited += 1
+                RATE_LIMITED.inc(limiter=self.name)
+                # Requests sent before the rate was last lowered were sent too fast for that rate,
+                #   not this one
+                if sent > self._slowed_at:
+                    self._slowed_at = time.monotonic()
+                    self._adapt(self.requests.rate / 2)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, retry_after=err.retry_after)
+                logger.warning(f"{err.message}, retrying in {delay:.2f}s (attempt {attempt + 1})")
+                self.retries += 1
+                attempt += 1
+            else:
+                if self.requests.rate < self.requests_per_second:
+                    self._adapt(self.requests.rate + self.requests_per_second * RATE_INCREASE)
+                return result
+
+    def stats(self) -> dict:
+        return {
+            "waits": self.waits,
+            "wait_time": round(self.wait_time, 4),
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "requests_per_second": round(self.requests.rate, 3),
+        }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Only the delay in seconds form is used by the providers limited here
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Shared by every communicator and datasource in the worker
+OPENAI_LIMITER = RateLimiter(
+    "openai",
+    requests_per_second=OPENAI_REQUESTS_PER_SECOND,
+    tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+)
+CSE_LIMITER = RateLimiter("cse", requests_per_second=CSE_QUERIES_PER_SECOND)
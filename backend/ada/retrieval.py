@@ -0,0 +1,98 @@
+import logging
+import re
+from typing import Dict, List, Union
+
+import numpy as np
+
+from ada.config import PASSAGE_WORDS, PASSAGE_OVERLAP, RETRIEVAL_TOP_K, BM25_K1, BM25_B
+
+logger = logging.getLogger(__name__)
+
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+
+def chunk_text(
+    text: Union[str, Dict[int, str]], n_words: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP
+) -> List[dict]:
+    """
+    Cuts a document into overlapping passages of 'n_words' words. PDF text (a dict of pages) is
+    chunked page by page, and each passage keeps the page it came from.
+    """
+    pages = text.items() if isinstance(text, dict) else [(None, text)]
+    stride = max(n_words - overlap, 1)
+
+    passages = []
+    for page, page_text in pages:
+        words = (page_text or "").split()
+        if not words:
+            continue
+        for start in range(0, max(len(words) - overlap, 1), stride):
+            passage = {"passage": len(passages), "text": " ".join(words[start : start + n_words])}
+            if page is not None:
+                passage["page"] = page
+            passages.append(passage)
+    return passages
+
+
+def bm25_scores(
+    passages: List[str], query: List[str], k1: float = BM25_K1, b: float = BM25_B
+) -> np.ndarray:
+    """
+    Scores every passage against the query terms with Okapi BM25, treating the passages of one
+    document as the corpus. Only the query's terms are counted, so the term-frequency matrix is
+    (passages x query terms).
+    """
+    vocabulary = {term: i for i, term in enumerate(dict.fromkeys(query))}
+    if not passages or not vocabulary:
+        return np.zeros(len(passages))
+
+    lengths = np.empty(len(passages))
+    rows, columns = [], []
+    for i, passage in enumerate(passages):
+        tokens = tokenize(passage)
+        lengths[i] = len(tokens)
+        for token in tokens:
+            column = vocabulary.get(token)
+            if column is not None:
+                rows.append(i)
+                columns.append(column)
+
+    term_freq = np.zeros((len(passages), len(vocabulary)))
+    np.add.at(term_freq, (np.array(rows, dtype=int), np.array(columns, dtype=int)), 1)
+
+    doc_freq = np.count_nonzero(term_freq, axis=0)
+    idf = np.log((len(passages) - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
+
+    length_norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1))
+    weights = term_freq * (k1 + 1) / (term_freq + length_norm[:, None])
+    return weights @ idf
+
+
+def retrieve(content: dict, queries: List[str], top_k: int = RETRIEVAL_TOP_K) -> dict:
+    """
+    Replaces the 'text' of a tool payload with (up to) its 'top_k' passages most relevant to the
+    queries (i.e. the question and its search terms), kept in document order.
+
+    Payloads without text (images) or short enough to fit in 'top_k' passages are left as they are.
+    """
+    if not content.get("text"):
+        return content
+
+    passages = chunk_text(content["text"])
+    if len(passages) <= top_k:
+        return content
+
+    query = [token for text in queries for token in tokenize(text)]
+    scores = bm25_scores([passage["text"] for passage in passages], query=query)
+    best = np.argsort(-scores, kind="stable")[:top_k]
+    # Passages that share no terms with the query are only kept if nothing matches, in which case
+    #   the start of the document is the best guess
+    best = np.sort(best[scores[best] > 0]) if scores.any() else np.arange(top_k)
+
+    logger.info(f"Retrieved {len(best)} of {len(passages)} passages from '{content.get('title')}'")
+    return {**content, "text": [passages[i] for i in best]}
@@ -0,0 +1,44 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from ada.metrics import COALESCED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one shared task, whose result (or
+    exception) every caller receives.
+
+    Callers wait on the task through 'asyncio.shield', so a caller being cancelled (i.e. its
+    client disconnecting) does not cancel the work the other callers are waiting on.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            COALESCED_REQUESTS.inc(endpoint=self.name)
+            logger.info(f"Joining in-flight {self.name} request")
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Retrieve the exception, in case every caller was cancelled before it was raised
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Shared {self.name} request failed: {task.exception()!r}")
+
+    def __len__(self) -> int:
+        return len(self._tasks)
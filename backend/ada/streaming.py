@@ -0,0 +1,91 @@
+import json
+import re
+from typing import List
+
+
+SECTIONS_START = re.compile(r'"sections"\s*:\s*\[')
+TERMS_START = re.compile(r'"terms"\s*:\s*\[')
+NEXT_STRING = re.compile(r'\s*,?\s*("(?:[^"\\]|\\.)*")')
+
+
+class TermStreamParser:
+    """
+    Pulls each search term out of a '{"terms": [...]}' JSON as soon as its string is complete
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = None
+
+    def feed(self, chunk: str) -> List[str]:
+        self.buffer += chunk
+
+        if self._pos is None:
+            match = TERMS_START.search(self.buffer)
+            if match is None:
+                return []
+            self._pos = match.end()
+
+        terms = []
+        while (match := NEXT_STRING.match(self.buffer, self._pos)) is not None:
+            terms.append(json.loads(match.group(1)))
+            self._pos = match.end()
+        return terms
+
+
+class SectionStreamParser:
+    """
+    Pulls each complete section object out of a GPTArticleResponse JSON as it is being streamed,
+    so sections can be sent on before the rest of the article has been generated.
+
+    Every character is only scanned once, keeping track of string/escape state and brace depth.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = None
+        self._in_string = False
+        self._escape = False
+        self._depth = 0
+        self._start = None
+
+    def feed(self, chunk: str) -> List[dict]:
+        self.buffer += chunk
+
+        if self._pos is None:
+            match = SECTIONS_START.search(self.buffer)
+            if match is None:
+                return []
+            self._pos = match.end()
+
+        sections = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    try:
+                        sections.append(json.loads(buffer[self._start : i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._start = None
+        self._pos = len(buffer)
+        return sections
+
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,76 @@
+"""
+Runs the component benchmarks offline, on the fixtures in 'benchmarks/fixtures'.
+
+    cd backend
+    python -m benchmarks                       # compares against benchmarks/baseline.json, if saved
+    python -m benchmarks --save-baseline       # saves this run as the new baseline
+    python -m benchmarks -k wiki               # only the benchmarks with 'wiki' in their name
+
+Exits with 1 if any benchmark is slower, or allocates more, than the baseline allows.
+"""
+import argparse
+import logging
+import pathlib
+import sys
+
+from benchmarks import cases  # Registers the benchmarks
+from benchmarks.harness import (
+    BENCHMARKS,
+    SkipBenchmark,
+    find_regressions,
+    format_table,
+    load_baseline,
+    measure,
+    save_baseline,
+)
+
+DEFAULT_BASELINE = pathlib.Path(__file__).parent / "baseline.json"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("-k", "--filter", default="", help="Only run benchmarks matching this")
+    parser.add_argument("--baseline", type=pathlib.Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds to time each for")
+    parser.add_argument("--time-tolerance", type=float, default=0.25)
+    parser.add_argument("--memory-tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    # The datasources log every search and tool call
+    logging.disable(logging.INFO)
+
+    results = []
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        try:
+            func = setup()
+        except SkipBenchmark as err:
+            print(f"Skipping {name}: {err.message}", file=sys.stderr)
+            continue
+        results.append(measure(name=name, func=func, min_time=args.min_time))
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(format_table(results, baseline={}))
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline) if args.baseline.exists() else {}
+    print(format_table(results, baseline=baseline))
+
+    regressions = find_regressions(
+        results,
+        baseline=baseline,
+        time_tolerance=args.time_tolerance,
+        memory_tolerance=args.memory_tolerance,
+    )
+    if regressions:
+        print("\nRegressions:\n" + "\n".join(f" - {regression}" for regression in regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""
+The hot paths of answering a question, run on the checked-in fixtures so nothing touches the
+network.
+"""
+import asyncio
+import functools
+import json
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+from ada.config import ARXIV_MAX_PAGES
+from ada.datasources.cache import ARTICLE_CACHE, MemoryCacheBackend
+from benchmarks.harness import ChildProcess, SkipBenchmark, benchmark
+
+
+BACKEND_DIR = pathlib.Path(__file__).parent.parent
+FIXTURES_DIR = pathlib.Path(__file__).parent / "fixtures"
+QUESTION = "What is causing the sea level to rise?"
+SEARCH_TERMS = [QUESTION, "sea level rise", "glacier ice sheet melting", "ocean warming"]
+
+LOOP = asyncio.new_event_loop()
+
+
+def _fixture(name: str) -> str:
+    return (FIXTURES_DIR / name).read_text()
+
+
+def _search_results(engine: str) -> list:
+    return json.loads(_fixture("search_results.json"))[engine]
+
+
+def _wiki_page():
+    from ada.datasources.wiki import WikiPage
+
+    return WikiPage(
+        title="Climate change",
+        url="https://en.wikipedia.org/wiki/Climate_change",
+        html=_fixture("wiki_page.html"),
+        references=[f"https://example.com/reference/{i}" for i in range(300)],
+    )
+
+
+def _wiki_search():
+    from ada.datasources.wiki import WikiSearch
+
+    page = _wiki_page()
+    wiki = WikiSearch(search_terms=SEARCH_TERMS)
+    wiki._add_page(page)
+    wiki.results = [page.title]
+    return wiki
+
+
+def _with_results(source, engine: str):
+    # As if every fixture result had just been found, without searching anything
+    for rank, result in enumerate(_search_results(engine)):
+        result = {**result, "rank": rank}
+        source.results.append(result)
+        source._index_result(result)
+    return source
+
+
+def _general_search():
+    from ada.datasources.general import GeneralSearch
+
+    return _with_results(GeneralSearch(search_terms=SEARCH_TERMS), "general")
+
+
+@benchmark("wiki_page_parse")
+def wiki_page_parse():
+    return _wiki_page
+
+
+@benchmark("wiki_get_content")
+def wiki_get_content():
+    wiki = _wiki_search()
+    resources = wiki._get_resource_values()
+    return lambda: [wiki.get_content(resource) for resource in resources]
+
+
+@functools.lru_cache
+def _offline_wiki_dir(n_pages: int) -> tempfile.TemporaryDirectory:
+    """
+    Built once, and removed when the benchmarks exit
+    """
+    from ada.datasources.wiki_offline import build
+
+    # The fixture page under the search results' titles, and one named like the question
+    titles = [result["title"] for result in _search_results("general")] + ["Sea level rise"]
+    html = _fixture("wiki_page.html")
+    directory = tempfile.TemporaryDirectory(prefix="ada-wiki-")
+    path = pathlib.Path(directory.name)
+    with open(path / "extract.jsonl", "w") as file:
+        for i in range(n_pages):
+            title = titles[i % len(titles)] + (f" ({i})" if i >= len(titles) else "")
+            file.write(json.dumps({"title": title, "text": html, "externallinks": []}) + "\n")
+    build(path / "extract.jsonl", path=path)
+    return directory
+
+
+def _offline_wiki(n_pages: int = 200):
+    from ada.datasources.wiki_offline import OfflineWikiSearch, WikiDump
+
+    dump = WikiDump(_offline_wiki_dir(n_pages).name)
+    wiki = OfflineWikiSearch(search_terms=SEARCH_TERMS, dump=dump)
+    LOOP.run_until_complete(wiki.search())
+    return wiki
+
+
+@benchmark("wiki_offline_search")
+def wiki_offline_search():
+    wiki = _offline_wiki()
+    return lambda: [wiki.dump.search(term) for term in SEARCH_TERMS]
+
+
+@benchmark("wiki_offline_get_content")
+def wiki_offline_get_content():
+    wiki = _offline_wiki()
+    resources = wiki._get_resource_values()
+    return lambda: [wiki.get_content(resource) for resource in resources]
+
+
+@benchmark("wiki_tool_spec")
+def wiki_tool_spec():
+    wiki = _wiki_search()
+    return lambda: wiki.tool_spec
+
+
+@benchmark("article_parse")
+def article_parse():
+    from ada.datasources.general import WebSearchArticle
+
+    html = _fixture("article.html")
+
+    def parse():
+        article = WebSearchArticle(title="Climate", url="https://news.example.com/climate")
+        article._parse(html)
+        return article
+
+    return parse
+
+
+@benchmark("pdf_extract_text")
+def pdf_extract_text():
+    from ada.datasources.arxiv import extract_pdf_text
+
+    pdf = (FIXTURES_DIR / "paper.pdf").read_bytes()
+    return lambda: extract_pdf_text(pdf, ARXIV_MAX_PAGES)
+
+
+@benchmark("resource_match")
+def resource_match():
+    from ada.datasources.base import ResourceIndex
+
+    index = ResourceIndex()
+    for result in _search_results("general"):
+        index.add(result["title"], result)
+    titles = index.names()
+    # Tool calls usually ask for a resource as it was given, sometimes slightly changed
+    resources = titles + [title.lower() for title in titles] + [title[:-3] for title in titles]
+    return lambda: [index.get(resource) for resource in resources]
+
+
+@benchmark("general_get_content")
+def general_get_content():
+    general = _general_search()
+    # Every article is already cached, so only resolving the resource is timed
+    ARTICLE_CACHE.backend = MemoryCacheBackend(ttl=60 * 60, max_entries=1_000)
+    for _, article in general.index.items():
+        ARTICLE_CACHE.set(ARTICLE_CACHE.key(article.url), {**article.to_cache(), "text": "text"})
+    titles = general.index.names()
+
+    async def get_all():
+        return [await general.get_content(title) for title in titles]
+
+    return lambda: LOOP.run_until_complete(get_all())
+
+
+@benchmark("image_get_content")
+def image_get_content():
+    from ada.datasources.images import ImageWebSearch
+
+    images = _with_results(ImageWebSearch(search_terms=SEARCH_TERMS), "image")
+    titles = images.index.names()
+    return lambda: [images.get_content(title) for title in titles]
+
+
+@benchmark("general_tool_spec")
+def general_tool_spec():
+    general = _general_search()
+    return lambda: general.tool_spec
+
+
+@benchmark("arxiv_tool_spec")
+def arxiv_tool_spec():
+    from ada.datasources.arxiv import ArxivSearch
+
+    arxiv = _with_results(ArxivSearch(search_terms=SEARCH_TERMS), "arxiv")
+    return lambda: arxiv.tool_spec
+
+
+@benchmark("num_tokens")
+def num_tokens():
+    import tiktoken
+
+    from ada.communicator import AsyncCommunicator
+    from ada.models import GPTArticleResponse
+    from ada.system_messages import BASE_MESSAGE
+
+    try:
+        tiktoken.encoding_for_model("gpt-4")
+    except Exception as err:
+        raise SkipBenchmark(f"tiktoken's encoding is not cached and cannot be downloaded: {err}")
+
+    system_message = BASE_MESSAGE.format(
+        json_schema=json.dumps(GPTArticleResponse.model_json_schema(), indent=2),
+        age=27,
+        experience="Nurse",
+        min_resources=3,
+        max_resources=5,
+        article_length=3_200,
+    )
+    # Does not use the instance, which would need an OpenAI key to create
+    return lambda: AsyncCommunicator._get_num_tokens(None, system_message)
+
+
+@benchmark("communicator_setup")
+def communicator_setup():
+    import tiktoken
+
+    from ada.communicator import AsyncCommunicator
+    from ada.models import ArticleLength
+
+    try:
+        tiktoken.encoding_for_model("gpt-4")
+    except Exception as err:
+        raise SkipBenchmark(f"tiktoken's encoding is not cached and cannot be downloaded: {err}")
+
+    # What every request pays before its first OpenAI call, i.e. the system message and its tokens
+    return lambda: AsyncCommunicator(
+        age=27, experience="Nurse", article_length=ArticleLength.LONG, datasources=[]
+    )
+
+
+@benchmark("passage_retrieval")
+def passage_retrieval():
+    from ada.datasources.arxiv import extract_pdf_text
+    from ada.retrieval import retrieve
+
+    pdf = (FIXTURES_DIR / "paper.pdf").read_bytes()
+    content = {"text": extract_pdf_text(pdf, ARXIV_MAX_PAGES), "title": "Paper", "link": "link"}
+    return lambda: retrieve(content, queries=SEARCH_TERMS)
+
+
+@benchmark("answer_cache_lookup")
+def answer_cache_lookup():
+    from ada.answer_cache import QuestionIndex
+
+    titles = [result["title"].lower() for result in _search_results("general")]
+    index = QuestionIndex(max_entries=2_000, ttl=60 * 60)
+    for i in range(2_000):
+        index.add(key=str(i), context="context", question=f"what is {titles[i % len(titles)]} {i}")
+    return lambda: index.search(context="context", question=QUESTION.lower())
+
+
+# Imports the app in a fresh interpreter, then prints its peak RSS in bytes. On Linux from VmHWM:
+#   ru_maxrss carries over the peak of the process that forked it, here the benchmarks' own
+STARTUP_SCRIPT = """
+import ada.app
+{after}
+try:
+    with open("/proc/self/status") as status:
+        print(next(int(line.split()[1]) * 1024 for line in status if line.startswith("VmHWM:")))
+except FileNotFoundError:
+    import resource, sys
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(max_rss if sys.platform == "darwin" else max_rss * 1024)
+"""
+
+
+def _startup(after: str = ""):
+    script = STARTUP_SCRIPT.format(after=after)
+
+    def start() -> ChildProcess:
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return ChildProcess(max_rss=int(output.stdout.split()[-1]))
+
+    return start
+
+
+@benchmark("startup")
+def startup():
+    # What every worker pays before serving, the peak KiB column is the process' RSS
+    return _startup()
+
+
+@benchmark("startup_all_datasources")
+def startup_all_datasources():
+    # ... and once every built in datasource has been used
+    return _startup(
+        after="from ada.datasources.ds_engines import DATASOURCES\n"
+        "for name in DATASOURCES.names(): DATASOURCES.resolve(name)"
+    )
@@ -0,0 +1,221 @@
+"""
+Writes the offline fixtures the benchmarks run on. They are generated (seeded, so the output is
+always the same) rather than downloaded, but mirror the structure of the real responses:
+
+ - wiki_page.html: the html of a Wikipedia 'action=parse' response
+ - article.html: a news article page, for newspaper
+ - paper.pdf: a 30 page text PDF, like an arXiv paper
+ - search_results.json: Google Custom Search items for the general, image and arXiv engines
+
+    python -m benchmarks.fixtures.make_fixtures
+"""
+import json
+import pathlib
+import random
+
+
+FIXTURES_DIR = pathlib.Path(__file__).parent
+
+WORDS = (
+    "climate carbon ocean warming greenhouse gas emissions temperature ice sheet solar "
+    "atmosphere feedback model century human activity evidence data record sea level rise "
+    "methane forcing aerosol cloud vapour glacier drought rainfall satellite observation"
+).split()
+
+
+def _sentences(rand: random.Random, n: int) -> str:
+    sentences = []
+    for _ in range(n):
+        words = [rand.choice(WORDS) for _ in range(rand.randint(8, 20))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def make_wiki_html(rand: random.Random, n_sections: int = 12, n_paragraphs: int = 6) -> str:
+    def sentences(n):
+        parts = []
+        for _ in range(n):
+            words = [rand.choice(WORDS) for _ in range(rand.randint(8, 20))]
+            if rand.random() < 0.3:
+                words[3] = f'<a href="/wiki/{words[3]}" title="{words[3]}">{words[3]}</a>'
+            if rand.random() < 0.2:
+                words[5] = f"<b>{words[5]}</b>"
+            parts.append(" ".join(words).capitalize() + ".")
+            if rand.random() < 0.5:
+                n = rand.randint(1, 300)
+                parts.append(
+                    f'<sup id="cite_ref-{n}" class="reference">'
+                    f'<a href="#cite_note-{n}">&#91;{n}&#93;</a></sup>'
+                )
+        return " ".join(parts)
+
+    def heading(tag, title):
+        return (
+            f'<div class="mw-heading mw-heading{tag[1]}"><{tag} id="{title.replace(" ", "_")}">'
+            f'{title}</{tag}><span class="mw-editsection"><span class="mw-editsection-bracket">['
+            '</span><a href="/w/index.php?action=edit">edit</a><span class="mw-editsection-bracket">'
+            "]</span></span></div>\n"
+        )
+
+    def figure(i):
+        return (
+            '<figure class="mw-default-size" typeof="mw:File/Thumb">'
+            f'<a href="/wiki/File:Img{i}.png" class="mw-file-description">'
+            f'<img src="//upload.wikimedia.org/thumb/Img{i}.png" width="220" height="140" /></a>'
+            f"<figcaption>Caption {i}: {sentences(1)}</figcaption></figure>\n"
+        )
+
+    parts = ['<div class="mw-content-ltr mw-parser-output" lang="en" dir="ltr">']
+    parts.append(
+        '<style data-mw-deduplicate="TemplateStyles:r1">.mw-parser-output .hatnote{}</style>'
+        '<div role="note" class="hatnote">For other uses, see Climate (disambiguation).</div>\n'
+    )
+    parts.append(
+        '<table class="infobox"><tbody>'
+        + "".join(f"<tr><th>Key {i}</th><td>{sentences(1)}</td></tr>" for i in range(15))
+        + "</tbody></table>\n"
+    )
+    parts.extend(f"<p>{sentences(4)}\n</p>" for _ in range(3))
+
+    n_figures = 0
+    for s in range(n_sections):
+        parts.append(heading("h2", f"Section {s}"))
+        for p in range(n_paragraphs):
+            if rand.random() < 0.3:
+                parts.append(figure(n_figures))
+                n_figures += 1
+            parts.append(f"<p>{sentences(rand.randint(2, 6))}\n</p>")
+            if p == n_paragraphs // 2:
+                parts.append(heading("h3", f"Subsection {s}.{p}"))
+                parts.append(
+                    "<ul>" + "".join(f"<li>{sentences(1)}</li>" for _ in range(4)) + "</ul>"
+                )
+                parts.append(f"<p>{sentences(3)}</p>\n")
+
+    parts.append(
+        '<div class="reflist"><ol class="references">'
+        + "".join(f'<li id="cite_note-{i}">{sentences(1)}</li>' for i in range(300))
+        + "</ol></div></div>"
+    )
+    return "".join(parts)
+
+
+def make_article_html(rand: random.Random, n_paragraphs: int = 40) -> str:
+    nav = "".join(f'<li><a href="/section/{w}">{w.title()}</a></li>' for w in WORDS[:12])
+    paragraphs = "".join(
+        f"<p>{_sentences(rand, rand.randint(3, 7))}</p>\n" for _ in range(n_paragraphs)
+    )
+    related = "".join(f'<li><a href="/news/{i}">{_sentences(rand, 1)}</a></li>' for i in range(20))
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>What is driving climate change? | Science News</title>
+<meta property="og:title" content="What is driving climate change?">
+<meta name="author" content="Jane Doe">
+<meta property="article:published_time" content="2023-11-02T09:30:00Z">
+<meta name="keywords" content="climate, carbon, emissions">
+<script>window.dataLayer = [];</script>
+<style>body {{ font-family: serif; }}</style>
+</head>
+<body>
+<header><nav><ul>{nav}</ul></nav></header>
+<main>
+<article>
+<h1>What is driving climate change?</h1>
+<div class="byline">By <span class="author">Jane Doe</span>, November 2, 2023</div>
+{paragraphs}
+</article>
+<aside><h2>Related</h2><ul>{related}</ul></aside>
+</main>
+<footer><p>Copyright 2023 Science News. All rights reserved.</p></footer>
+</body>
+</html>
+"""
+
+
+def make_pdf(rand: random.Random, n_pages: int = 30, n_lines: int = 45) -> bytes:
+    pages = [
+        [" ".join(rand.choice(WORDS) for _ in range(12)) for _ in range(n_lines)]
+        for _ in range(n_pages)
+    ]
+    font_id = 3 + 2 * n_pages
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(n_pages))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>".encode(),
+    ]
+    for i, lines in enumerate(pages):
+        content = (
+            "BT /F1 11 Tf 50 750 Td 14 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        )
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(pdf))
+        pdf += f"{i + 1} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    pdf += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    )
+    return bytes(pdf)
+
+
+def make_search_results(rand: random.Random, n_items: int = 50) -> dict:
+    def title():
+        return " ".join(rand.choice(WORDS) for _ in range(rand.randint(4, 9))).title()
+
+    general, images, arxiv = [], [], []
+    for i in range(n_items):
+        general.append(
+            {
+                "kind": "customsearch#result",
+                "title": title(),
+                "link": f"https://news.example.com/{i}/article",
+                "displayLink": "news.example.com",
+                "snippet": _sentences(rand, 2),
+            }
+        )
+        images.append(
+            {
+                "kind": "customsearch#result",
+                "title": title(),
+                "link": f"https://images.example.com/{i}.jpg",
+                "mime": "image/jpeg",
+                "image": {"contextLink": f"https://images.example.com/{i}", "height": 600},
+            }
+        )
+        arxiv.append(
+            {
+                "kind": "customsearch#result",
+                "title": title(),
+                "link": f"https://arxiv.org/abs/2301.{i:05d}",
+                "pagemap": {
+                    "metatags": [{"citation_title": title(), "citation_arxiv_id": f"2301.{i:05d}"}]
+                },
+            }
+        )
+    return {"general": general, "image": images, "arxiv": arxiv}
+
+
+def main():
+    rand = random.Random(0)
+    (FIXTURES_DIR / "wiki_page.html").write_text(make_wiki_html(rand))
+    (FIXTURES_DIR / "article.html").write_text(make_article_html(rand))
+    (FIXTURES_DIR / "paper.pdf").write_bytes(make_pdf(rand))
+    (FIXTURES_DIR / "search_results.json").write_text(
+        json.dumps(make_search_results(rand), indent=2)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import gc
+import json
+import pathlib
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List
+
+
+class SkipBenchmark(Exception):
+    def __init__(self, reason: str):
+        self.message = reason
+        super().__init__(self.message)
+
+
+@dataclass
+class ChildProcess:
+    """
+    Returned by benchmarks that run in a fresh interpreter (i.e. startup), so their memory is
+    that process' peak RSS, in bytes, instead of what tracemalloc sees in this one
+    """
+
+    max_rss: int
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    median: float
+    min: float
+    repeats: int
+    peak_memory: int
+
+
+# Each benchmark is a setup function, returning the function to time
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def measure(
+    name: str, func: Callable[[], object], min_time: float = 0.5, max_repeats: int = 1_000
+) -> BenchmarkResult:
+    """
+    Times 'func' over as many runs as fit in 'min_time' (at least 5), then measures its peak
+    Python heap allocation in one more run with tracemalloc, which is left out of the timings.
+    Unless 'func' returns a ChildProcess, whose peak RSS is used instead
+    """
+    func()  # Warm up, i.e. imports and lazily built state
+
+    timings = []
+    gc.collect()
+    started = time.perf_counter()
+    while len(timings) < 5 or (
+        time.perf_counter() - started < min_time and len(timings) < max_repeats
+    ):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if isinstance(result, ChildProcess):
+        peak_memory = result.max_rss
+
+    return BenchmarkResult(
+        name=name,
+        median=statistics.median(timings),
+        min=min(timings),
+        repeats=len(timings),
+        peak_memory=peak_memory,
+    )
+
+
+def save_baseline(results: List[BenchmarkResult], path: pathlib.Path):
+    path.write_text(json.dumps({result.name: asdict(result) for result in results}, indent=2))
+
+
+def load_baseline(path: pathlib.Path) -> Dict[str, BenchmarkResult]:
+    return {
+        name: BenchmarkResult(**result) for name, result in json.loads(path.read_text()).items()
+    }
+
+
+def find_regressions(
+    results: List[BenchmarkResult],
+    baseline: Dict[str, BenchmarkResult],
+    time_tolerance: float,
+    memory_tolerance: float,
+) -> List[str]:
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        if result.median > base.median * (1 + time_tolerance):
+            regressions.append(
+                f"{result.name}: {result.median * 1e3:.3f} ms vs {base.median * 1e3:.3f} ms baseline"
+            )
+        if result.peak_memory > base.peak_memory * (1 + memory_tolerance):
+            regressions.append(
+                f"{result.name}: {result.peak_memory / 1024:.1f} KiB vs "
+                f"{base.peak_memory / 1024:.1f} KiB baseline peak memory"
+            )
+    return regressions
+
+
+def format_table(results: List[BenchmarkResult], baseline: Dict[str, BenchmarkResult]) -> str:
+    header = f"{'benchmark':<28}{'median ms':>12}{'min ms':>12}{'runs':>7}{'peak KiB':>12}"
+    if baseline:
+        header += f"{'time':>9}{'memory':>9}"
+    lines = [header, "-" * len(header)]
+
+    for result in results:
+        line = (
+            f"{result.name:<28}{result.median * 1e3:>12.3f}{result.min * 1e3:>12.3f}"
+            f"{result.repeats:>7}{result.peak_memory / 1024:>12.1f}"
+        )
+        base = baseline.get(result.name)
+        if base is not None:
+            # Relative to the baseline, i.e. 1.10x is 10% slower
+            line += f"{result.median / base.median:>8.2f}x"
+            line += f"{result.peak_memory / max(base.peak_memory, 1):>8.2f}x"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,138 @@
+"""
+End-to-end load test of /ask, without calling any paid or external API: starts the fake
+services (loadtest.fakes) and the app pointed at them, drives it with the workload
+(loadtest.loadgen) and prints the report.
+
+    cd backend
+    python -m loadtest --workload ../requests.jsonl --concurrency 8 --requests 100 \
+        --latency openai=lognormal:2,0.5 --latency wiki=const:0.05
+
+The app runs with a fresh cache directory and (unless --answer-cache) without the answer cache,
+so every question goes through the whole pipeline.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from loadtest.fakes import DEFAULT_LATENCIES, parse_latencies, parse_rate_limits
+from loadtest.loadgen import LoadGenerator, add_arguments, load_workload, write_json
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = pathlib.Path(__file__).parent.parent
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with {process.returncode} before starting")
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} did not start within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description=__doc__)
+    add_arguments(parser)
+    parser.add_argument("--app-port", type=int, default=8800)
+    parser.add_argument("--fakes-port", type=int, default=8900)
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        help="service=distribution, for the services " + ", ".join(DEFAULT_LATENCIES),
+    )
+    parser.add_argument("--tool-rounds", type=int, default=1)
+    parser.add_argument("--tool-calls-per-round", type=int, default=3)
+    parser.add_argument(
+        "--rate-limit",
+        action="append",
+        default=[],
+        help="service=requests a second the fakes answer 429 above (openai or cse)",
+    )
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache on")
+    parser.add_argument("--log-dir", type=pathlib.Path, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    parse_latencies(args.latency)
+    parse_rate_limits(args.rate_limit)
+    workload = load_workload(args.workload)
+    log_dir = args.log_dir or pathlib.Path(tempfile.mkdtemp(prefix="ada-loadtest-"))
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    fakes_url = f"http://127.0.0.1:{args.fakes_port}"
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"{fakes_url}/v1",
+        "OPENAI_API_KEY": "loadtest",
+        "GOOGLE_KEY": "loadtest",
+        "ADA_GOOGLE_SEARCH_URL": f"{fakes_url}/customsearch/v1",
+        "ADA_WIKI_API_URL": f"{fakes_url}/w/api.php",
+        "ADA_ARXIV_PDF_URL": f"{fakes_url}/pdf/{{paper_id}}",
+        "ADA_CACHE_DIR": str(log_dir / "cache"),
+    }
+    if not args.answer_cache:
+        env["ADA_ANSWER_CACHE_TTL"] = "0"
+
+    fakes_command = [sys.executable, "-m", "loadtest.fakes", "--port", str(args.fakes_port)]
+    fakes_command += [f"--latency={latency}" for latency in args.latency]
+    fakes_command += ["--tool-rounds", str(args.tool_rounds)]
+    fakes_command += ["--tool-calls-per-round", str(args.tool_calls_per_round)]
+    fakes_command += [f"--rate-limit={rate_limit}" for rate_limit in args.rate_limit]
+    app_command = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "ada.app:app",
+        "--port",
+        str(args.app_port),
+        "--log-level",
+        "warning",
+    ]
+
+    processes = []
+    try:
+        for name, command in (("fakes", fakes_command), ("app", app_command)):
+            log = open(log_dir / f"{name}.log", "w")
+            processes.append(
+                subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=log)
+            )
+        _wait_until_up(f"{fakes_url}/stats", processes[0])
+        app_url = f"http://127.0.0.1:{args.app_port}"
+        _wait_until_up(f"{app_url}/metrics", processes[1])
+        logger.info(f"Fakes and app are up, logs are in {log_dir}")
+
+        generator = LoadGenerator(
+            url=app_url,
+            workload=workload,
+            concurrency=args.concurrency,
+            n_requests=args.requests,
+            endpoint=args.endpoint,
+            timeout=args.timeout,
+        )
+        report = asyncio.run(generator.run())
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    print(report.format())
+    if args.json:
+        write_json(report, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+Local stand-ins for the APIs answering a question calls: OpenAI chat completions (streamed or
+not, with tool calls), Google Custom Search, the Wikipedia API, arXiv PDFs and the web articles
+the general search links to.
+
+Responses are replayed from 'loadtest/recordings' and the benchmark fixtures, after a delay drawn
+from each service's latency distribution, so a load test measures ada rather than the network.
+
+    python -m loadtest.fakes --port 8900 --latency openai=lognormal:2,0.5 --latency cse=const:0.1
+"""
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import pathlib
+import random
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from ada.datasources.search_engines import SearchEngines
+
+logger = logging.getLogger(__name__)
+
+RECORDINGS_DIR = pathlib.Path(__file__).parent / "recordings"
+FIXTURES_DIR = pathlib.Path(__file__).parent.parent / "benchmarks" / "fixtures"
+
+DEFAULT_LATENCIES = {
+    "openai": "lognormal:1.5,0.5",
+    "cse": "lognormal:0.25,0.3",
+    "wiki": "lognormal:0.15,0.3",
+    "arxiv": "lognormal:0.6,0.4",
+    "article": "lognormal:0.4,0.5",
+}
+
+
+class InvalidLatency(Exception):
+    def __init__(self, spec):
+        self.message = (
+            f"Latency '{spec}' is not valid. Use seconds, or one of 'const:s', 'uniform:low,high', "
+            "'normal:mean,sd' or 'lognormal:median,sigma'"
+        )
+        super().__init__(self.message)
+
+
+class Latency:
+    """
+    A distribution of response times in seconds, i.e. 'lognormal:0.8,0.5' has a median of 0.8s
+    """
+
+    def __init__(self, spec: str, seed: int = None):
+        self.spec = spec
+        self._random = random.Random(seed)
+        kind, _, args = spec.partition(":") if ":" in spec else ("const", "", spec)
+        try:
+            self.kind = kind
+            self.args = [float(arg) for arg in args.split(",")]
+        except ValueError:
+            raise InvalidLatency(spec=spec)
+        if kind not in ("const", "uniform", "normal", "lognormal"):
+            raise InvalidLatency(spec=spec)
+
+    def sample(self) -> float:
+        if self.kind == "const":
+            return self.args[0]
+        elif self.kind == "uniform":
+            return self._random.uniform(*self.args)
+        elif self.kind == "normal":
+            return max(self._random.gauss(*self.args), 0)
+        median, sigma = self.args
+        return self._random.lognormvariate(0, sigma) * median
+
+    async def wait(self) -> float:
+        delay = self.sample()
+        await asyncio.sleep(delay)
+        return delay
+
+
+def _stable_int(text: str) -> int:
+    return int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+
+
+class FakeServices:
+    def __init__(
+        self,
+        latencies: Dict[str, str] = None,
+        tool_rounds: int = 1,
+        tool_calls_per_round: int = 3,
+        rate_limits: Dict[str, float] = None,
+        seed: int = 0,
+    ):
+        latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+        self.latencies = {
+            name: Latency(spec, seed=seed + i) for i, (name, spec) in enumerate(latencies.items())
+        }
+        self.tool_rounds = tool_rounds
+        self.tool_calls_per_round = tool_calls_per_round
+
+        self.chat = json.loads((RECORDINGS_DIR / "chat.json").read_text())
+        self.search_results = json.loads((FIXTURES_DIR / "search_results.json").read_text())
+        self.wiki_html = (FIXTURES_DIR / "wiki_page.html").read_text()
+        self.article_html = (FIXTURES_DIR / "article.html").read_text()
+        self.pdf = (FIXTURES_DIR / "paper.pdf").read_bytes()
+
+        self.engines = {
+            SearchEngines.GENERAL.value: "general",
+            SearchEngines.ARXIVE.value: "arxiv",
+            SearchEngines.IMAGE.value: "image",
+            SearchEngines.WIKI.value: "general",
+        }
+        self.requests = {name: 0 for name in self.latencies}
+
+        # Requests a second above which a service answers 429, like the real APIs at peak
+        self.rate_limits = rate_limits or {}
+        self._recent = {name: collections.deque() for name in self.rate_limits}
+        self.rate_limited = {name: 0 for name in self.rate_limits}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_get("/customsearch/v1", self.custom_search)
+        app.router.add_get("/w/api.php", self.wiki_api)
+        app.router.add_get("/pdf/{paper_id}", self.arxiv_pdf)
+        app.router.add_get("/news/{article_id}", self.news_article)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    def _over_limit(self, name: str) -> Optional[web.Response]:
+        if name not in self.rate_limits:
+            return None
+        now = time.monotonic()
+        recent = self._recent[name]
+        while recent and recent[0] <= now - 1:
+            recent.popleft()
+        if len(recent) >= self.rate_limits[name]:
+            self.rate_limited[name] += 1
+            return web.json_response(
+                {"error": {"code": 429, "message": "Rate limit reached"}},
+                status=429,
+                headers={"Retry-After": "1"},
+            )
+        recent.append(now)
+        return None
+
+    # OpenAI
+
+    def _plan_turn(self, body: dict) -> dict:
+        """
+        Returns the assistant message for this turn: search terms, tool calls for the first
+        resources of each tool, or (once enough tool rounds have been made) the article
+        """
+        messages = body["messages"]
+        if not body.get("tools"):
+            if "search terms" in messages[0]["content"]:
+                return {"content": json.dumps(self.chat["search_terms"])}
+            # i.e. fixing the article's JSON
+            return {"content": json.dumps(self.chat["article"])}
+
+        rounds = sum(1 for message in messages if message.get("tool_calls"))
+        if rounds >= self.tool_rounds or body.get("tool_choice") == "none":
+            return {"content": json.dumps(self.chat["article"])}
+
+        tool_calls = []
+        tools = body["tools"]
+        for i in range(self.tool_calls_per_round):
+            function = tools[i % len(tools)]["function"]
+            resources = function["parameters"]["properties"]["resource"]["enum"]
+            if not resources:
+                continue
+            resource = resources[(rounds * self.tool_calls_per_round + i) % len(resources)]
+            tool_calls.append(
+                {
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {
+                        "name": function["name"],
+                        "arguments": json.dumps({"resource": resource}),
+                    },
+                }
+            )
+        return {"content": None, "tool_calls": tool_calls}
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests["openai"] += 1
+        if (limited := self._over_limit("openai")) is not None:
+            return limited
+        body = await request.json()
+        message = self._plan_turn(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+        delay = self.latencies["openai"].sample()
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            prompt_tokens = len(json.dumps(body["messages"])) // 4
+            completion_tokens = len(json.dumps(message)) // 4
+            return web.json_response(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", **message},
+                            "finish_reason": finish_reason,
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }
+            )
+
+        deltas = self._stream_deltas(message)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        # A fifth of the time goes to the first token, the rest is spread over the chunks
+        await asyncio.sleep(delay * 0.2)
+        for i, delta in enumerate(deltas):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": delta,
+                        "finish_reason": finish_reason if i == len(deltas) - 1 else None,
+                    }
+                ],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(delay * 0.8 / len(deltas))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    def _stream_deltas(message: dict, chunk_size: int = 24) -> List[dict]:
+        deltas = [{"role": "assistant", "content": ""}]
+        content = message.get("content") or ""
+        for i in range(0, len(content), chunk_size):
+            deltas.append({"content": content[i : i + chunk_size]})
+
+        for index, tool_call in enumerate(message.get("tool_calls") or []):
+            arguments = tool_call["function"]["arguments"]
+            deltas.append(
+                {
+                    "tool_calls": [
+                        {
+                            "index": index,
+                            "id": tool_call["id"],
+                            "type": "function",
+                            "function": {"name": tool_call["function"]["name"], "arguments": ""},
+                        }
+                    ]
+                }
+            )
+            for i in range(0, len(arguments), chunk_size):
+                deltas.append(
+                    {
+                        "tool_calls": [
+                            {
+                                "index": index,
+                                "function": {"arguments": arguments[i : i + chunk_size]},
+                            }
+                        ]
+                    }
+                )
+        return deltas
+
+    # Google Custom Search
+
+    async def custom_search(self, request: web.Request) -> web.Response:
+        self.requests["cse"] += 1
+        if (limited := self._over_limit("cse")) is not None:
+            return limited
+        await self.latencies["cse"].wait()
+
+        engine = self.engines.get(request.query.get("cx"), "general")
+        items = self.search_results[engine]
+        count = int(request.query.get("count", 10))
+        # Different queries find different (but always the same) results
+        offset = _stable_int(request.query.get("q", "")) % len(items)
+        results = [items[(offset + i) % len(items)] for i in range(count)]
+
+        if engine == "general":
+            # Articles are downloaded, so they have to be served from here too
+            origin = str(request.url.origin())
+            results = [
+                {**item, "link": f"{origin}/news/{item['link'].split('/')[-2]}"} for item in results
+            ]
+        return web.json_response({"kind": "customsearch#search", "items": results})
+
+    async def news_article(self, request: web.Request) -> web.Response:
+        self.requests["article"] += 1
+        await self.latencies["article"].wait()
+        return web.Response(text=self.article_html, content_type="text/html")
+
+    # Wikipedia
+
+    async def wiki_api(self, request: web.Request) -> web.Response:
+        self.requests["wiki"] += 1
+        await self.latencies["wiki"].wait()
+
+        action = request.query.get("action")
+        if action == "query":
+            term = request.query.get("srsearch", "")
+            return web.json_response({"query": {"search": [{"ns": 0, "title": term.title()}]}})
+        elif action == "parse":
+            title = request.query.get("page", "")
+            return web.json_response(
+                {
+                    "parse": {
+                        "title": title,
+                        "pageid": _stable_int(title),
+                        "text": self.wiki_html,
+                        "externallinks": [f"//example.com/reference/{i}" for i in range(300)],
+                    }
+                }
+            )
+        return web.json_response({"error": {"code": "badvalue"}}, status=400)
+
+    # arXiv
+
+    async def arxiv_pdf(self, request: web.Request) -> web.Response:
+        self.requests["arxiv"] += 1
+        await self.latencies["arxiv"].wait()
+        return web.Response(body=self.pdf, content_type="application/pdf")
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "latencies": {name: latency.spec for name, latency in self.latencies.items()},
+            }
+        )
+
+
+def parse_latencies(specs: List[str]) -> Dict[str, str]:
+    latencies = {}
+    for spec in specs:
+        name, _, latency = spec.partition("=")
+        if name not in DEFAULT_LATENCIES:
+            raise ValueError(f"Unknown service '{name}', use one of {list(DEFAULT_LATENCIES)}")
+        Latency(latency)  # Fails early if not valid
+        latencies[name] = latency
+    return latencies
+
+
+def parse_rate_limits(specs: List[str]) -> Dict[str, float]:
+    rate_limits = {}
+    for spec in specs:
+        name, _, limit = spec.partition("=")
+        if name not in ("openai", "cse"):
+            raise ValueError(f"Rate limits are only simulated for 'openai' and 'cse', not '{name}'")
+        rate_limits[name] = float(limit)
+    return rate_limits
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m loadtest.fakes", description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        help="service=distribution, for the services " + ", ".join(DEFAULT_LATENCIES),
+    )
+    parser.add_argument("--tool-rounds", type=int, default=1)
+    parser.add_argument("--tool-calls-per-round", type=int, default=3)
+    parser.add_argument(
+        "--rate-limit",
+        action="append",
+        default=[],
+        help="service=requests a second, answering 429 above it (openai or cse)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fakes = FakeServices(
+        latencies=parse_latencies(args.latency),
+        tool_rounds=args.tool_rounds,
+        tool_calls_per_round=args.tool_calls_per_round,
+        rate_limits=parse_rate_limits(args.rate_limit),
+        seed=args.seed,
+    )
+    web.run_app(fakes.app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
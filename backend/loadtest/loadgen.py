@@ -0,0 +1,323 @@
+"""
+Drives a running ada app with questions at a fixed concurrency, and reports throughput, latency
+percentiles and where the time went (from the app's /metrics).
+
+    python -m loadtest.loadgen --url http://127.0.0.1:8000 --workload ../requests.jsonl \
+        --concurrency 8 --requests 100
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import pathlib
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The histograms broken down in the report, by their label
+BREAKDOWNS = {
+    "ada_stage_duration_seconds": "stage",
+    "ada_datasource_search_duration_seconds": "datasource",
+    "ada_tool_call_duration_seconds": "datasource",
+    "ada_openai_completion_duration_seconds": "purpose",
+    "ada_rate_limit_wait_seconds": "limiter",
+}
+SAMPLE = re.compile(r"^(\w+?)(_bucket|_sum|_count)\{(.*)\} (\S+)$")
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def load_workload(path: pathlib.Path) -> List[dict]:
+    """
+    Reads QuestionRequests from a JSON lines file. Lines without a 'question' use their 'title',
+    so a backlog of requests (request_id, title, body) works as a workload too.
+    """
+    workload = []
+    for line in path.read_text().splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        if "question" in entry:
+            workload.append(entry)
+        elif "title" in entry:
+            workload.append({"question": entry["title"]})
+    if not workload:
+        raise ValueError(f"No questions found in {path}")
+    return workload
+
+
+@dataclass
+class RequestResult:
+    question: str
+    latency: float
+    status: int
+    first_event: Optional[float] = None
+    error: str = None
+
+
+@dataclass
+class LoadTestReport:
+    duration: float
+    results: List[RequestResult]
+    breakdowns: Dict[str, Dict[str, dict]] = field(default_factory=dict)
+
+    @property
+    def succeeded(self) -> List[RequestResult]:
+        return [result for result in self.results if result.status == 200 and not result.error]
+
+    def summary(self) -> dict:
+        latencies = np.array([result.latency for result in self.succeeded])
+        summary = {
+            "requests": len(self.results),
+            "failed": len(self.results) - len(self.succeeded),
+            "duration": self.duration,
+            "throughput": len(self.succeeded) / self.duration if self.duration else 0.0,
+        }
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            summary.update(mean=latencies.mean(), p50=p50, p95=p95, p99=p99, max=latencies.max())
+
+        first_events = [r.first_event for r in self.succeeded if r.first_event is not None]
+        if first_events:
+            summary["first_event_p50"], summary["first_event_p95"] = np.percentile(
+                first_events, [50, 95]
+            )
+        return summary
+
+    def format(self) -> str:
+        summary = self.summary()
+        lines = [
+            f"Requests:   {summary['requests']} ({summary['failed']} failed) "
+            f"in {summary['duration']:.1f}s",
+            f"Throughput: {summary['throughput']:.2f} answers/s",
+        ]
+        if "p50" in summary:
+            lines.append(
+                "Latency:    "
+                + "  ".join(
+                    f"{name} {summary[name]:.2f}s" for name in ("mean", "p50", "p95", "p99", "max")
+                )
+            )
+        if "first_event_p50" in summary:
+            lines.append(
+                f"First event: p50 {summary['first_event_p50']:.2f}s  "
+                f"p95 {summary['first_event_p95']:.2f}s"
+            )
+
+        for metric, rows in self.breakdowns.items():
+            if not rows:
+                continue
+            lines.append("")
+            lines.append(f"{metric:<52}{'count':>7}{'mean s':>9}{'~p50 s':>9}{'~p95 s':>9}")
+            for name, row in sorted(rows.items(), key=lambda item: -item[1]["sum"]):
+                lines.append(
+                    f"  {name:<50}{row['count']:>7}{row['mean']:>9.3f}"
+                    f"{row['p50']:>9.3f}{row['p95']:>9.3f}"
+                )
+
+        errors = defaultdict(int)
+        for result in self.results:
+            if result.error or result.status != 200:
+                errors[result.error or f"HTTP {result.status}"] += 1
+        if errors:
+            lines.append("")
+            lines.append("Errors:")
+            lines.extend(f"  {count} x {error}" for error, count in errors.items())
+        return "\n".join(lines)
+
+
+def parse_histograms(text: str) -> Dict[Tuple[str, str], dict]:
+    """
+    Reads the histograms to break down from Prometheus' text format, keyed by (metric, label)
+    """
+    histograms = defaultdict(lambda: {"buckets": {}, "sum": 0.0, "count": 0})
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if match is None or match.group(1) not in BREAKDOWNS:
+            continue
+        metric, suffix, labels, value = match.groups()
+        labels = dict(LABEL.findall(labels))
+        histogram = histograms[(metric, labels.get(BREAKDOWNS[metric], ""))]
+        if suffix == "_bucket":
+            histogram["buckets"][float(labels["le"])] = float(value)
+        elif suffix == "_sum":
+            histogram["sum"] = float(value)
+        else:
+            histogram["count"] = int(float(value))
+    return histograms
+
+
+def _bucket_quantile(buckets: Dict[float, float], quantile: float) -> float:
+    # Like Prometheus' histogram_quantile: linear interpolation within the bucket
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    if total == 0:
+        return 0.0
+    rank = quantile * total
+    lower, below = 0.0, 0.0
+    for bound in bounds:
+        if buckets[bound] >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * (rank - below) / max(buckets[bound] - below, 1e-12)
+        lower, below = bound, buckets[bound]
+    return lower
+
+
+def diff_histograms(
+    before: Dict[Tuple[str, str], dict], after: Dict[Tuple[str, str], dict]
+) -> Dict[str, Dict[str, dict]]:
+    breakdowns = defaultdict(dict)
+    for (metric, name), histogram in after.items():
+        previous = before.get((metric, name), {"buckets": {}, "sum": 0.0, "count": 0})
+        count = histogram["count"] - previous["count"]
+        if count <= 0:
+            continue
+        buckets = {
+            bound: value - previous["buckets"].get(bound, 0)
+            for bound, value in histogram["buckets"].items()
+        }
+        total = histogram["sum"] - previous["sum"]
+        breakdowns[metric][name] = {
+            "count": count,
+            "sum": total,
+            "mean": total / count,
+            "p50": _bucket_quantile(buckets, 0.5),
+            "p95": _bucket_quantile(buckets, 0.95),
+        }
+    return dict(breakdowns)
+
+
+class LoadGenerator:
+    def __init__(
+        self,
+        url: str,
+        workload: List[dict],
+        concurrency: int = 8,
+        n_requests: int = 100,
+        endpoint: str = "/ask",
+        timeout: float = 600,
+    ):
+        self.url = url.rstrip("/")
+        self.workload = workload
+        self.concurrency = concurrency
+        self.n_requests = n_requests
+        self.endpoint = endpoint
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def _scrape(self, session: aiohttp.ClientSession) -> Dict[Tuple[str, str], dict]:
+        try:
+            async with session.get(f"{self.url}/metrics") as response:
+                return parse_histograms(await response.text())
+        except aiohttp.ClientError as err:
+            logger.warning(f"Could not scrape {self.url}/metrics: {err}")
+            return {}
+
+    async def _ask(self, session: aiohttp.ClientSession, request: dict) -> RequestResult:
+        start = time.perf_counter()
+        first_event = None
+        try:
+            async with session.post(f"{self.url}{self.endpoint}", json=request) as response:
+                if self.endpoint.endswith("/stream"):
+                    error = None
+                    async for line in response.content:
+                        if first_event is None and line.startswith(b"event: section"):
+                            first_event = time.perf_counter() - start
+                        elif line.startswith(b"event: error"):
+                            error = "error event"
+                else:
+                    await response.read()
+                    error = None
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            status, error = 0, f"{type(err).__name__}: {err}"
+
+        return RequestResult(
+            question=request["question"],
+            latency=time.perf_counter() - start,
+            status=status,
+            first_event=first_event,
+            error=error,
+        )
+
+    async def run(self) -> LoadTestReport:
+        requests = itertools.islice(itertools.cycle(self.workload), self.n_requests)
+        results = []
+        connector = aiohttp.TCPConnector(limit=self.concurrency * 2)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=self.timeout) as session:
+            before = await self._scrape(session)
+
+            async def worker():
+                for request in requests:
+                    result = await self._ask(session, request)
+                    results.append(result)
+                    logger.info(
+                        f"[{len(results)}/{self.n_requests}] {result.status} "
+                        f"{result.latency:.2f}s {result.question[:60]}"
+                    )
+
+            start = time.perf_counter()
+            await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+            duration = time.perf_counter() - start
+
+            after = await self._scrape(session)
+
+        return LoadTestReport(
+            duration=duration, results=results, breakdowns=diff_histograms(before, after)
+        )
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--workload", type=pathlib.Path, required=True, help="JSON lines file")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--endpoint", default="/ask", choices=["/ask", "/ask/stream"])
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--json", type=pathlib.Path, help="Also write the report here")
+
+
+def write_json(report: LoadTestReport, path: pathlib.Path):
+    path.write_text(
+        json.dumps(
+            {
+                "summary": report.summary(),
+                "breakdowns": report.breakdowns,
+                "results": [result.__dict__ for result in report.results],
+            },
+            indent=2,
+            default=float,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m loadtest.loadgen", description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    add_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    generator = LoadGenerator(
+        url=args.url,
+        workload=load_workload(args.workload),
+        concurrency=args.concurrency,
+        n_requests=args.requests,
+        endpoint=args.endpoint,
+        timeout=args.timeout,
+    )
+    report = asyncio.run(generator.run())
+    print(report.format())
+    if args.json:
+        write_json(report, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import time
+
+from ada.answer_cache import AnswerCache, QuestionIndex
+from ada.datasources.cache import MemoryCacheBackend, SQLiteCacheBackend
+from ada.models import GPTArticleResponse, GPTArticleSection, QuestionRequest, QuestionResponse
+
+
+def _response(markdown: str) -> QuestionResponse:
+    section = GPTArticleSection(header="Answer", markdown=markdown, references=[])
+    return QuestionResponse(article=GPTArticleResponse(sections=[section]), references=[])
+
+
+def _sqlite_cache(path) -> AnswerCache:
+    backend = SQLiteCacheBackend(path=path, ttl=60 * 60, max_entries=100)
+    return AnswerCache(name="answer", backend=backend)
+
+
+def test_near_duplicate_found_after_reopening_sqlite_backend(tmp_path):
+    path = tmp_path / "answers.sqlite"
+    cache = _sqlite_cache(path)
+    cache.store(QuestionRequest(question="Why is the sky blue?"), _response("Scattering"))
+
+    reopened = _sqlite_cache(path)
+    assert reopened.stats()["indexed"] == 1
+
+    response = reopened.lookup(QuestionRequest(question="why is the sky blue"))
+    assert response.article.sections[0].markdown == "Scattering"
+    response = reopened.lookup(QuestionRequest(question="So, why is the sky blue?"))
+    assert response is not None
+    assert reopened.near_hits == 1
+
+
+def test_index_finds_the_most_similar_question_in_its_context():
+    index = QuestionIndex(max_entries=10, ttl=60)
+    index.add(key="blue", context="adult", question="why is the sky blue")
+    index.add(key="red", context="adult", question="why is mars red")
+    index.add(key="child", context="child", question="so why is the sky blue")
+
+    key, score = index.search(context="adult", question="so why is the sky blue")
+    assert key == "blue" and 0.75 < score < 1
+    assert index.search(context="adult", question="why is mars red")[1] > 0.999
+    assert index.search(context="teen", question="why is the sky blue") == (None, 0.0)
+
+
+def test_index_drops_expired_removed_and_oldest_entries():
+    index = QuestionIndex(max_entries=2, ttl=60)
+    index.add(key="old", context="c", question="why is the sky blue", added_at=time.time() - 61)
+    assert index.search(context="c", question="why is the sky blue") == (None, 0.0)
+
+    index.add(key="a", context="c", question="how do tides work")
+    index.add(key="b", context="c", question="what causes rain")
+    assert len(index) == 2
+    assert index.search(context="c", question="how do tides work")[0] == "a"
+
+    index.remove("a")
+    assert index.search(context="c", question="how do tides work")[0] == "b"
+
+
+def test_near_duplicate_is_only_shared_within_the_same_context():
+    cache = AnswerCache(name="answer", backend=MemoryCacheBackend(ttl=60, max_entries=10))
+    cache.store(QuestionRequest(question="Why is the sky blue?", age=30), _response("Adult"))
+
+    assert cache.lookup(QuestionRequest(question="So, why is the sky blue?", age=35)) is not None
+    assert cache.lookup(QuestionRequest(question="So, why is the sky blue?", age=8)) is None
+    assert cache.lookup(QuestionRequest(question="Why is Mars red?", age=30)) is None
+    assert cache.stats()["near_hits"] == 1 and cache.stats()["misses"] == 2
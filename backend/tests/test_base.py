@@ -0,0 +1,39 @@
+import pytest
+
+from ada.datasources.base import ResourceIndex, ResourceNotFound
+
+
+def _index() -> ResourceIndex:
+    index = ResourceIndex()
+    for name in ["Sea level rise", "Sea-level rise", "Climate change", "Ocean acidification"]:
+        index.add(name, name.upper())
+    return index
+
+
+def test_exact_then_normalized_lookup():
+    index = _index()
+    assert index.get("Sea-level rise") == ("Sea-level rise", "SEA-LEVEL RISE")
+    # Both normalize to "sea level rise", the first added wins
+    assert index.get("sea level  RISE!") == ("Sea level rise", "SEA LEVEL RISE")
+    assert index.get("climate_change") == ("Climate change", "CLIMATE CHANGE")
+
+
+def test_closest_name_within_the_cutoff():
+    index = _index()
+    assert index.get("Ocean acidfication")[0] == "Ocean acidification"
+    assert index.get("Climate changes")[0] == "Climate change"
+
+    with pytest.raises(ResourceNotFound):
+        index.get("Volcano")
+    with pytest.raises(ResourceNotFound):
+        # Shares trigrams, but not enough of them
+        index.get("Ocean")
+
+
+def test_add_keeps_the_first_item():
+    index = _index()
+    assert not index.add("Climate change", "other")
+    assert index.get("Climate change")[1] == "CLIMATE CHANGE"
+    assert len(index) == 4
+    assert "Climate change" in index and "climate change" not in index
+    assert index.names()[0] == "Sea level rise"
@@ -0,0 +1,51 @@
+from ada.datasources.cache import SQLiteCacheBackend
+
+
+def _backend(path, **kwargs) -> SQLiteCacheBackend:
+    return SQLiteCacheBackend(path=path, ttl=60 * 60, **{"max_entries": 100, **kwargs})
+
+
+def test_totals_are_shared_by_every_process(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    first, second = _backend(path), _backend(path)
+    first.set("a", "x" * 100)
+    second.set("b", "y")
+    second.set("a", "z")
+
+    assert len(first) == len(second) == 2
+    assert first.size() == second.size()
+
+    first.get("a")
+    first.set("expired", 1)
+    first._conn.execute("UPDATE cache SET expires_at = 0 WHERE key = 'expired'")
+    assert second.get("expired") is None
+    assert len(first) == 2
+
+
+def test_evicts_on_the_other_process_writes(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    first, second = _backend(path, max_entries=10), _backend(path, max_entries=10)
+    for i in range(6):
+        first.set(f"first{i}", i)
+    for i in range(6):
+        second.set(f"second{i}", i)
+
+    # The 11th entry, written by the other process, evicts down to 9, the oldest first
+    assert len(first) == 10
+    assert first.get("first0") is None and first.get("first1") is None
+    assert second.get("second5") == 5
+
+
+def test_hits_are_written_down_in_batches(tmp_path):
+    backend = _backend(tmp_path / "cache.sqlite", max_entries=10)
+    for i in range(10):
+        backend.set(str(i), i)
+    backend.get("0")
+
+    accessed = dict(backend._conn.execute("SELECT key, accessed_at FROM cache"))
+    assert accessed["0"] == min(accessed.values()), "the hit is not written yet"
+
+    # Before evicting, so the entry that was just used is kept
+    backend.set("10", 10)
+    assert backend.get("0") == 0
+    assert backend.get("1") is None
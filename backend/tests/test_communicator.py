@@ -0,0 +1,124 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from ada.communicator import AsyncCommunicator
+from ada.datasources.base import AsyncDatasource
+
+
+def _tool_call(call_id: str, name: str, **arguments):
+    function = SimpleNamespace(name=name, arguments=json.dumps(arguments))
+    return SimpleNamespace(id=call_id, function=function)
+
+
+def _communicator(content: dict) -> AsyncCommunicator:
+    communicator = AsyncCommunicator(age=30, experience="expert", top_k_passages=None)
+
+    async def get_content(resource: str) -> dict:
+        return dict(content)
+
+    communicator.function_mapping["wikipedia_search"] = get_content
+    return communicator
+
+
+def _tool_messages(communicator: AsyncCommunicator) -> list:
+    return [json.loads(m["content"]) for m in communicator.messages if m["role"] == "tool"]
+
+
+def test_over_budget_payload_fetched_twice_is_deduplicated():
+    text = " ".join(f"word{i}" for i in range(20_000))
+    communicator = _communicator({"title": "Sea level rise", "text": text, "link": "link"})
+    assert communicator.context.count(text) > communicator.context.max_tool_message_tokens
+
+    asyncio.run(
+        communicator._call_tools([_tool_call("1", "wikipedia_search", resource="Sea level rise")])
+    )
+    asyncio.run(
+        communicator._call_tools([_tool_call("2", "wikipedia_search", resource="Sea level rise")])
+    )
+
+    first, second = _tool_messages(communicator)
+    assert first["text"] != text, "the first payload is trimmed to its budget"
+    assert second["content"] == "Already provided as reference 0. Please use that reference"
+    assert len(communicator.refs_used) == 1
+
+
+def test_failed_tool_call_is_reported_to_the_model():
+    communicator = _communicator({})
+
+    async def fail(resource: str) -> dict:
+        raise RuntimeError("down")
+
+    communicator.function_mapping["wikipedia_search"] = fail
+    asyncio.run(communicator._call_tools([_tool_call("1", "wikipedia_search", resource="x")]))
+
+    (message,) = _tool_messages(communicator)
+    assert message["content"].startswith("Failed to execute")
+    assert communicator.refs_used == []
+
+
+class _Terms(AsyncDatasource):
+    def __init__(self, search_terms):
+        super().__init__(
+            name="terms",
+            description="",
+            resource_description="",
+            search_terms=search_terms,
+        )
+        self.searched = []
+
+    async def _search(self, search_terms=None):
+        pass
+
+    async def search(self, search_terms=None):
+        await asyncio.sleep(0.01)
+        self.searched.extend(self.search_terms if search_terms is None else search_terms)
+
+    def get_content(self, resource: str) -> dict:
+        return {}
+
+
+def _chunk(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+def _stream(*texts):
+    async def stream():
+        for text in texts:
+            yield _chunk(text)
+
+    return stream()
+
+
+def test_search_terms_failure_keeps_the_question_search():
+    communicator = AsyncCommunicator(age=30, experience="expert")
+    datasource = _Terms(search_terms=["sea level"])
+
+    async def fail(question):
+        raise RuntimeError("OpenAI is down")
+        yield
+
+    communicator._stream_search_terms = fail
+    asyncio.run(communicator._search_speculatively("sea level", datasources=[datasource]))
+
+    assert datasource.searched == ["sea level"]
+    assert communicator.retrieval_queries == ["sea level"]
+
+
+def test_malformed_search_terms_are_repaired():
+    communicator = AsyncCommunicator(age=30, experience="expert", n_search_terms=2)
+
+    async def create_completion(purpose, **kwargs):
+        return _stream("{'terms': ['ice', ", "'ocean', 'heat']}")
+
+    async def fix_json(json_string):
+        content = json.dumps({"terms": ["ice", "ocean", "heat"]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    communicator._create_completion = create_completion
+    communicator._fix_json = fix_json
+
+    async def terms():
+        return [term async for term in communicator._stream_search_terms("sea level")]
+
+    assert asyncio.run(terms()) == ["ice", "ocean"]
@@ -0,0 +1,71 @@
+import json
+
+from ada.context import TOKENS_PER_MESSAGE, TRUNCATED, ContextBudget
+
+
+def _words(n: int, prefix: str = "word") -> str:
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+def test_budget_and_usage():
+    context = ContextBudget(max_tokens=1_000, context_window=5_000, max_prompt_tokens=10_000)
+    assert context.budget == 4_000
+
+    n_tokens = context.add({"role": "user", "content": "Why is the sky blue?"})
+    assert n_tokens == TOKENS_PER_MESSAGE + context.count("Why is the sky blue?")
+    assert context.add({"role": "tool", "content": "x"}, n_content_tokens=10) == 14
+
+    context.set_tools([{"name": "wikipedia_search"}])
+    assert context.used == n_tokens + 14 + context.tools_tokens
+    assert context.remaining() == 4_000 - context.used
+
+
+def test_fit_leaves_payloads_within_budget_alone():
+    context = ContextBudget(max_tokens=1_000, max_tool_message_tokens=500)
+    content = {"title": "Short", "text": "A short page"}
+    assert context.fit(content) is content
+    image = {"title": "Image", "link": _words(1_000)}
+    assert context.fit(image) is image
+
+
+def test_fit_truncates_text_to_its_share():
+    context = ContextBudget(max_tokens=1_000, max_tool_message_tokens=500)
+    fitted = context.fit({"title": "Long", "text": _words(2_000)}, n_tools_left=1)
+    assert fitted["text"].endswith(TRUNCATED)
+    assert context.count(json.dumps(fitted)) <= 500 + context.count(TRUNCATED) + 1
+
+    # What is left of the prompt is split between the tools still to be called
+    context = ContextBudget(max_tokens=1_000, max_prompt_tokens=800)
+    whole = context.fit({"title": "Long", "text": _words(2_000)}, n_tools_left=1)
+    halved = context.fit({"title": "Long", "text": _words(2_000)}, n_tools_left=2)
+    assert context.count(halved["text"]) < context.count(whole["text"]) < 800
+
+
+def test_fit_keeps_whole_pages_and_passages_in_order():
+    context = ContextBudget(max_tokens=1_000, max_tool_message_tokens=300)
+    pages = {str(page): _words(20, prefix=f"p{page}w") for page in range(1, 21)}
+    fitted = context.fit({"title": "Paper", "text": pages})["text"]
+    assert list(fitted) == list(pages)[: len(fitted)]
+    assert fitted["1"] == pages["1"]
+    assert list(fitted.values())[-1].endswith(TRUNCATED)
+
+    passages = [{"passage": i, "text": _words(20, prefix=f"p{i}w")} for i in range(20)]
+    fitted = context.fit({"title": "Article", "text": passages})["text"]
+    assert [passage["passage"] for passage in fitted] == list(range(len(fitted)))
+    assert fitted[0] == passages[0]
+    assert fitted[-1]["text"].endswith(TRUNCATED)
+
+
+def test_duplicate_payloads_are_found_by_fingerprint():
+    context = ContextBudget(max_tokens=1_000)
+    page = {"title": "Sea level rise", "text": "The sea is rising", "link": "a"}
+    fingerprint = ContextBudget.fingerprint(page)
+    assert context.find_duplicate(fingerprint) is None
+
+    context.remember(fingerprint, ref_index=3)
+    # The same text reached through another link is the same payload
+    assert context.find_duplicate(ContextBudget.fingerprint({**page, "link": "b"})) == 3
+    assert context.find_duplicate(ContextBudget.fingerprint({**page, "text": "Other"})) is None
+
+    image = {"title": "Map", "link": "map.png"}
+    assert ContextBudget.fingerprint(image) == ContextBudget.fingerprint({**image, "title": "x"})
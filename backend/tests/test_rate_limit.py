@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from ada import rate_limit
+from ada.rate_limit import RateLimited, RateLimiter, TokenBucket, parse_retry_after
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=4)
+    assert bucket.wait_time(4) == 0
+
+    bucket.take(4)
+    assert bucket.wait_time(1) == 0.5
+    clock.now += 1
+    assert bucket.wait_time(2) == 0
+    assert bucket.wait_time(3) == 0.5
+
+    clock.now += 100
+    bucket._refill()
+    assert bucket.tokens == 4
+
+
+def test_token_bucket_waits_for_a_full_bucket_at_most(clock):
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.take(5)
+    assert bucket.wait_time(50) == 0.5
+
+    bucket.take(50)
+    assert bucket.tokens == -5
+
+
+def test_backoff_is_exponential_capped_and_honours_retry_after(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: high)
+    limiter = RateLimiter("test", requests_per_second=10, backoff_base=0.5, backoff_max=3)
+
+    assert [limiter._backoff(attempt, retry_after=None) for attempt in range(4)] == [
+        0.5,
+        1,
+        2,
+        3,
+    ]
+    assert limiter._backoff(0, retry_after=7) == 7
+    assert limiter._paused_until == clock.now + 7, "every caller waits out the pause"
+
+
+def test_run_retries_and_slows_down():
+    limiter = RateLimiter("test", requests_per_second=1000, backoff_base=0.001)
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) <= 2:
+            raise RateLimited("test")
+        return "ok"
+
+    assert asyncio.run(limiter.run(request)) == "ok"
+    assert limiter.rate_limited == limiter.retries == 2
+    # Halved twice, then sped back up by one success
+    assert limiter.requests.rate == 1000 / 4 + 1000 * rate_limit.RATE_INCREASE
+
+
+def test_run_gives_up_after_max_retries():
+    limiter = RateLimiter("test", requests_per_second=1000, max_retries=2, backoff_base=0.001)
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        raise RateLimited("test", retry_after=0.001)
+
+    with pytest.raises(RateLimited):
+        asyncio.run(limiter.run(request))
+    assert len(attempts) == 3
+
+
+def test_rate_is_not_lowered_below_its_minimum():
+    limiter = RateLimiter("test", requests_per_second=10)
+    for _ in range(10):
+        limiter._adapt(limiter.requests.rate / 2)
+    assert limiter.requests.rate == 10 * rate_limit.MIN_RATE_FRACTION
+    assert limiter.requests.capacity == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") is None
@@ -0,0 +1,63 @@
+import numpy as np
+
+from ada.retrieval import bm25_scores, chunk_text, retrieve, tokenize
+
+
+def test_bm25_ranks_by_term_frequency_and_rarity():
+    passages = [
+        "the ocean absorbs heat",
+        "the ocean and the ocean currents carry heat",
+        "glaciers melt as the air warms",
+        "the sea level rises",
+    ]
+    scores = bm25_scores(passages, query=tokenize("ocean glaciers"))
+
+    assert list(np.argsort(-scores)) == [2, 1, 0, 3]
+    assert scores[3] == 0
+    # A term every passage has is worth (almost) nothing
+    assert bm25_scores(passages, query=["the"]).max() < scores.max() / 5
+
+
+def test_bm25_favours_shorter_passages_with_the_same_matches():
+    passages = ["carbon cycle", "carbon " + " ".join(f"filler{i}" for i in range(20))]
+    short, long = bm25_scores(passages, query=["carbon"])
+    assert short > long > 0
+
+
+def test_bm25_without_query_terms_or_passages():
+    assert list(bm25_scores(["a b"], query=[])) == [0]
+    assert len(bm25_scores([], query=["a"])) == 0
+
+
+def test_chunk_text_overlaps_and_keeps_pages():
+    words = [f"w{i}" for i in range(25)]
+    passages = chunk_text(" ".join(words), n_words=10, overlap=5)
+    assert [passage["text"].split()[0] for passage in passages] == ["w0", "w5", "w10", "w15"]
+    assert passages[-1]["text"].split()[-1] == "w24"
+
+    pages = chunk_text({1: "a b c", 2: "", 3: "d e"}, n_words=10, overlap=5)
+    assert [(passage["passage"], passage["page"]) for passage in pages] == [(0, 1), (1, 3)]
+
+
+def test_retrieve_keeps_the_best_passages_in_document_order():
+    text = " ".join(["filler text"] * 300 + ["permafrost thaw releases methane"] + ["more"] * 300)
+    content = {"title": "Climate", "text": text}
+    retrieved = retrieve(content, queries=["methane", "permafrost"], top_k=3)
+
+    passages = retrieved["text"]
+    assert 0 < len(passages) <= 3
+    assert all("methane" in passage["text"] for passage in passages)
+    assert [passage["passage"] for passage in passages] == sorted(
+        passage["passage"] for passage in passages
+    )
+
+
+def test_retrieve_falls_back_on_the_start_and_leaves_short_payloads():
+    text = " ".join(f"w{i}" for i in range(2_000))
+    retrieved = retrieve({"text": text}, queries=["unrelated"], top_k=2)
+    assert [passage["passage"] for passage in retrieved["text"]] == [0, 1]
+
+    short = {"text": "a short page"}
+    assert retrieve(short, queries=["page"]) is short
+    image = {"link": "image.png"}
+    assert retrieve(image, queries=["image"]) is image
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from ada.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_task():
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("key", answer) for _ in range(5)))
+        assert len(flight) == 0, "the key is dropped once its task is done"
+        return results
+
+    assert asyncio.run(main()) == ["answer"] * 5
+    assert len(calls) == 1
+
+
+def test_different_keys_and_later_calls_run_again():
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return len(calls)
+
+    async def main():
+        flight = SingleFlight("test")
+        await asyncio.gather(flight.do("a", answer), flight.do("b", answer))
+        return await flight.do("a", answer)
+
+    assert asyncio.run(main()) == 3
+
+
+def test_every_caller_gets_the_exception():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("down")
+
+    async def main():
+        flight = SingleFlight("test")
+        return await asyncio.gather(
+            flight.do("key", fail), flight.do("key", fail), return_exceptions=True
+        )
+
+    first, second = asyncio.run(main())
+    assert isinstance(first, RuntimeError) and first is second
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def answer():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        flight = SingleFlight("test")
+        leaving = asyncio.create_task(flight.do("key", answer))
+        staying = asyncio.create_task(flight.do("key", answer))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        return await staying
+
+    assert asyncio.run(main()) == "answer"
+
+
+def test_work_finishes_when_every_caller_is_cancelled():
+    async def main():
+        done = asyncio.Event()
+
+        async def answer():
+            await asyncio.sleep(0.02)
+            done.set()
+            return "answer"
+
+        flight = SingleFlight("test")
+        caller = asyncio.create_task(flight.do("key", answer))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.wait_for(done.wait(), timeout=1)
+        await asyncio.sleep(0)
+        assert len(flight) == 0
+
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+import json
+
+from ada.streaming import SectionStreamParser, TermStreamParser, format_sse
+
+SECTIONS = [
+    {"header": "Intro {not a brace}", "markdown": 'He said "hi" \\ then }', "references": [1]},
+    {"header": "Nested", "markdown": "x", "image": None, "references": [], "extra": {"a": {}}},
+]
+
+
+def _feed(parser, text: str, chunk_size: int) -> list:
+    found = []
+    for i in range(0, len(text), chunk_size):
+        found.append(parser.feed(text[i : i + chunk_size]))
+    return found
+
+
+def test_sections_are_parsed_whatever_the_chunking():
+    text = json.dumps({"sections": SECTIONS})
+    for chunk_size in (1, 2, 7, len(text)):
+        found = _feed(SectionStreamParser(), text, chunk_size)
+        assert [section for chunk in found for section in chunk] == SECTIONS
+
+
+def test_sections_are_sent_as_soon_as_they_close():
+    first = json.dumps(SECTIONS[0])
+    parser = SectionStreamParser()
+    assert parser.feed('{"sections": [' + first[:-1]) == []
+    assert parser.feed("}") == [SECTIONS[0]]
+    assert parser.feed(", " + json.dumps(SECTIONS[1])) == [SECTIONS[1]]
+    assert parser.feed("]}") == []
+
+
+def test_nothing_before_the_sections_array_counts():
+    parser = SectionStreamParser()
+    assert parser.feed('{"title": {"header": "no"}, ') == []
+    assert parser.feed('"sections" :[{"header": "yes"}]}') == [{"header": "yes"}]
+
+
+def test_terms_are_parsed_as_their_strings_close():
+    parser = TermStreamParser()
+    found = _feed(parser, '{"terms": ["sea level", "ice \\"sheets\\"", "ocean"]}', 4)
+    assert [term for chunk in found for term in chunk] == ["sea level", 'ice "sheets"', "ocean"]
+    assert TermStreamParser().feed('{"other": "x"}') == []
+
+
+def test_format_sse():
+    assert format_sse("section", {"a": 1}) == 'event: section\ndata: {"a": 1}\n\n'
@@ -0,0 +1,78 @@
+import pathlib
+import re
+
+import pytest
+
+from ada.datasources.wiki_parser import parse_wiki_html
+
+FIXTURES_DIR = pathlib.Path(__file__).parent.parent / "benchmarks" / "fixtures"
+
+# The markup the BeautifulSoup parser was written for: h2 headings with a span.mw-headline
+LEGACY_HTML = """<div class="mw-parser-output"><style>.hatnote{}</style>
+<p>Climate is the <b>long-term</b> weather.<sup class="reference"><a>[1]</a></sup> It varies
+by region.<sup class="reference"><a>[12]</a></sup></p>
+<figure><a href="/wiki/File:Map.png"><img src="//upload.example.org/map.png"></a>
+<figcaption>A <i>map</i><style>.caption{}</style></figcaption></figure>
+<table><tr><td><p>In a table</p></td></tr></table>
+<h2><span class="mw-headline" id="History">History</span><span>[edit]</span></h2>
+<p>Old &amp; new.<sup class="reference">[note 3]</sup><sup class="reference">[a]</sup></p>
+<h3><span class="mw-headline">Early</span></h3>
+<p>Ice ages.</p>
+<div><p>Not top level.</p></div>
+<figure><figcaption>No image</figcaption></figure>
+<h2><span class="mw-headline">See also</span></h2>
+</div>"""
+
+
+def _beautifulsoup_parse(html: str):
+    # The parser lxml replaced ('WikiPage' before it), kept to check the output did not change
+    bs4 = pytest.importorskip("bs4")
+    soup = bs4.BeautifulSoup(html, features="html.parser")
+
+    captions = {}
+    for figure in soup.find_all(name="figure"):
+        try:
+            src = figure.find_all(name="a")[0].find_all(name="img")[0].attrs["src"]
+            if src.startswith("//"):
+                src = "https:" + src
+            captions[src] = figure.find_all(name="figcaption")[0].text
+        except IndexError:
+            pass
+
+    sections = {"Summary": []}
+    section = "Summary"
+    for element in list(soup.children)[0].children:
+        if element.name == "h2":
+            section = element.find(name="span").text
+            sections[section] = []
+        elif element.name == "p":
+            citations = []
+            for citation in element.find_all(name="sup", attrs={"class": "reference"}):
+                numbers = re.findall(r"\d+", citation.text)
+                citations.append(int(numbers[0]) if numbers else None)
+            sections[section].append({"text": element.text, "citations": citations})
+    return sections, captions
+
+
+def test_matches_the_beautifulsoup_parser():
+    sections, nested_sections, captions = parse_wiki_html(LEGACY_HTML)
+    expected_sections, expected_captions = _beautifulsoup_parse(LEGACY_HTML)
+
+    assert sections == expected_sections
+    assert captions == expected_captions
+    assert nested_sections == {"History/Early": [{"text": "Ice ages.", "citations": []}]}
+
+
+def test_current_heading_markup():
+    html = (FIXTURES_DIR / "wiki_page.html").read_text()
+    sections, nested_sections, captions = parse_wiki_html(html)
+
+    assert list(sections) == ["Summary"] + [f"Section {i}" for i in range(12)]
+    assert list(nested_sections) == [f"Section {i}/Subsection {i}.3" for i in range(12)]
+    assert all(sections.values())
+    # Paragraphs under a nested heading also belong to its h2 section
+    for path, paragraphs in nested_sections.items():
+        section = sections[path.split("/")[0]]
+        assert paragraphs == section[-len(paragraphs) :]
+    assert len(captions) == 18
+    assert all(src.startswith("https:") for src in captions)